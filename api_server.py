@@ -1,12 +1,30 @@
 from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional, Union
 import os
+import json
+import math
+import asyncio
 import threading
-from src.database_manager import search, delete_item, get_graph_for_entity, get_all_graph_data
-from src.map_manager import create_map, get_all_maps, get_map_data, add_node_to_map, create_edge, delete_map
+from src.database_manager import (
+    search_many, lexical_search, fuse_results, delete_item, get_graph_for_entity, get_all_graph_data, iter_all_graph_data,
+    get_metadata_for_ids, get_collection, QUERY_EMBEDDING_CACHE, METADATA_CACHE
+)
+from src import database_manager, metrics, profiling
+from src.pipeline import warm_up_models, get_model_status
+from src.search_batcher import SearchCoalescer
+from src.config import (
+    SEARCH_WORKERS, SEARCH_BATCH_WINDOW_SECONDS, SEARCH_MAX_BATCH_SIZE, HYBRID_CANDIDATES,
+    GRAPH_PAGE_SIZE, GRAPH_TOP_ENTITIES, WARM_UP_MODELS_ON_STARTUP
+)
+from src.map_manager import (
+    create_map, get_all_maps, map_exists, node_exists, get_map_data, add_node_to_map, create_edge, delete_map,
+    apply_map_batch
+)
 from run_background_monitor import process_file_if_new, main as start_background_monitor, get_active_thread_count
+from src.analysis_cache import get_cache_stats as get_analysis_cache_stats
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -25,6 +43,32 @@ async def _start_background_monitor():
     except Exception as e:
         print(f"Failed to start background monitor: {e}")
 
+# Models and ChromaDB load lazily on first use. Optionally start loading them right away in the
+# background, so the server answers /health and map requests immediately while /ready reports progress.
+@app.on_event("startup")
+async def _start_warm_up():
+    if not WARM_UP_MODELS_ON_STARTUP:
+        return
+
+    def warm_up():
+        get_collection()
+        warm_up_models(background=False)
+
+    threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+# Query encoding and the ChromaDB query run on a bounded thread pool, never on the event loop.
+# Concurrent searches are coalesced into one batched text-encode call.
+SEARCH_COALESCER = SearchCoalescer(
+    search_many,
+    window_seconds=SEARCH_BATCH_WINDOW_SECONDS,
+    max_batch_size=SEARCH_MAX_BATCH_SIZE,
+    max_workers=SEARCH_WORKERS
+)
+
+@app.on_event("shutdown")
+async def _stop_search_workers():
+    SEARCH_COALESCER.shutdown()
+
 # Add CORS middleware to allow frontend connections
 app.add_middleware(
     CORSMiddleware,
@@ -34,6 +78,28 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Per-route request latency for /metrics
+app.add_middleware(metrics.HTTPMetricsMiddleware)
+
+# Profiles the next requests to PROFILING_ENDPOINTS when armed (see /admin/profiling)
+app.add_middleware(profiling.ProfilingMiddleware)
+
+def _cache_request_counts() -> dict:
+    """Hit/miss counters of every cache, read from the caches' own stats when /metrics is scraped."""
+    counts = {}
+    for cache, stats in (
+        ("analysis", get_analysis_cache_stats()),
+        ("query_embeddings", QUERY_EMBEDDING_CACHE.stats()),
+        ("metadata", METADATA_CACHE.stats()),
+    ):
+        counts[(cache, "hit")] = stats["hits"]
+        counts[(cache, "miss")] = stats["misses"]
+    return counts
+
+metrics.CallbackCounter(
+    "context_cache_requests_total", "Cache lookups, by cache and result (hit or miss).", ("cache", "result"), _cache_request_counts
+)
+
 # Pydantic models for request/response bodies
 class IndexFileRequest(BaseModel):
     file_path: str
@@ -50,6 +116,12 @@ class IndexingStatusResponse(BaseModel):
     is_indexing: bool
     active_files: int
 
+class ProfilingRequest(BaseModel):
+    mode: Optional[str] = None               # "cprofile" or "sampling"
+    files: Optional[int] = None              # Profile the next N files (0 stops, -1 profiles all until stopped)
+    requests: Optional[int] = None           # Profile the next N requests to the profiled endpoints
+    threshold_seconds: Optional[float] = None  # Only keep profiles of files/requests at least this slow
+
 class CreateMapRequest(BaseModel):
     name: str
 
@@ -63,6 +135,36 @@ class CreateEdgeRequest(BaseModel):
     target_id: int
     label: str
 
+class BatchNodeAdd(BaseModel):
+    ref: str  # Client-chosen name for the new node; edges in the same batch can use it as an endpoint
+    file_path: str
+    x: int
+    y: int
+
+class BatchNodeMove(BaseModel):
+    node_id: int
+    x: int
+    y: int
+
+class BatchEdgeAdd(BaseModel):
+    source: Union[int, str]  # Existing node id, or the ref of a node added in this batch
+    target: Union[int, str]
+    label: Optional[str] = None
+
+class MapBatchRequest(BaseModel):
+    add_nodes: List[BatchNodeAdd] = []
+    move_nodes: List[BatchNodeMove] = []
+    add_edges: List[BatchEdgeAdd] = []
+    delete_edges: List[int] = []
+    delete_nodes: List[int] = []
+
+class MapBatchResponse(BaseModel):
+    node_ids: Dict[str, int]  # ref -> new node id
+    edge_ids: List[int]       # New edge ids, in request order
+    moved_nodes: int
+    deleted_edges: int
+    deleted_nodes: int
+
 class MapResponse(BaseModel):
     id: int
     name: str
@@ -70,6 +172,9 @@ class MapResponse(BaseModel):
 class GraphResponse(BaseModel):
     nodes: List[dict]
     edges: List[dict]
+    total_pages: Optional[int] = None  # Entity graph: pages tagged with the entity, across all pages of results
+    total_entities: Optional[int] = None  # Full graph: entities included (the top_entities cut-off, ties kept)
+    next_cursor: Optional[str] = None  # Pass back as `cursor` to fetch the next page
 
 def determine_file_type(file_path: str) -> str:
     """Determine the file type based on the file path."""
@@ -101,9 +206,15 @@ def format_search_results(search_results: dict, limit: int) -> List[dict]:
     
     # Get the metadata and distances from the search results
     metadatas = search_results['metadatas'][0]  # First (and only) query
-    distances = search_results['distances'][0]  # First (and only) query
+    if 'distances' in search_results:
+        # Calculate similarity score for cosine distance (1 - distance, since lower distance = higher similarity)
+        # For cosine distance, values range from 0 to 2, where 0 = identical, 2 = opposite
+        similarities = [max(0.0, 1.0 - distance) for distance in search_results['distances'][0]]
+    else:
+        # Lexical and hybrid results already carry a 0-1 relevance score
+        similarities = search_results['scores'][0]
     
-    for i, (metadata, distance) in enumerate(zip(metadatas, distances)):
+    for i, (metadata, similarity) in enumerate(zip(metadatas, similarities)):
         if i >= limit:
             break
             
@@ -112,10 +223,6 @@ def format_search_results(search_results: dict, limit: int) -> List[dict]:
         # The file_path should always point to the original file
         original_file_path = metadata['file_path']
         
-        # Calculate similarity score for cosine distance (1 - distance, since lower distance = higher similarity)
-        # For cosine distance, values range from 0 to 2, where 0 = identical, 2 = opposite
-        similarity = max(0.0, 1.0 - distance)
-        
         # The frontend expects an array for tags. The DB stores it as a comma-separated string.
         # We need to convert it back to a list.
         tags_from_db = metadata.get('tags', '')
@@ -159,22 +266,51 @@ async def health_check():
     """Health check endpoint."""
     return {"status": "healthy", "service": "context-search-api"}
 
+@app.get("/ready")
+async def readiness_check():
+    """
+    Readiness endpoint: 200 once ChromaDB is open and both models are loaded, 503 until then.
+    
+    Reports each model's state (`not_loaded`, `loading`, `ready` or `failed`) and load time.
+    """
+    models = get_model_status()
+    database_ready = database_manager.COLLECTION is not None
+    ready = database_ready and all(status["state"] == "ready" for status in models.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"ready": ready, "database": "ready" if database_ready else "not_loaded", "models": models}
+    )
+
 @app.get("/search")
 async def search_files(
     q: str = Query(..., description="Search query text", min_length=1),
-    limit: int = Query(5, description="Maximum number of results to return", ge=1, le=50)
+    limit: int = Query(5, description="Maximum number of results to return", ge=1, le=50),
+    mode: str = Query("vector", description="'vector', 'lexical' (keyword) or 'hybrid' (both, fused)", pattern="^(vector|lexical|hybrid)$")
 ):
     """
     Search through indexed files using semantic search.
     
     - **q**: The search query text (required)
     - **limit**: Maximum number of results to return (default: 5, max: 50)
+    - **mode**: `vector` (CLIP similarity, default), `lexical` (BM25 keyword search over OCR text and captions)
+      or `hybrid` (both run concurrently, merged with reciprocal rank fusion)
     
     Returns a JSON array of search results with file information and similarity scores.
     """
+    metrics.SEARCHES.labels(mode).inc()
     try:
-        # Call the search function from database_manager
-        search_results = search(query_text=q, n_results=limit)
+        if mode == "vector":
+            # Run the search off the event loop, batched with any concurrent queries
+            search_results = await SEARCH_COALESCER.search(q, limit)
+        elif mode == "lexical":
+            search_results = await asyncio.to_thread(lexical_search, q, limit)
+        else:
+            candidates = max(limit, HYBRID_CANDIDATES)
+            vector_results, lexical_results = await asyncio.gather(
+                SEARCH_COALESCER.search(q, candidates),
+                asyncio.to_thread(lexical_search, q, candidates)
+            )
+            search_results = fuse_results([vector_results, lexical_results], limit)
         
         # Format the results according to the API specification
         formatted_results = format_search_results(search_results, limit)
@@ -201,6 +337,60 @@ async def get_indexing_status():
         # This might happen if the thread-local storage isn't initialized yet
         return IndexingStatusResponse(is_indexing=False, active_files=0)
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Pipeline, database and HTTP metrics in the Prometheus text format, for scraping.
+    
+    Includes per-stage timing histograms (decode, ocr, ner, clip_image, clip_text, db_write, ...),
+    file/page/byte/error counters, cache hit and miss counts, and per-route request latency.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/status/cache")
+async def get_cache_status():
+    """
+    Reports hit/miss counters and sizes for the caches:
+    - **analysis**: content-hash cache that lets identical files skip OCR, NER and embedding
+    - **query_embeddings**: LRU cache of text query encodings used by search and entity graphs
+    - **metadata**: LRU cache of ChromaDB metadata used to enrich map nodes
+    """
+    try:
+        return {
+            "analysis": get_analysis_cache_stats(),
+            "query_embeddings": QUERY_EMBEDDING_CACHE.stats(),
+            "metadata": METADATA_CACHE.stats()
+        }
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to read cache stats: {str(e)}"
+        )
+
+@app.get("/admin/profiling")
+async def get_profiling_status():
+    """Reports the profiling settings, how many files and requests are left to profile, and the latest dumps."""
+    return profiling.status()
+
+@app.post("/admin/profiling")
+async def configure_profiling(request: ProfilingRequest):
+    """
+    Profiles the next ingested files and/or API requests, writing .pstats and .collapsed dumps to PROFILING_DIR.
+    
+    - **mode**: "cprofile" (deterministic) or "sampling"
+    - **files** / **requests**: how many to profile; 0 stops, -1 profiles everything until stopped
+    - **threshold_seconds**: only keep profiles of files or requests that took at least this long
+    
+    Fields that are left out keep their current value. Returns the new status.
+    """
+    try:
+        return profiling.configure(
+            mode=request.mode, files=request.files, requests=request.requests,
+            threshold_seconds=request.threshold_seconds
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @app.post("/index-file", response_model=StatusResponse)
 async def index_file(request: IndexFileRequest):
     """
@@ -278,23 +468,34 @@ async def delete_indexed_file(request: DeleteFileRequest):
 # --- Graph and Map Management Endpoints ---
 
 @app.get("/graph/entity", response_model=GraphResponse)
-async def get_entity_graph(name: str = Query(..., description="Entity name to generate graph for")):
+async def get_entity_graph(
+    name: str = Query(..., description="Entity name to generate graph for"),
+    limit: int = Query(25, description="Maximum number of files to return", ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page")
+):
     """
     Retrieves all files and entities connected to a specific tag (AI-Generated Graph).
     
     - **name**: The entity/tag name to generate a graph for (e.g., "Samsung", "Q3 2025")
+    - **limit**: Maximum number of files per page (default: 25)
+    - **cursor**: Continue after the previous page (its `next_cursor`)
     
     Returns a graph structure with nodes and edges showing relationships.
     """
     try:
-        graph_data = get_graph_for_entity(name)
+        graph_data = get_graph_for_entity(name, limit=limit, cursor=cursor)
         # Add a null position to nodes from AI-generated graphs for frontend consistency.
         # The frontend will be responsible for auto-layout.
         for node in graph_data.get("nodes", []):
             if "position" not in node:
                 node["position"] = None
 
-        return GraphResponse(nodes=graph_data.get("nodes", []), edges=graph_data.get("edges", []))
+        return GraphResponse(
+            nodes=graph_data.get("nodes", []),
+            edges=graph_data.get("edges", []),
+            total_pages=graph_data.get("total_pages"),
+            next_cursor=graph_data.get("next_cursor")
+        )
         
     except Exception as e:
         raise HTTPException(
@@ -302,22 +503,50 @@ async def get_entity_graph(name: str = Query(..., description="Entity name to ge
             detail=f"Failed to generate graph for entity '{name}': {str(e)}"
         )
 
+def _graph_ndjson_lines(page_size: int, top_entities: int):
+    """Streams the whole graph as NDJSON: one {"node": ...} or {"edge": ...} object per line."""
+    for page in iter_all_graph_data(page_size=page_size, top_entities=top_entities):
+        for node in page.get("nodes", []):
+            node.setdefault("position", None)
+            yield json.dumps({"node": node}) + "\n"
+        for edge in page.get("edges", []):
+            yield json.dumps({"edge": edge}) + "\n"
+
 @app.get("/graph/all", response_model=GraphResponse)
-async def get_all_graph():
+async def get_all_graph(
+    limit: int = Query(GRAPH_PAGE_SIZE, description="Maximum number of files per page", ge=1, le=5000),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    top_entities: int = Query(GRAPH_TOP_ENTITIES, description="Only include the entities tagged on the most files", ge=1, le=10000),
+    format: str = Query("json", description="'json' for one page, 'ndjson' to stream the whole graph", pattern="^(json|ndjson)$")
+):
     """
     Retrieves all entities and their relationships (Complete Graph).
     
-    Returns a graph structure with all nodes and edges showing relationships between entities and files.
+    - **limit**: Maximum number of files per page (default: 500)
+    - **cursor**: Continue after the previous page (its `next_cursor`)
+    - **top_entities**: Keep only the K highest-degree entities (default: 200)
+    - **format**: `json` returns one page; `ndjson` streams every page, one node or edge per line
+    
+    Returns a graph structure with nodes and edges showing relationships between entities and files.
+    Entity nodes are sent with the first page only.
     """
+    if format == "ndjson":
+        return StreamingResponse(_graph_ndjson_lines(limit, top_entities), media_type="application/x-ndjson")
+
     try:
-        graph_data = get_all_graph_data()
+        graph_data = get_all_graph_data(limit=limit, cursor=cursor, top_entities=top_entities)
         # Add a null position to nodes for frontend consistency.
         # The frontend will be responsible for auto-layout.
         for node in graph_data.get("nodes", []):
             if "position" not in node:
                 node["position"] = None
 
-        return GraphResponse(nodes=graph_data.get("nodes", []), edges=graph_data.get("edges", []))
+        return GraphResponse(
+            nodes=graph_data.get("nodes", []),
+            edges=graph_data.get("edges", []),
+            total_entities=graph_data.get("total_entities"),
+            next_cursor=graph_data.get("next_cursor")
+        )
         
     except Exception as e:
         raise HTTPException(
@@ -393,40 +622,48 @@ async def delete_user_map(map_id: int):
             detail=f"Failed to delete map: {str(e)}"
         )
 @app.get("/maps/{map_id}", response_model=GraphResponse)
-async def get_map_details(map_id: int):
+async def get_map_details(
+    map_id: int,
+    bbox: Optional[str] = Query(None, description="Viewport as 'min_x,min_y,max_x,max_y'; omit for the whole map")
+):
     """
     Gets all nodes and edges for a specific user-curated map.
     
     - **map_id**: The ID of the map to retrieve
+    - **bbox**: Optional viewport `min_x,min_y,max_x,max_y`. Only nodes inside it are returned,
+      with every edge touching one of them.
     
     Returns the map data with nodes and edges.
     """
+    viewport = None
+    if bbox is not None:
+        try:
+            viewport = tuple(float(value) for value in bbox.split(","))
+        except ValueError:
+            viewport = ()
+        if (len(viewport) != 4 or not all(math.isfinite(value) for value in viewport)
+                or viewport[0] > viewport[2] or viewport[1] > viewport[3]):
+            raise HTTPException(
+                status_code=400,
+                detail="bbox must be 'min_x,min_y,max_x,max_y' (finite numbers) with min <= max"
+            )
+
     try:
-        map_data = get_map_data(map_id)
-        if not map_data["nodes"] and not map_data["edges"]:
-            # Check if map exists by trying to get all maps
-            all_maps = get_all_maps()
-            if not any(map["id"] == map_id for map in all_maps):
-                raise HTTPException(
-                    status_code=404,
-                    detail=f"Map with ID {map_id} not found"
-                )
+        map_data = get_map_data(map_id, bbox=viewport)
+        if not map_data["nodes"] and not map_data["edges"] and not map_exists(map_id):
+            raise HTTPException(
+                status_code=404,
+                detail=f"Map with ID {map_id} not found"
+            )
         
+        # Enrich every node with its ChromaDB metadata in one batched lookup.
+        # We assume the node's file_path is a unique ID in Chroma; unknown IDs get empty metadata.
+        metadata_by_id = get_metadata_for_ids([node["file_path"] for node in map_data.get("nodes", [])])
+
         # The frontend expects a nested `position` object. Transform the data.
         formatted_nodes = []
-        from src.database_manager import COLLECTION
         for node in map_data.get("nodes", []):
-            # Enrich the node with metadata from ChromaDB
-            metadata = {}
-            if COLLECTION:
-                # Fetch metadata for the file path. We assume the node's file_path is a unique ID in Chroma.
-                # We need to handle both direct file paths and page-specific paths.
-                db_entry = COLLECTION.get(ids=[node["file_path"]], limit=1)
-                if db_entry and db_entry['metadatas']:
-                    metadata = db_entry['metadatas'][0]
-                else:
-                    # If the ID is not in ChromaDB, metadata will be empty
-                    metadata = {}
+            metadata = dict(metadata_by_id[node["file_path"]])  # A file can appear on a map more than once
             
             # Ensure tags are always a list, even if metadata is missing.
             tags_str = metadata.get('tags', '')
@@ -465,8 +702,7 @@ async def add_node_to_user_map(map_id: int, request: AddNodeRequest):
     """
     try:
         # Validate that the map exists
-        all_maps = get_all_maps()
-        if not any(map["id"] == map_id for map in all_maps):
+        if not map_exists(map_id):
             raise HTTPException(
                 status_code=404,
                 detail=f"Map with ID {map_id} not found"
@@ -510,24 +746,20 @@ async def create_edge_in_user_map(map_id: int, request: CreateEdgeRequest):
     """
     try:
         # Validate that the map exists
-        all_maps = get_all_maps()
-        if not any(map["id"] == map_id for map in all_maps):
+        if not map_exists(map_id):
             raise HTTPException(
                 status_code=404,
                 detail=f"Map with ID {map_id} not found"
             )
         
         # Validate that both nodes exist in this map
-        map_data = get_map_data(map_id)
-        node_ids = [node["id"] for node in map_data["nodes"]]
-        
-        if request.source_id not in node_ids:
+        if not node_exists(map_id, request.source_id):
             raise HTTPException(
                 status_code=404,
                 detail=f"Source node {request.source_id} not found in map {map_id}"
             )
         
-        if request.target_id not in node_ids:
+        if not node_exists(map_id, request.target_id):
             raise HTTPException(
                 status_code=404,
                 detail=f"Target node {request.target_id} not found in map {map_id}"
@@ -548,6 +780,54 @@ async def create_edge_in_user_map(map_id: int, request: CreateEdgeRequest):
             detail=f"Failed to create edge: {str(e)}"
         )
 
+@app.post("/maps/{map_id}/batch", response_model=MapBatchResponse)
+async def apply_user_map_batch(map_id: int, request: MapBatchRequest):
+    """
+    Applies many edits to a user-curated map in one transaction, e.g. every node moved by a group drag.
+    
+    - **add_nodes**: New nodes, each with a `ref` that edges in this batch can use
+    - **move_nodes**: New positions for existing nodes
+    - **add_edges**: New edges; `source`/`target` are node ids or refs from `add_nodes`
+    - **delete_edges** / **delete_nodes**: IDs to remove (deleting a node also removes its edges)
+    
+    Edits are applied in the order above. Either all of them succeed or none do.
+    Returns the IDs of the new nodes (by ref) and edges.
+    """
+    try:
+        if not map_exists(map_id):
+            raise HTTPException(
+                status_code=404,
+                detail=f"Map with ID {map_id} not found"
+            )
+        
+        # Same rule as single node adds: concept labels are allowed, real paths must exist
+        for node in request.add_nodes:
+            if not node.file_path.startswith("concept_") and not os.path.exists(node.file_path):
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"File not found: {node.file_path}"
+                )
+        
+        result = apply_map_batch(
+            map_id,
+            add_nodes=[node.model_dump() for node in request.add_nodes],
+            move_nodes=[move.model_dump() for move in request.move_nodes],
+            add_edges=[edge.model_dump() for edge in request.add_edges],
+            delete_edges=request.delete_edges,
+            delete_nodes=request.delete_nodes
+        )
+        return MapBatchResponse(**result)
+        
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to apply map edits: {str(e)}"
+        )
+
 # Update node position
 class UpdateNodeRequest(BaseModel):
     x: int
@@ -0,0 +1,12 @@
+"""
+Puts the project root on sys.path, so the benchmark scripts (run as `python benchmarks/<script>.py`)
+can import src and run_background_monitor. Import it before any project module.
+"""
+
+import os
+import sys
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+if PROJECT_ROOT not in sys.path:
+    sys.path.insert(0, PROJECT_ROOT)
@@ -0,0 +1,82 @@
+"""
+Synthetic corpus for the benchmarks: screenshot-like images with rendered text (in memory or as PNGs), and
+multi-page PDFs built with fitz. Everything is generated from a seed, so two runs with the same arguments
+produce identical files.
+"""
+
+import os
+import random
+
+import fitz
+from PIL import Image, ImageDraw, ImageFont
+
+WORDS = (
+    "invoice Samsung quarterly revenue report meeting notes Berlin London project context deadline budget "
+    "error code customer order shipment analysis summary total amount due Acme Globex Maria Schmidt Toronto"
+).split()
+
+
+def random_lines(rng: random.Random, min_lines: int, max_lines: int) -> list[str]:
+    lines = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 10))) for _ in range(rng.randint(min_lines, max_lines))]
+    lines.append(f"Reference INV-{rng.randint(10000, 99999)}")
+    return lines
+
+
+def random_text(rng: random.Random, min_lines: int = 2, max_lines: int = 8) -> str:
+    """OCR-like text: a few short lines of random words and an identifier."""
+    return "\n".join(random_lines(rng, min_lines, max_lines))
+
+
+def render_screenshot(rng: random.Random, lines: list[str], size: tuple[int, int] = None, background=None,
+                      boxes: bool = True) -> Image.Image:
+    """
+    Draws `lines` of text onto an image of `size` (by default just tall enough for the text), over a random light
+    background (or `background`) with a few colored boxes unless `boxes` is False.
+    """
+    size = size or (800, 60 + 34 * len(lines))
+    image = Image.new("RGB", size, background or tuple(rng.randint(200, 255) for _ in range(3)))
+    draw = ImageDraw.Draw(image)
+    if boxes:
+        for _ in range(rng.randint(1, 4)):
+            x, y = rng.randint(0, size[0] - 200), rng.randint(0, size[1] - 150)
+            draw.rectangle((x, y, x + rng.randint(60, 200), y + rng.randint(40, 150)), fill=tuple(rng.randint(0, 255) for _ in range(3)))
+    font = ImageFont.load_default(size=22)
+    for line_num, line in enumerate(lines):
+        draw.text((30, 30 + 34 * line_num), line, fill="black", font=font)
+    return image
+
+
+def text_images(count: int, seed: int = 0, min_lines: int = 4, max_lines: int = 14, **render_options):
+    """Yields `count` (image, text) pairs: random_lines rendered with render_screenshot(**render_options)."""
+    rng = random.Random(seed)
+    for _ in range(count):
+        lines = random_lines(rng, min_lines, max_lines)
+        yield render_screenshot(rng, lines, **render_options), "\n".join(lines)
+
+
+def generate_images(directory: str, count: int, seed: int = 0, size: tuple[int, int] = (1280, 800)) -> list[str]:
+    """Writes `count` PNG screenshots of rendered text into `directory`. Returns their paths."""
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i, (image, _) in enumerate(text_images(count, seed, size=size)):
+        path = os.path.join(directory, f"screenshot_{i:05d}.png")
+        image.save(path)
+        paths.append(path)
+    return paths
+
+
+def generate_pdfs(directory: str, count: int, pages: int, seed: int = 0) -> list[str]:
+    """Writes `count` PDFs of `pages` text pages each into `directory`. Returns their paths."""
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for i in range(count):
+        doc = fitz.open()
+        for _ in range(pages):
+            page = doc.new_page()
+            page.insert_text((72, 72), "\n".join(random_lines(rng, 20, 40)), fontsize=10)
+        path = os.path.join(directory, f"document_{i:05d}.pdf")
+        doc.save(path)
+        doc.close()
+        paths.append(path)
+    return paths
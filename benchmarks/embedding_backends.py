@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Benchmark and parity check for the CLIP embedding backends in src/pipeline.py.
+Encodes synthetic screenshot-like images and OCR-like texts with the fp32 sentence-transformers model and
+the int8 ONNX Runtime model, reports images/sec and texts/sec for each, and the cosine similarity between
+the two backends' vectors (image, text, and the fused vector that is actually stored).
+Exits non-zero if any cosine falls below --min-cosine.
+
+Usage: python benchmarks/embedding_backends.py --images 64 --threads 1
+       python benchmarks/embedding_backends.py --export   # re-export the ONNX models first
+"""
+
+import argparse
+import sys
+import time
+
+import numpy as np
+
+import bootstrap  # Puts the project root on sys.path; must come before the project imports
+
+from corpus import text_images
+
+from src import pipeline
+
+
+def benchmark_backend(backend, images: list, texts: list[str]) -> tuple[dict, np.ndarray, np.ndarray]:
+    backend.encode_images(images[:2])  # Warm-up (first-call allocations, kernel selection)
+    backend.encode_texts(texts[:2])
+
+    start = time.perf_counter()
+    image_vectors = backend.encode_images(images)
+    image_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    text_vectors = backend.encode_texts(texts)
+    text_seconds = time.perf_counter() - start
+
+    result = {
+        "backend": backend.name,
+        "images_per_sec": round(len(images) / image_seconds, 2),
+        "texts_per_sec": round(len(texts) / text_seconds, 2),
+    }
+    return result, image_vectors, text_vectors
+
+
+def row_cosines(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return np.sum(a * b, axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the fp32 PyTorch and int8 ONNX CLIP embedding backends.")
+    parser.add_argument("--images", type=int, default=64, help="Number of synthetic images (and texts) to encode")
+    parser.add_argument("--threads", type=int, default=None, help="CPU threads for both backends (default: all cores)")
+    parser.add_argument("--min-cosine", type=float, default=0.99, help="Lowest acceptable fp32/int8 cosine similarity")
+    parser.add_argument("--export", action="store_true", help="Re-export and quantize the ONNX models before benchmarking")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    import torch
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+        pipeline.ONNX_NUM_THREADS = args.threads
+    if args.export:
+        pipeline.export_onnx_clip()
+
+    images, texts = map(list, zip(*text_images(args.images, args.seed, min_lines=2, max_lines=6, size=(800, 600))))
+    print(f"Encoding {len(images)} images and texts with {args.threads or 'all'} thread(s).")
+
+    fp32_result, fp32_images, fp32_texts = benchmark_backend(pipeline.SentenceTransformerEmbedding(), images, texts)
+    int8_result, int8_images, int8_texts = benchmark_backend(pipeline.OnnxClipEmbedding(), images, texts)
+    print(fp32_result)
+    print(int8_result)
+    print(f"Speedup: {int8_result['images_per_sec'] / fp32_result['images_per_sec']:.2f}x images, "
+          f"{int8_result['texts_per_sec'] / fp32_result['texts_per_sec']:.2f}x texts")
+
+    cosines = {
+        "image": row_cosines(fp32_images, int8_images),
+        "text": row_cosines(fp32_texts, int8_texts),
+        "fused": row_cosines(pipeline.fuse_embeddings(fp32_images, fp32_texts), pipeline.fuse_embeddings(int8_images, int8_texts)),
+    }
+    failed = False
+    for kind, values in cosines.items():
+        print({"vectors": kind, "min_cosine": round(float(values.min()), 4), "mean_cosine": round(float(values.mean()), 4)})
+        failed = failed or values.min() < args.min_cosine
+
+    if failed:
+        print(f"FAIL: some int8 vectors are below cosine {args.min_cosine} of the fp32 ones.")
+        sys.exit(1)
+    print(f"OK: every int8 vector is within cosine {args.min_cosine} of fp32.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+"""
+Shared plumbing for the ingest and search benchmarks: throwaway databases, per-stage timers,
+latency percentiles, memory high-water marks and the JSON report.
+"""
+
+import json
+import os
+import platform
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from functools import wraps
+
+import numpy as np
+
+try:
+    import resource  # Not available on Windows
+except ImportError:
+    resource = None
+
+PROJECT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def use_temp_databases(directory: str):
+    """Points ChromaDB and the SQLite databases at `directory`, so a run never touches the real index."""
+    from src import analysis_cache, database_manager, file_manifest, index_store, map_manager
+    from src.sqlite_pool import migrate
+
+    os.makedirs(directory, exist_ok=True)
+    database_manager.DB_PATH = os.path.join(directory, "chroma_db")
+    database_manager.CLIENT = database_manager.COLLECTION = None
+    index_store.DB_PATH = os.path.join(directory, index_store.DB_FILE)
+    index_store.init_db()
+    analysis_cache.DB_PATH = os.path.join(directory, analysis_cache.DB_FILE)
+    analysis_cache.init_db()
+    file_manifest.DB_PATH = os.path.join(directory, file_manifest.DB_FILE)
+    file_manifest.init_db()
+    map_manager.DB_PATH = os.path.join(directory, map_manager.DB_FILE)
+    map_manager.init_db()
+    migrate(map_manager.DB_PATH, map_manager.MIGRATIONS)
+
+
+class StageTimer:
+    """Accumulates wall time and call counts per stage by wrapping module-level functions."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.seconds = {}
+        self.calls = {}
+
+    def reset(self):
+        with self._lock:
+            self.seconds.clear()
+            self.calls.clear()
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+            self.calls[stage] = self.calls.get(stage, 0) + 1
+
+    def wrap(self, owner, attribute: str, stage: str = None):
+        """Replaces `owner.attribute` (a function on a module or class) with a timed version."""
+        function = getattr(owner, attribute)
+        stage = stage or attribute
+
+        @wraps(function)
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(stage, time.perf_counter() - started)
+
+        setattr(owner, attribute, timed)
+
+    def report(self) -> dict:
+        return {
+            stage: {"seconds": round(seconds, 4), "calls": self.calls[stage]}
+            for stage, seconds in sorted(self.seconds.items(), key=lambda item: item[1], reverse=True)
+        }
+
+
+def latency_summary(seconds: list[float]) -> dict:
+    """p50/p95/p99/mean/max of a list of durations, in milliseconds."""
+    if not seconds:
+        return {}
+    ms = np.array(seconds) * 1000
+    return {
+        "count": len(ms),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+        "mean_ms": round(float(ms.mean()), 3),
+        "max_ms": round(float(ms.max()), 3),
+    }
+
+
+def start_memory_tracking(trace_python_allocations: bool):
+    if trace_python_allocations:
+        tracemalloc.start()
+
+
+def memory_high_water() -> dict:
+    """Peak resident set size of this process so far and, if tracemalloc is running, the Python heap peak."""
+    memory = {}
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        memory["peak_rss_mb"] = round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)  # bytes on macOS, KB on Linux
+    if tracemalloc.is_tracing():
+        memory["python_heap_peak_mb"] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 1)
+    return memory
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def write_report(benchmark: str, arguments: dict, results: dict, output: str = None):
+    """Prints the JSON report (and writes it to `output` if given), tagged with the commit and platform."""
+    report = {
+        "benchmark": benchmark,
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "platform": {"python": platform.python_version(), "system": platform.platform(), "cpus": os.cpu_count()},
+        "arguments": arguments,
+        **results,
+    }
+    text = json.dumps(report, indent=2)
+    print(text)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
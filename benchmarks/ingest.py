@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Ingest benchmark: indexes a synthetic corpus (screenshots with rendered text, multi-page PDFs) through
+run_background_monitor.process_file against throwaway databases, and reports files/sec, per-stage time
+and memory high-water marks as JSON.
+
+The models are replaced by the deterministic stubs in benchmarks/stubs.py unless --real-models is given,
+so the run is offline and repeatable. It makes three passes: "cold" indexes every file, "unchanged"
+processes the same files again (content-hash and PDF-fingerprint checks only), and "restart" reconciles
+the corpus with the file manifest as the monitor does on startup (stat calls only when nothing changed).
+
+Stage times are cumulative per wrapped function and can nest: pdf_extract includes the NER of its pages.
+
+Usage: python benchmarks/ingest.py --images 200 --pdfs 20 --pages 10 --stub-ocr --output ingest.json
+"""
+
+import argparse
+import contextlib
+import logging
+import os
+import tempfile
+import time
+
+import bootstrap  # Puts the project root on sys.path; must come before the project imports
+
+from corpus import generate_images, generate_pdfs
+from harness import StageTimer, use_temp_databases, start_memory_tracking, memory_high_water, write_report
+from stubs import install_stubs
+
+from src import analysis_cache, database_manager, pipeline
+import run_background_monitor
+
+
+def instrument(timer: StageTimer):
+    timer.wrap(analysis_cache, "file_content_hash", "hash")
+    timer.wrap(run_background_monitor, "plan_pdf_reindex", "pdf_reindex_plan")
+    timer.wrap(pipeline, "load_image", "decode")
+    timer.wrap(pipeline.OCR_BACKENDS[pipeline.OCR_BACKEND], "image_to_string", "ocr")
+    timer.wrap(pipeline, "extract_pdf_text", "pdf_extract")
+    timer.wrap(pipeline, "extract_tags_batch", "ner")
+    timer.wrap(pipeline, "embed_batch", "embed")
+    timer.wrap(run_background_monitor, "add_items", "db_write")
+    timer.wrap(run_background_monitor, "_store_analysis", "analysis_cache_store")
+
+
+def run_pass(file_paths: list[str], timer: StageTimer, verbose: bool) -> dict:
+    timer.reset()
+    items_before = database_manager.get_collection().count()
+
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+    started = time.perf_counter()
+    with output:
+        for file_path in file_paths:
+            run_background_monitor.process_file(file_path)
+    seconds = time.perf_counter() - started
+
+    items_added = database_manager.get_collection().count() - items_before
+    return {
+        "files": len(file_paths),
+        "seconds": round(seconds, 3),
+        "files_per_sec": round(len(file_paths) / seconds, 2),
+        "items_added": items_added,
+        "items_per_sec": round(items_added / seconds, 2),
+        "stages": timer.report(),
+        "memory": memory_high_water(),
+    }
+
+
+def run_restart_pass(corpus_dir: str, file_count: int, timer: StageTimer) -> dict:
+    """Forgets the in-memory processed set, as a restart does, and times reconcile_manifest over the corpus."""
+    timer.reset()
+    run_background_monitor.PROCESSED_FILES.clear()
+
+    started = time.perf_counter()
+    run_background_monitor.reconcile_manifest([corpus_dir])
+    seconds = time.perf_counter() - started
+
+    return {
+        "files": file_count,
+        "seconds": round(seconds, 3),
+        "files_per_sec": round(file_count / seconds, 2),
+        "known_without_processing": len(run_background_monitor.PROCESSED_FILES),
+        "queued": len(run_background_monitor.QUEUED_FILES),
+        "stages": timer.report(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark process_file over a synthetic corpus.")
+    parser.add_argument("--images", type=int, default=100, help="Number of synthetic screenshots")
+    parser.add_argument("--pdfs", type=int, default=10, help="Number of synthetic PDFs")
+    parser.add_argument("--pages", type=int, default=10, help="Pages per PDF")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--real-models", action="store_true", help="Use the configured CLIP and spaCy models instead of the stubs")
+    parser.add_argument("--stub-ocr", action="store_true", help="Replace tesseract with a stub too (for machines without it)")
+    parser.add_argument("--tracemalloc", action="store_true", help="Also track the Python heap peak (slows the run down)")
+    parser.add_argument("--workdir", help="Directory for the corpus and databases (default: a temporary directory)")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    parser.add_argument("--verbose", action="store_true", help="Keep the pipeline's own output")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    install_stubs(models=not args.real_models, ocr=args.stub_ocr)
+
+    with tempfile.TemporaryDirectory(prefix="context-bench-") as tmp_dir:
+        workdir = args.workdir or tmp_dir
+        use_temp_databases(os.path.join(workdir, "db"))
+
+        started = time.perf_counter()
+        corpus_dir = os.path.join(workdir, "corpus")
+        file_paths = generate_images(corpus_dir, args.images, args.seed)
+        file_paths += generate_pdfs(corpus_dir, args.pdfs, args.pages, args.seed)
+        corpus_seconds = time.perf_counter() - started
+
+        if args.real_models:
+            pipeline.warm_up_models(background=False)  # Model loading is not part of the measurement
+        timer = StageTimer()
+        instrument(timer)
+        start_memory_tracking(args.tracemalloc)
+
+        results = {
+            "corpus": {"files": len(file_paths), "generated_in_seconds": round(corpus_seconds, 3)},
+            "passes": {
+                "cold": run_pass(file_paths, timer, args.verbose),
+                "unchanged": run_pass(file_paths, timer, args.verbose),
+                "restart": run_restart_pass(corpus_dir, len(file_paths), timer),
+            },
+        }
+        database_manager.CLIENT = database_manager.COLLECTION = None
+
+    write_report("ingest", vars(args), results, args.output)
+    os._exit(0)  # Skip interpreter teardown of ChromaDB's background threads
+
+
+if __name__ == "__main__":
+    main()
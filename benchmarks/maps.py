@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Map benchmark and consistency check: builds a synthetic map in throwaway databases (fully migrated, so with the
+R*Tree node index and its triggers where SQLite has the module), then times apply_map_batch for node adds, moves
+and deletes, and viewport (bbox) reads of get_map_data. Reports JSON.
+Exits non-zero if a batch reports a different number of moved or deleted rows than it was asked to change.
+
+Usage: python benchmarks/maps.py --nodes 5000 --moves 500 --deletes 100 --viewports 200 --output maps.json
+"""
+
+import argparse
+import random
+import sys
+import tempfile
+import time
+
+import bootstrap  # Puts the project root on sys.path; must come before the project imports
+
+from harness import latency_summary, use_temp_databases, write_report
+
+from src import map_manager
+
+
+def timed(function, *args, **kwargs) -> tuple:
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, round(time.perf_counter() - started, 4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark and check map batch edits and viewport queries.")
+    parser.add_argument("--nodes", type=int, default=2000)
+    parser.add_argument("--moves", type=int, default=200, help="Nodes moved in one batch")
+    parser.add_argument("--deletes", type=int, default=50, help="Edges, then nodes, deleted in one batch")
+    parser.add_argument("--viewports", type=int, default=100, help="Viewport queries to time")
+    parser.add_argument("--extent", type=int, default=10000, help="Nodes are placed in an extent x extent square")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory(prefix="context-bench-") as tmp_dir:
+        use_temp_databases(tmp_dir)
+        map_id = map_manager.create_map("benchmark")
+
+        add_nodes = [{"ref": f"n{i}", "file_path": f"/corpus/file_{i:05d}.png",
+                      "x": rng.randint(0, args.extent), "y": rng.randint(0, args.extent)} for i in range(args.nodes)]
+        add_edges = [{"source": f"n{i}", "target": f"n{i + 1}", "label": None} for i in range(args.nodes - 1)]
+        added, add_seconds = timed(map_manager.apply_map_batch, map_id, add_nodes=add_nodes, add_edges=add_edges)
+        node_ids = list(added["node_ids"].values())
+
+        moves = [{"node_id": node_id, "x": rng.randint(0, args.extent), "y": rng.randint(0, args.extent)}
+                 for node_id in rng.sample(node_ids, args.moves)]
+        moved, move_seconds = timed(map_manager.apply_map_batch, map_id, move_nodes=moves)
+
+        # Edges to delete are picked away from the nodes being deleted, which take their own edges with them
+        deleted_node_ids = rng.sample(node_ids, args.deletes)
+        doomed = set(deleted_node_ids)
+        kept_edge_ids = [edge_id for edge_id, edge in zip(added["edge_ids"], add_edges)
+                         if added["node_ids"][edge["source"]] not in doomed and added["node_ids"][edge["target"]] not in doomed]
+        deleted_edge_ids = rng.sample(kept_edge_ids, min(args.deletes, len(kept_edge_ids)))
+        deleted, delete_seconds = timed(map_manager.apply_map_batch, map_id,
+                                        delete_edges=deleted_edge_ids, delete_nodes=deleted_node_ids)
+
+        viewport_seconds = []
+        for _ in range(args.viewports):
+            x, y = rng.randint(0, args.extent), rng.randint(0, args.extent)
+            started = time.perf_counter()
+            map_manager.get_map_data(map_id, bbox=(x, y, x + args.extent // 10, y + args.extent // 10))
+            viewport_seconds.append(time.perf_counter() - started)
+
+        checks = {
+            "moved_nodes": {"expected": len(moves), "reported": moved["moved_nodes"]},
+            "deleted_edges": {"expected": len(deleted_edge_ids), "reported": deleted["deleted_edges"]},
+            "deleted_nodes": {"expected": len(deleted_node_ids), "reported": deleted["deleted_nodes"]},
+        }
+        remaining = map_manager.get_map_data(map_id)
+        checks["remaining_nodes"] = {"expected": args.nodes - len(deleted_node_ids), "reported": len(remaining["nodes"])}
+        spatial_index = "rtree" if map_manager._has_rtree() else "btree"
+
+    results = {
+        "spatial_index": spatial_index,
+        "batches": {
+            "add_seconds": add_seconds,
+            "move_seconds": move_seconds,
+            "delete_seconds": delete_seconds,
+        },
+        "viewport": latency_summary(viewport_seconds),
+        "checks": checks,
+    }
+    write_report("maps", vars(args), results, args.output)
+
+    mismatches = [name for name, check in checks.items() if check["expected"] != check["reported"]]
+    if mismatches:
+        print(f"Batch counts differ from the request: {', '.join(mismatches)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
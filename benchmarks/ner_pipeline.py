@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Benchmark and parity check for the NER stage in src/pipeline.py.
+Tags a corpus of OCR-like texts with the full en_core_web_sm pipeline, one text per call (the old
+behaviour), and with the trimmed, batched extract_tags_batch, then compares speed and output.
+Exits non-zero if any text gets different tags.
+
+Usage: python benchmarks/ner_pipeline.py --texts 500
+       python benchmarks/ner_pipeline.py --text-dir path/to/txt/files
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+import bootstrap  # Puts the project root on sys.path; must come before the project imports
+
+import spacy
+
+from src import pipeline
+from src.config import NER_EXCLUDED_COMPONENTS, NER_BATCH_SIZE, NER_N_PROCESS
+
+SENTENCES = [
+    "Samsung reported quarterly revenue of $54 billion on October 31, 2025.",
+    "Meeting notes from the Berlin office, attended by Maria Schmidt and John Carter.",
+    "Invoice #48213 issued by Acme Corporation to Globex Ltd for consulting services.",
+    "The project deadline moved to March 3rd after the review in London.",
+    "Order shipped via FedEx from Seattle, Washington to Toronto, Canada.",
+    "Q3 2025 budget summary prepared by the finance team at Microsoft.",
+    "Error code 0x80070005 reported by customer Jane Doe on Windows 11.",
+]
+
+
+def generate_texts(count: int, seed: int = 0) -> list[str]:
+    """Builds OCR-like texts: shuffled sentences broken over short lines, like screenshot and PDF text."""
+    rng = random.Random(seed)
+    texts = []
+    for _ in range(count):
+        words = " ".join(rng.choice(SENTENCES) for _ in range(rng.randint(2, 12))).split()
+        lines, line = [], []
+        for word in words:
+            line.append(word)
+            if len(line) >= rng.randint(4, 10):
+                lines.append(" ".join(line))
+                line = []
+        lines.append(" ".join(line))
+        texts.append("\n".join(lines))
+    return texts
+
+
+def load_texts(text_dir: str) -> list[str]:
+    texts = []
+    for name in sorted(os.listdir(text_dir)):
+        if name.endswith(".txt"):
+            with open(os.path.join(text_dir, name), encoding="utf-8", errors="replace") as f:
+                texts.append(f.read())
+    return texts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare full-pipeline NER with the trimmed, batched NER stage.")
+    parser.add_argument("--texts", type=int, default=300, help="Number of synthetic texts to tag")
+    parser.add_argument("--text-dir", help="Tag the .txt files in this directory instead of synthetic texts")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    texts = load_texts(args.text_dir) if args.text_dir else generate_texts(args.texts, args.seed)
+    print(f"Tagging {len(texts)} texts ({sum(map(len, texts))} characters).")
+
+    full_nlp = spacy.load(pipeline.NER_MODEL_NAME)
+    start = time.perf_counter()
+    full_tags = [sorted(set(ent.text for ent in full_nlp(text).ents)) for text in texts]
+    full_seconds = time.perf_counter() - start
+
+    pipeline.get_ner_model()  # Load outside the timed section
+    start = time.perf_counter()
+    batched_tags = [sorted(tags) for tags in pipeline.extract_tags_batch(texts)]
+    batched_seconds = time.perf_counter() - start
+
+    mismatches = [i for i, (a, b) in enumerate(zip(full_tags, batched_tags)) if a != b]
+    print({"pipeline": "full, one call per text", "components": full_nlp.pipe_names, "seconds": round(full_seconds, 3)})
+    print({
+        "pipeline": "trimmed, nlp.pipe",
+        "components": pipeline.get_ner_model().pipe_names,
+        "excluded": NER_EXCLUDED_COMPONENTS,
+        "batch_size": NER_BATCH_SIZE,
+        "n_process": NER_N_PROCESS,
+        "seconds": round(batched_seconds, 3),
+    })
+    print(f"Speedup: {full_seconds / batched_seconds:.2f}x")
+
+    if mismatches:
+        for i in mismatches[:5]:
+            print(f"Text {i}: full={full_tags[i]} trimmed={batched_tags[i]}")
+        print(f"FAIL: {len(mismatches)}/{len(texts)} texts got different tags.")
+        sys.exit(1)
+    print(f"OK: identical tags for all {len(texts)} texts.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the OCR backends in src/pipeline.py.
+Renders a corpus of synthetic text images and compares throughput (and output agreement)
+between the per-image pytesseract subprocess and the resident tesserocr engine.
+Start-up (creating the backend plus its first call) is reported separately from throughput.
+
+Usage: python benchmarks/ocr_backends.py --images 200 --backends pytesseract tesserocr
+"""
+
+import argparse
+import time
+
+import bootstrap  # Puts the project root on sys.path; must come before the project imports
+
+from corpus import text_images
+
+from src.pipeline import OCR_BACKENDS, get_ocr_backend
+
+
+def word_agreement(expected: str, actual: str) -> float:
+    """Fraction of expected words that appear in the OCR output."""
+    expected_words = expected.lower().split()
+    actual_words = set(actual.lower().split())
+    return sum(word in actual_words for word in expected_words) / max(1, len(expected_words))
+
+
+def benchmark_backend(name: str, corpus: list) -> dict:
+    start = time.perf_counter()
+    backend = get_ocr_backend(name)  # A fresh backend: they are only cached per thread, on first use
+    if backend.name != name:
+        return {"backend": name, "error": "backend unavailable"}
+    backend.image_to_string(corpus[0][0])  # Warm-up call, counted as start-up rather than throughput
+    startup = time.perf_counter() - start
+
+    agreement = 0.0
+    start = time.perf_counter()
+    for image, expected in corpus:
+        agreement += word_agreement(expected, backend.image_to_string(image))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "backend": name,
+        "startup_ms": round(1000 * startup, 2),
+        "images": len(corpus),
+        "seconds": round(elapsed, 3),
+        "images_per_sec": round(len(corpus) / elapsed, 2),
+        "ms_per_image": round(1000 * elapsed / len(corpus), 2),
+        "word_agreement": round(agreement / len(corpus), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare OCR backend throughput on generated text images.")
+    parser.add_argument("--images", type=int, default=100, help="Number of synthetic images to OCR")
+    parser.add_argument("--backends", nargs="+", default=list(OCR_BACKENDS), choices=list(OCR_BACKENDS))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # Plain white background, so word agreement measures the engines rather than the clutter
+    corpus = list(text_images(args.images, args.seed, min_lines=2, max_lines=6, background="white", boxes=False))
+    print(f"Generated {len(corpus)} text images.")
+
+    results = [benchmark_backend(name, corpus) for name in args.backends]
+    for result in results:
+        print(result)
+
+    timed = [r for r in results if "error" not in r]
+    if len(timed) > 1:
+        slowest = max(timed, key=lambda r: r["seconds"])
+        for result in timed:
+            print(f"{result['backend']}: {slowest['seconds'] / result['seconds']:.2f}x vs {slowest['backend']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Safety-net scan benchmark: builds a synthetic tree of empty files and times one pass of the old poller
+(os.walk plus an existence check and a set lookup per file) against DirectoryScanner passes: the first
+(full) pass, a pass over the unchanged tree, and a pass after a few files and directories changed.
+Reports JSON.
+
+Usage: python benchmarks/scan.py --directories 2000 --files-per-directory 100 --output scan.json
+"""
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+import bootstrap  # Puts the project root on sys.path; must come before the project imports
+
+from harness import write_report
+
+from src.config import SUPPORTED_EXTENSIONS
+from src.dir_scanner import DirectoryScanner, RACY_MTIME_SECONDS
+
+
+def accept(filename: str) -> bool:
+    return filename.lower().endswith(SUPPORTED_EXTENSIONS)
+
+
+def build_tree(root: str, directories: int, files_per_directory: int, fanout: int, seed: int) -> list[str]:
+    """Creates `directories` nested directories (each with up to `fanout` children) full of empty files."""
+    rng = random.Random(seed)
+    paths = [root]
+    for i in range(1, directories):
+        paths.append(os.path.join(paths[(i - 1) // fanout], f"dir_{i:05d}"))
+    for directory in paths:
+        os.makedirs(directory, exist_ok=True)
+        for j in range(files_per_directory):
+            extension = rng.choice((".png", ".jpg", ".pdf", ".txt", ".docx"))
+            open(os.path.join(directory, f"file_{j:04d}{extension}"), "wb").close()
+    # Age every directory mtime, so the scanner trusts them (as it would on a tree that isn't being written to)
+    old = time.time() - 3600
+    for directory in paths:
+        os.utime(directory, (old, old))
+    return paths
+
+
+def walk_pass(root: str) -> dict:
+    """The poller before DirectoryScanner: os.walk, then process_file_if_new's checks for every file."""
+    known = set()
+    started = time.perf_counter()
+    files = 0
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            file_path = os.path.join(directory, filename)
+            if os.path.exists(file_path) and accept(filename) and file_path not in known:
+                files += 1
+    return {"seconds": round(time.perf_counter() - started, 4), "files": files}
+
+
+def scanner_pass(scanner: DirectoryScanner, time_budget: float = None) -> dict:
+    started = time.perf_counter()
+    result = scanner.scan(time_budget)
+    return {
+        "seconds": round(time.perf_counter() - started, 4),
+        "complete": result["complete"],
+        "added": len(result["added"]),
+        "removed_files": len(result["removed_files"]),
+        "removed_directories": len(result["removed_directories"]),
+        "directories_listed": result["stats"]["directories_listed"],
+        "directories_unchanged": result["stats"]["directories_unchanged"],
+    }
+
+
+def make_changes(directories: list[str], changes: int, seed: int):
+    """Adds a file to, and removes a file from, `changes` random directories; deletes one leaf directory."""
+    rng = random.Random(seed + 1)
+    for directory in rng.sample(directories[1:], changes):
+        open(os.path.join(directory, "new_screenshot.png"), "wb").close()
+        for name in os.listdir(directory):
+            if name.endswith(".pdf"):
+                os.remove(os.path.join(directory, name))
+                break
+    shutil.rmtree(directories[-1])
+    time.sleep(RACY_MTIME_SECONDS)  # Let the changed mtimes age, as they would between two polls
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the safety-net directory scan.")
+    parser.add_argument("--directories", type=int, default=1000)
+    parser.add_argument("--files-per-directory", type=int, default=100)
+    parser.add_argument("--fanout", type=int, default=10, help="Subdirectories per directory")
+    parser.add_argument("--changes", type=int, default=10, help="Directories changed before the last pass")
+    parser.add_argument("--time-budget", type=float, default=0.01, help="Budget (seconds) for the budgeted-pass measurement")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="context-bench-") as tmp_dir:
+        root = os.path.join(tmp_dir, "tree")
+        started = time.perf_counter()
+        directories = build_tree(root, args.directories, args.files_per_directory, args.fanout, args.seed)
+        build_seconds = time.perf_counter() - started
+
+        scanner = DirectoryScanner([root], accept)
+        passes = {
+            "os_walk": walk_pass(root),
+            "scanner_first": scanner_pass(scanner),
+            "scanner_unchanged": scanner_pass(scanner),
+        }
+
+        budgeted, calls = DirectoryScanner([root], accept), 0
+        while True:
+            calls += 1
+            if scanner_pass(budgeted, args.time_budget)["complete"]:
+                break
+        passes["scanner_first_budgeted"] = {"time_budget": args.time_budget, "scan_calls": calls, **budgeted.last_pass}
+
+        make_changes(directories, args.changes, args.seed)
+        passes["scanner_after_changes"] = scanner_pass(scanner)
+
+    results = {
+        "tree": {"directories": len(directories), "files": len(directories) * args.files_per_directory,
+                 "built_in_seconds": round(build_seconds, 3)},
+        "passes": passes,
+    }
+    write_report("scan", vars(args), results, args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+Search benchmark: fills throwaway databases with synthetic entries, then sends GET /search requests to the
+FastAPI app in-process over ASGI (no network, no server) and reports p50/p95/p99 latency, throughput and memory
+high-water marks per search mode as JSON.
+
+Entries are stored straight through database_manager.add_items with stub vectors, so a large index builds
+in seconds. Query embedding uses the deterministic stub from benchmarks/stubs.py unless --real-models is given.
+Each query is sent to every mode, so the modes see the same workload.
+
+Usage: python benchmarks/search.py --entries 20000 --queries 500 --concurrency 8 --output search.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import logging
+import os
+import random
+import tempfile
+import time
+
+import bootstrap  # Puts the project root on sys.path; must come before the project imports
+
+from corpus import WORDS, random_text
+from harness import latency_summary, use_temp_databases, start_memory_tracking, memory_high_water, write_report
+from stubs import StubEmbedding, StubNER, install_stubs
+
+from src import database_manager, pipeline
+
+MODES = ("vector", "lexical", "hybrid")
+
+
+def populate(entries: int, seed: int) -> list[str]:
+    """Adds `entries` synthetic entries (half images, half PDF pages). Returns their OCR texts."""
+    rng = random.Random(seed)
+    embedding, ner = StubEmbedding(), StubNER()
+    texts, batch = [], []
+    for i in range(entries):
+        text = random_text(rng)
+        texts.append(text)
+        result = {"ocr_text": text, "tags": [ent.text for ent in next(ner.pipe([text])).ents], "user_caption": ""}
+        if i % 2:
+            result.update(file_path=f"/bench/docs/document_{i // 20:05d}.pdf_page_{i % 20 + 1}", original_pdf_path=f"/bench/docs/document_{i // 20:05d}.pdf")
+        else:
+            result["file_path"] = f"/bench/screenshots/screenshot_{i:06d}.png"
+        result["vector"] = embedding.encode_texts([text])[0].tolist()
+        batch.append(result)
+        if len(batch) == 1000:
+            database_manager.add_items(batch)
+            batch = []
+    database_manager.add_items(batch)
+    return texts
+
+
+def generate_queries(texts: list[str], count: int, seed: int) -> list[str]:
+    """A mix of keyword queries, identifiers copied from stored text, and short phrases."""
+    rng = random.Random(seed + 1)
+    queries = []
+    for i in range(count):
+        kind = i % 3
+        if kind == 0:
+            queries.append(" ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 3))))
+        elif kind == 1:
+            queries.append(rng.choice(texts).splitlines()[-1].split()[-1])  # e.g. INV-48213
+        else:
+            queries.append(" ".join(rng.choice(texts).split()[:rng.randint(3, 6)]))
+    return queries
+
+
+async def run_mode(app, mode: str, queries: list[str], limit: int, concurrency: int) -> dict:
+    import httpx
+
+    # One event loop for every request, as under uvicorn, so concurrent vector queries are coalesced.
+    # ASGITransport doesn't send lifespan events, so the app's file monitor and model warm-up aren't started.
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def timed_request(query: str) -> float:
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get("/search", params={"q": query, "limit": limit, "mode": mode})
+                response.raise_for_status()
+                return time.perf_counter() - started
+
+        for query in queries[:5]:  # Warm-up: metadata cache, first ChromaDB query, thread pools
+            await timed_request(query)
+
+        started = time.perf_counter()
+        latencies = await asyncio.gather(*(timed_request(query) for query in queries))
+        seconds = time.perf_counter() - started
+
+    return {
+        "latency": latency_summary(latencies),
+        "requests_per_sec": round(len(queries) / seconds, 2),
+        "memory": memory_high_water(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark GET /search latency over a synthetic index.")
+    parser.add_argument("--entries", type=int, default=5000, help="Entries to index before searching")
+    parser.add_argument("--queries", type=int, default=300, help="Requests per mode")
+    parser.add_argument("--limit", type=int, default=10, help="Results per request")
+    parser.add_argument("--concurrency", type=int, default=1, help="Requests in flight at once")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=MODES)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--real-models", action="store_true", help="Encode queries with the configured CLIP model instead of the stub")
+    parser.add_argument("--tracemalloc", action="store_true", help="Also track the Python heap peak (slows the run down)")
+    parser.add_argument("--output", help="Also write the JSON report to this file")
+    parser.add_argument("--verbose", action="store_true", help="Keep the server's own output")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+    install_stubs(models=not args.real_models)
+
+    import api_server
+
+    with tempfile.TemporaryDirectory(prefix="context-bench-") as tmp_dir:
+        use_temp_databases(tmp_dir)
+        output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+        with output:
+            started = time.perf_counter()
+            texts = populate(args.entries, args.seed)
+            populate_seconds = time.perf_counter() - started
+            if args.real_models:
+                pipeline.get_embedding_model()  # Model loading is not part of the measurement
+
+            queries = generate_queries(texts, args.queries, args.seed)
+            start_memory_tracking(args.tracemalloc)
+            modes = {mode: asyncio.run(run_mode(api_server.app, mode, queries, args.limit, args.concurrency)) for mode in args.modes}
+
+        results = {
+            "index": {"entries": database_manager.get_collection().count(), "populated_in_seconds": round(populate_seconds, 3)},
+            "modes": modes,
+        }
+        database_manager.CLIENT = database_manager.COLLECTION = None
+
+    write_report("search", vars(args), results, args.output)
+    os._exit(0)  # Skip interpreter teardown of ChromaDB's background threads
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Deterministic stand-ins for the models, so the benchmarks run offline and give repeatable results.
+The same input always produces the same vector, tags and text, and none of them needs a download.
+They are cheap, so timings measure the pipeline and database code around the models, not the models.
+"""
+
+import hashlib
+import re
+
+import numpy as np
+
+from src import pipeline
+
+EMBEDDING_DIMENSIONS = 512  # Same width as clip-ViT-B-32
+STUB_WORDS = (
+    "invoice Samsung quarterly revenue report meeting notes Berlin London project context deadline "
+    "budget error code customer order shipment analysis summary total amount due Acme Globex Maria"
+).split()
+
+
+def _seed(data: bytes) -> int:
+    return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), "little")
+
+
+class StubEmbedding(pipeline.EmbeddingBackend):
+    """Unit vectors drawn from a generator seeded by a hash of the image pixels or the text."""
+    name = "stub"
+
+    def _vector(self, data: bytes) -> np.ndarray:
+        vector = np.random.default_rng(_seed(data)).standard_normal(EMBEDDING_DIMENSIONS).astype(np.float32)
+        return vector / np.linalg.norm(vector)
+
+    def encode_images(self, images: list) -> np.ndarray:
+        return np.stack([self._vector(image.tobytes()) for image in images])
+
+    def encode_texts(self, texts: list[str]) -> np.ndarray:
+        return np.stack([self._vector(text.encode("utf-8")) for text in texts])
+
+
+class _Entity:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class _Doc:
+    def __init__(self, ents: list[_Entity]):
+        self.ents = ents
+
+
+class StubNER:
+    """Tags runs of capitalized words and numbers, with the `pipe()` interface extract_tags_batch uses."""
+    pipe_names = ["stub_ner"]
+    ENTITY_PATTERN = re.compile(r"\b(?:[A-Z][a-z]+(?: [A-Z][a-z]+)*|\d[\d.,/-]*\d)\b")
+
+    def pipe(self, texts, batch_size: int = None, n_process: int = None):
+        for text in texts:
+            yield _Doc([_Entity(match.group()) for match in self.ENTITY_PATTERN.finditer(text)])
+
+
+class StubOCR(pipeline.OCRBackend):
+    """Returns a few words picked by a hash of the pixels, for machines without tesseract."""
+    name = "stub"
+
+    def image_to_string(self, pil_image) -> str:
+        rng = np.random.default_rng(_seed(pil_image.tobytes()))
+        return " ".join(rng.choice(STUB_WORDS, size=24))
+
+
+def install_stubs(models: bool = True, ocr: bool = False):
+    """Makes the pipeline in this process use StubEmbedding and StubNER if `models`, and StubOCR if `ocr`."""
+    if models:
+        pipeline.use_models(embedding_model=StubEmbedding(), ner_model=StubNER())
+    if ocr:
+        pipeline.OCR_BACKENDS[StubOCR.name] = StubOCR
+        pipeline.OCR_BACKEND = StubOCR.name
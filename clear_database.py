@@ -1,6 +1,8 @@
 import chromadb
 import os
 
+from src import file_manifest, index_store
+
 DB_PATH = "chroma_db"
 COLLECTION_NAME = "context_collection"
 
@@ -10,6 +12,10 @@ if __name__ == "__main__":
             client = chromadb.PersistentClient(path=DB_PATH)
             client.delete_collection(name=COLLECTION_NAME)
             print(f"Collection '{COLLECTION_NAME}' has been deleted.")
+            file_manifest.clear()  # Otherwise the monitor would treat every file as already indexed
+            print("File manifest cleared.")
+            index_store.clear()  # Otherwise searches and entity graphs would still return the deleted pages
+            print("Page index cleared.")
         except Exception as e:
             print(f"Error deleting collection: {e}")
     else:
@@ -1,14 +1,28 @@
 import time
 import os
+import queue
 import threading
 import logging
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 from typing import Set
 
-from src.pipeline import analyze_image, analyze_pdf
-from src.database_manager import add_item, delete_item
-from src.config import PATHS_TO_WATCH, SUPPORTED_EXTENSIONS, IGNORED_PATTERNS, POLLING_INTERVAL_SECONDS
+from src.pipeline import (
+    analyze_image, analyze_pdf, extract_image_text, extract_pdf_text, embed_images, embed_pdf,
+    init_extraction_worker, pdf_page_fingerprints
+)
+from src.database_manager import (
+    add_items, delete_item, delete_items, delete_directory, delete_pages, get_collection, get_pdf_page_fingerprints
+)
+from src import analysis_cache, file_manifest, metrics, profiling
+from src.dir_scanner import DirectoryScanner
+from src.config import (
+    PATHS_TO_WATCH, SUPPORTED_EXTENSIONS, IGNORED_PATTERNS, POLLING_INTERVAL_SECONDS, POLLING_TIME_BUDGET_SECONDS,
+    INGEST_QUEUE_SIZE, INGEST_WORKERS, IMAGE_BATCH_SIZE, IMAGE_BATCH_WAIT_SECONDS,
+    EXTRACTION_WORKERS, EXTRACTION_QUEUE_SIZE
+)
 
 # --- Setup ---
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -16,13 +30,35 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 PROCESSED_FILES: Set[str] = set()
 PROCESSING_LOCK = threading.Lock()
 SHUTDOWN_EVENT = threading.Event()
-ACTIVE_PROCESSING_THREADS = threading.local()
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+STABILITY_CHECK_INTERVAL_SECONDS = 2
+REQUIRED_STABLE_CHECKS = 3  # Require the size to be stable for 3 checks (6 seconds)
+MAX_STABILITY_CHECKS = 120  # Wait for a total of ~4 minutes before timing out
+
+# Files flow through bounded queues, so a burst of new files applies backpressure instead of spawning threads:
+#   detection -> INTAKE_QUEUE -> stability stage -> READY_QUEUE -> extraction dispatcher
+#   -> (process pool: hash/decode/OCR/NER) -> EXTRACTED_QUEUE -> embedding workers (batched CLIP) -> database
+INTAKE_QUEUE: queue.Queue = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+READY_QUEUE: queue.Queue = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+# EXTRACTED_QUEUE items: (file_path, user_caption, Future of an extract_file job, profiling settings or None)
+EXTRACTED_QUEUE: queue.Queue = queue.Queue(maxsize=EXTRACTION_QUEUE_SIZE)
+INGEST_THREADS: list[threading.Thread] = []
+EXTRACTION_POOL: ProcessPoolExecutor | None = None
+QUEUED_FILES: Set[str] = set()  # Files queued or being analyzed, guarded by PROCESSING_LOCK
+# File path -> (signature, content_hash) as of when its analysis started, saved to the file manifest once the
+# file is in the index. Guarded by PROCESSING_LOCK.
+MANIFEST_PENDING: dict[str, tuple] = {}
+# Indexed images queued again after changing on disk. Their old entry stays searchable until the new analysis is
+# ready to replace it (see _replace_items). Guarded by PROCESSING_LOCK.
+REPLACED_IMAGES: Set[str] = set()
 
 def is_valid_file(file_path: str) -> bool:
     """Checks if a file is valid for processing."""
-    filename = os.path.basename(file_path)
-    if not os.path.exists(file_path):
-        return False
+    return os.path.exists(file_path) and is_supported_filename(os.path.basename(file_path))
+
+def is_supported_filename(filename: str) -> bool:
+    """Checks a file name (without touching the disk) against the supported extensions and ignored patterns."""
     if filename.startswith('.'):
         return False
     if not filename.lower().endswith(SUPPORTED_EXTENSIONS):
@@ -31,84 +67,481 @@ def is_valid_file(file_path: str) -> bool:
         return False
     return True
 
+def _content_hash(file_path: str) -> str | None:
+    """Hashes a file's bytes for the analysis cache. Returns None if the file can't be read."""
+    try:
+        return analysis_cache.file_content_hash(file_path)
+    except OSError as e:
+        logging.warning(f"Could not hash {os.path.basename(file_path)}: {e}")
+        return None
+
+def _begin_analysis(file_path: str) -> str | None:
+    """
+    Notes the file's on-disk signature for the manifest, then hashes its bytes. Returns the content hash.
+    The signature is taken first, so a write racing the analysis shows up as a change on the next reconcile.
+    """
+    try:
+        file_signature = file_manifest.signature(os.stat(file_path))
+    except OSError:
+        file_signature = None
+    content_hash = _content_hash(file_path)
+    if file_signature:
+        with PROCESSING_LOCK:
+            MANIFEST_PENDING[file_path] = (file_signature, content_hash)
+    return content_hash
+
+def add_cached_analysis(file_path: str, user_caption: str | None, content_hash: str | None) -> bool:
+    """Adds a file from the analysis cache if identical bytes were analyzed before. Returns True on a hit."""
+    if not content_hash:
+        return False
+    cached_results = analysis_cache.lookup(content_hash, file_path, user_caption)
+    if not cached_results:
+        return False
+
+    logging.info(f"Reusing cached analysis for: {os.path.basename(file_path)}")
+    _replace_items(cached_results, _take_replaced_images([file_path]))
+    return True
+
+def _store_analysis(content_hash: str | None, user_caption: str | None, results: list[dict]):
+    if content_hash:
+        try:
+            analysis_cache.store(content_hash, user_caption, results)
+        except Exception as e:
+            logging.warning(f"Could not update the analysis cache: {e}")
+
+def plan_pdf_reindex(file_path: str, stored_fingerprints: dict[str, str]) -> tuple[list[int] | None, list[str]]:
+    """
+    Compares the PDF's per-page fingerprints with `stored_fingerprints` (page id -> fingerprint, as stored next
+    to its page ids). Returns (page_nums, stale_ids): the page numbers that need analysis ([] when nothing changed,
+    or None when the PDF was never indexed, so every page) and the ids of stored pages that were removed or changed.
+    Nothing is deleted here: stale pages are replaced once the new ones are embedded (see _replace_items).
+    """
+    if not stored_fingerprints:
+        return None, []
+
+    fingerprints = pdf_page_fingerprints(file_path)
+    current_page_ids = {f"{file_path}_page_{page_num}" for page_num in range(1, len(fingerprints) + 1)}
+
+    changed_pages = [
+        page_num for page_num, fingerprint in enumerate(fingerprints, start=1)
+        if stored_fingerprints.get(f"{file_path}_page_{page_num}") != fingerprint
+    ]
+    removed_ids = [page_id for page_id in stored_fingerprints if page_id not in current_page_ids]
+    stale_ids = removed_ids + [
+        f"{file_path}_page_{page_num}" for page_num in changed_pages
+        if f"{file_path}_page_{page_num}" in stored_fingerprints
+    ]
+
+    logging.info(
+        f"Re-indexing {os.path.basename(file_path)}: {len(changed_pages)} new/changed, "
+        f"{len(removed_ids)} removed, {len(fingerprints) - len(changed_pages)} unchanged page(s)."
+    )
+    return changed_pages, stale_ids
+
+def extract_file(file_path: str, user_caption: str | None, stored_fingerprints: dict[str, str] | None) -> dict:
+    """
+    Extraction job for the process pool: all the per-file work that needs no database writes. Takes the file's
+    signature and content hash, works out which PDF pages changed, skips files the analysis cache already has and
+    extracts the rest (decoded image, OCR text, NER tags). Returns {"signature", "content_hash", "page_nums",
+    "stale_ids", "outcome": 'unchanged', 'cached' or 'extracted', and then "content": the extract_image_text dict
+    or extract_pdf_text's pages}.
+    """
+    try:
+        file_signature = file_manifest.signature(os.stat(file_path))  # Taken before hashing, as in _begin_analysis
+    except OSError:
+        file_signature = None
+    job = {"signature": file_signature, "content_hash": _content_hash(file_path), "page_nums": None, "stale_ids": []}
+
+    is_pdf = file_path.lower().endswith('.pdf')
+    if is_pdf:
+        job["page_nums"], job["stale_ids"] = plan_pdf_reindex(file_path, stored_fingerprints)
+        if job["page_nums"] == []:
+            return {**job, "outcome": "unchanged"}
+    if job["page_nums"] is None and job["content_hash"] and analysis_cache.contains(job["content_hash"], user_caption):
+        return {**job, "outcome": "cached"}
+
+    if is_pdf:
+        return {**job, "outcome": "extracted", "content": extract_pdf_text(file_path, job["page_nums"])}
+    return {**job, "outcome": "extracted", "content": extract_image_text(file_path, keep_image=True)}
+
+def _take_replaced_images(file_paths: list[str]) -> list[str]:
+    """Returns the ids of the given files' old entries that a new analysis replaces, and forgets them."""
+    with PROCESSING_LOCK:
+        stale_ids = [file_path for file_path in file_paths if file_path in REPLACED_IMAGES]
+        REPLACED_IMAGES.difference_update(stale_ids)
+    return stale_ids
+
+def _replace_items(results: list[dict], stale_ids: list[str] = ()) -> bool:
+    """
+    Adds analysis results, first deleting the stale entries (changed PDF pages, changed images) they replace.
+    Deleting only now, after the new entries were analyzed, means a failed re-index leaves the old ones
+    searchable. Returns False if a replacement was lost.
+    """
+    if stale_ids:
+        delete_pages(stale_ids)
+    added = add_items(results)
+    if stale_ids and added < len(results):
+        logging.error(f"Only {added} of {len(results)} re-indexed item(s) could be written.")
+        return False
+    return True
+
+def _file_finished(file_path: str, outcome: str):
+    """
+    Counts a finished file in the context_files_total metric ('indexed', 'cached', 'unchanged' or 'failed').
+    Files that made it into the index are saved to the file manifest, so restarts skip them until they change.
+    """
+    metrics.FILES.labels("pdf" if file_path.lower().endswith('.pdf') else "image", outcome).inc()
+    with PROCESSING_LOCK:
+        pending = MANIFEST_PENDING.pop(file_path, None)
+    if pending and outcome != "failed":
+        try:
+            file_manifest.record(file_path, *pending)
+        except Exception as e:
+            logging.warning(f"Could not update the file manifest for {os.path.basename(file_path)}: {e}")
+
 def process_file(file_path: str, user_caption: str = None):
     """Handles the analysis and database addition for a single file."""
+    with profiling.profile("files", os.path.basename(file_path)):
+        _process_file(file_path, user_caption)
+
+def _process_file(file_path: str, user_caption: str = None):
     filename = os.path.basename(file_path)
     logging.info(f"Starting analysis for: {filename}")
-    
-    # Increment active thread count
-    if not hasattr(ACTIVE_PROCESSING_THREADS, 'count'):
-        ACTIVE_PROCESSING_THREADS.count = 0
-    ACTIVE_PROCESSING_THREADS.count += 1
 
     # --- Analyze and add to database ---
+    outcome = "failed"
     try:
-        if filename.lower().endswith(('.png', '.jpg', '.jpeg')):
+        content_hash = _begin_analysis(file_path)
+
+        if filename.lower().endswith(IMAGE_EXTENSIONS):
+            if add_cached_analysis(file_path, user_caption, content_hash):
+                outcome = "cached"
+                return
             analysis_data = analyze_image(file_path, user_caption=user_caption)
-            if analysis_data:
-                add_item(analysis_data)
+            if analysis_data and _replace_items([analysis_data], _take_replaced_images([file_path])):
+                _store_analysis(content_hash, user_caption, [analysis_data])
+                outcome = "indexed"
         elif filename.lower().endswith('.pdf'):
-            list_of_page_data = analyze_pdf(file_path, user_caption=user_caption)
-            if list_of_page_data:
-                for page_data in list_of_page_data:
-                    add_item(page_data)
+            page_nums, stale_ids = plan_pdf_reindex(file_path, get_pdf_page_fingerprints(file_path))
+            if page_nums == []:
+                delete_pages(stale_ids)  # Removed pages only: nothing to replace them with
+                outcome = "unchanged"
+                return
+            if page_nums is None and add_cached_analysis(file_path, user_caption, content_hash):
+                outcome = "cached"
+                return
+            list_of_page_data = analyze_pdf(file_path, user_caption=user_caption, page_nums=page_nums)
+            if list_of_page_data and _replace_items(list_of_page_data, stale_ids):
+                if page_nums is None:
+                    _store_analysis(content_hash, user_caption, list_of_page_data)
+                outcome = "indexed"
     except Exception as e:
+        metrics.ERRORS.labels("process_file").inc()
         logging.error(f"An unexpected error occurred during analysis of {filename}: {e}")
     finally:
-        # Decrement active thread count
-        ACTIVE_PROCESSING_THREADS.count -= 1
+        _file_finished(file_path, outcome)
 
-def wait_for_file_stability_and_process(file_path: str, user_caption: str = None, interactive: bool = False):
+def _extraction_result(file_path: str, future: Future, profile_stages: dict = None) -> dict | None:
     """
-    Waits for a file to stop changing in size before processing.
-    This is crucial for large files that are still being written to disk.
+    Waits for an extract_file job and returns its result, or None if it failed.
+    The job's profiled stages, if any, are put in profile_stages[file_path].
     """
-    filename = os.path.basename(file_path)
-    logging.info(f"File '{filename}' detected. Waiting for it to stabilize...")
+    try:
+        job, stages = metrics.job_result(future)  # Also brings in the metrics recorded by the worker process
+    except Exception as e:
+        job, stages = None, getattr(e, "profile_stages", [])
+        metrics.ERRORS.labels("extract").inc()
+        logging.error(f"Extraction failed for {os.path.basename(file_path)}: {e}")
+    if stages and profile_stages is not None:
+        profile_stages[file_path] = stages
+    if job and job["signature"]:
+        with PROCESSING_LOCK:
+            MANIFEST_PENDING[file_path] = (job["signature"], job["content_hash"])
+    return job
 
-    # --- Get optional user caption if running interactively ---
-    if interactive:
-        print("-" * 30)
-        user_caption = input(f" > Add an optional note for '{filename}' (or press Enter to skip): ")
-        print("-" * 30)
-    
-    user_caption = user_caption.strip() if user_caption else None
+def _settle_without_embedding(file_path: str, user_caption: str | None, job: dict) -> bool:
+    """
+    Finishes files whose extraction job found nothing to embed: unchanged PDFs (dropping any removed pages)
+    and files already in the analysis cache. Returns False if the extracted content still needs embedding.
+    """
+    if job["outcome"] == "unchanged":
+        delete_pages(job["stale_ids"])
+        _file_finished(file_path, "unchanged")
+    elif job["outcome"] == "cached":
+        if add_cached_analysis(file_path, user_caption, job["content_hash"]):
+            _file_finished(file_path, "cached")
+        else:
+            _process_file(file_path, user_caption)  # Evicted since the worker checked; analyze it here instead
+    else:
+        if job["page_nums"] is None and job["content_hash"]:
+            analysis_cache.count_miss()
+        return False
+    return True
+
+def embed_image_batch(items: list[tuple[str, str | None, Future, dict | None]], profile_stages: dict = None):
+    """Embeds a batch of extracted images from any number of files and stores the results."""
+    try:
+        extracted, user_captions, content_hashes = [], [], []
+        for file_path, user_caption, future, _ in items:
+            job = _extraction_result(file_path, future, profile_stages)
+            if not job:
+                _file_finished(file_path, "failed")
+            elif not _settle_without_embedding(file_path, user_caption, job):
+                extracted.append(job["content"])
+                user_captions.append(user_caption)
+                content_hashes.append(job["content_hash"])
+        if not extracted:
+            return
 
-    last_size = -1
-    stable_checks = 0
-    max_stable_checks = 3  # Require the size to be stable for 3 checks (6 seconds)
+        logging.info(f"Embedding a batch of {len(extracted)} image(s)")
+        embedded = embed_images(extracted, user_captions)
+        results = [analysis_data for analysis_data in embedded if analysis_data]
+        stored = _replace_items(results, _take_replaced_images([analysis_data["file_path"] for analysis_data in results]))
+        for content, analysis_data, user_caption, content_hash in zip(extracted, embedded, user_captions, content_hashes):
+            _file_finished(content["file_path"], "indexed" if analysis_data and stored else "failed")
+            if analysis_data and stored:
+                _store_analysis(content_hash, user_caption, [analysis_data])
+    except Exception as e:
+        metrics.ERRORS.labels("embed").inc()
+        logging.error(f"An unexpected error occurred during batched image analysis: {e}")
 
-    for _ in range(120): # Wait for a total of ~4 minutes before timing out
-        if SHUTDOWN_EVENT.is_set():
-            logging.info("Shutdown signal received, stopping stability check.")
+def embed_pdf_file(file_path: str, user_caption: str | None, future: Future, profile_stages: dict = None):
+    """Embeds the extracted pages of one PDF and stores them."""
+    try:
+        job = _extraction_result(file_path, future, profile_stages)
+        if not job:
+            _file_finished(file_path, "failed")
+            return
+        if _settle_without_embedding(file_path, user_caption, job):
+            return
+        pages = job["content"]
+        if not pages:
+            _file_finished(file_path, "failed")
             return
+        list_of_page_data = embed_pdf(file_path, pages, user_caption)
+        if not _replace_items(list_of_page_data, job["stale_ids"]):
+            _file_finished(file_path, "failed")
+            return
+        # Only complete analyses go into the analysis cache, not partial re-indexes
+        if job["page_nums"] is None:
+            _store_analysis(job["content_hash"], user_caption, list_of_page_data)
+        _file_finished(file_path, "indexed")
+    except Exception as e:
+        metrics.ERRORS.labels("embed").inc()
+        _file_finished(file_path, "failed")
+        logging.error(f"An unexpected error occurred during analysis of {os.path.basename(file_path)}: {e}")
 
+def _put_until_shutdown(target_queue: queue.Queue, item) -> bool:
+    """Blocks until the item fits in the bounded queue. Returns False if shutdown began first."""
+    while not SHUTDOWN_EVENT.is_set():
         try:
-            if not os.path.exists(file_path):
-                logging.warning(f"File '{filename}' was removed before it could be processed.")
-                return
+            target_queue.put(item, timeout=1)
+            return True
+        except queue.Full:
+            continue
+    return False
 
-            current_size = os.path.getsize(file_path)
-            if current_size == last_size and current_size > 0:
-                stable_checks += 1
-            else:
-                stable_checks = 0  # Reset if size changes
+def _finish_files(*file_paths: str):
+    """Marks queued files as done (processed, skipped or abandoned)."""
+    with PROCESSING_LOCK:
+        QUEUED_FILES.difference_update(file_paths)
+        for file_path in file_paths:
+            MANIFEST_PENDING.pop(file_path, None)  # Left over if the file failed before _file_finished
 
-            if stable_checks >= max_stable_checks:
+def _admit_for_stability_check(file_path: str, user_caption: str | None) -> dict:
+    """Prepares the stability-tracking state for a newly detected file."""
+    logging.info(f"File '{os.path.basename(file_path)}' detected. Waiting for it to stabilize...")
+    return {
+        "user_caption": user_caption.strip() if user_caption else None,
+        "last_size": -1,
+        "stable_checks": 0,
+        "checks": 0,
+    }
+
+def stability_stage():
+    """
+    Waits for detected files to stop changing in size before handing them to the ingest workers.
+    One thread tracks every pending file, which is crucial for large files still being written to disk.
+    """
+    pending: dict[str, dict] = {}
+
+    while not SHUTDOWN_EVENT.is_set():
+        # Admit newly detected files; block briefly when there is nothing else to do.
+        while len(pending) < INGEST_QUEUE_SIZE:
+            try:
+                if pending:
+                    file_path, user_caption = INTAKE_QUEUE.get_nowait()
+                else:
+                    file_path, user_caption = INTAKE_QUEUE.get(timeout=1)
+            except queue.Empty:
+                break
+            pending[file_path] = _admit_for_stability_check(file_path, user_caption)
+
+        for file_path, state in list(pending.items()):
+            filename = os.path.basename(file_path)
+            state["checks"] += 1
+            try:
+                if not os.path.exists(file_path):
+                    logging.warning(f"File '{filename}' was removed before it could be processed.")
+                    del pending[file_path]
+                    _finish_files(file_path)
+                    continue
+
+                current_size = os.path.getsize(file_path)
+                if current_size == state["last_size"] and current_size > 0:
+                    state["stable_checks"] += 1
+                else:
+                    state["stable_checks"] = 0  # Reset if size changes
+                state["last_size"] = current_size
+            except (OSError, FileNotFoundError):
+                logging.warning(f"Could not access '{filename}'. Retrying...")
+
+            if state["stable_checks"] >= REQUIRED_STABLE_CHECKS:
                 logging.info(f"File '{filename}' is stable. Proceeding with processing.")
-                process_file(file_path, user_caption)
-                return
+                del pending[file_path]
+                if not _put_until_shutdown(READY_QUEUE, (file_path, state["user_caption"])):
+                    return
+            elif state["checks"] >= MAX_STABILITY_CHECKS:
+                logging.warning(f"Timed out waiting for '{filename}' to stabilize. Skipping.")
+                del pending[file_path]
+                _finish_files(file_path)
 
-            last_size = current_size
-            time.sleep(2)
-        except (OSError, FileNotFoundError):
-            logging.warning(f"Could not access '{filename}'. Retrying...")
-            time.sleep(2)
+        if pending:
+            SHUTDOWN_EVENT.wait(STABILITY_CHECK_INTERVAL_SECONDS)
 
-    logging.warning(f"Timed out waiting for '{filename}' to stabilize. Skipping.")
+    if pending:
+        logging.info("Shutdown signal received, stopping stability checks.")
+
+def extraction_dispatcher():
+    """
+    Submits stable files to the extraction process pool, where hashing, PDF page fingerprinting, decoding, OCR
+    and NER run on every core (see extract_file). Blocks once EXTRACTED_QUEUE is full, so extraction never runs
+    far ahead of embedding.
+    """
+    while not SHUTDOWN_EVENT.is_set():
+        try:
+            file_path, user_caption = READY_QUEUE.get(timeout=1)
+        except queue.Empty:
+            continue
+
+        stored_fingerprints = None
+        if file_path.lower().endswith('.pdf'):
+            try:
+                stored_fingerprints = get_pdf_page_fingerprints(file_path)  # The job compares them with the file's pages
+            except Exception as e:
+                logging.warning(f"Could not check previous analysis of {os.path.basename(file_path)}: {e}")
+
+        profile_settings = profiling.claim("files")
+        try:
+            # call_with_metrics ships the worker's stage timings back with the result; call_profiled profiles
+            # the extraction in the worker when this file was picked for profiling and ships back the dumps it
+            # wrote, which _keep_slow_profiles keeps or deletes once the file's total time is known.
+            future = EXTRACTION_POOL.submit(
+                metrics.call_with_metrics, profiling.call_profiled, profile_settings,
+                f"{os.path.basename(file_path)}.extract", extract_file, file_path, user_caption, stored_fingerprints
+            )
+        except Exception as e:
+            logging.error(f"Could not schedule extraction for {os.path.basename(file_path)}: {e}")
+            _file_finished(file_path, "failed")
+            _finish_files(file_path)
+            continue
+
+        if not _put_until_shutdown(EXTRACTED_QUEUE, (file_path, user_caption, future, profile_settings)):
+            future.cancel()
+            return
+
+def _next_extracted_batch() -> tuple[list, list]:
+    """
+    Waits for the next extracted file, then keeps collecting images (from any file) until the
+    batch is full or IMAGE_BATCH_WAIT_SECONDS has passed. Returns (images, pdfs).
+    """
+    try:
+        first_item = EXTRACTED_QUEUE.get(timeout=1)
+    except queue.Empty:
+        return [], []
+
+    images, pdfs = [], []
+    (images if first_item[0].lower().endswith(IMAGE_EXTENSIONS) else pdfs).append(first_item)
+    if not images:
+        return images, pdfs
+
+    deadline = time.monotonic() + IMAGE_BATCH_WAIT_SECONDS
+    while len(images) < IMAGE_BATCH_SIZE:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            item = EXTRACTED_QUEUE.get(timeout=remaining)
+        except queue.Empty:
+            break
+        (images if item[0].lower().endswith(IMAGE_EXTENSIONS) else pdfs).append(item)
+    return images, pdfs
+
+def _keep_slow_profiles(items: list[tuple], extract_stages: dict, embed_stages: list):
+    """
+    Applies the profiling threshold to each profiled file's total: its extraction plus the embedding session
+    it was part of. An image batch shares one embedding profile, kept if any of its files was slow enough.
+    """
+    embed_seconds = sum(stage["seconds"] for stage in embed_stages)
+    kept = False
+    for file_path, _, _, profile_settings in items:
+        kept |= profiling.keep_if_slow(profile_settings, extract_stages.get(file_path, []), embed_seconds)
+    if not kept:
+        profiling.discard(embed_stages)
+
+def embedding_worker():
+    """Pulls extracted files off EXTRACTED_QUEUE, embedding images in cross-file batches and PDFs one at a time."""
+    while not SHUTDOWN_EVENT.is_set():
+        images, pdfs = _next_extracted_batch()
+        if images:
+            # A batch mixes files; it is profiled if any of them was picked for profiling
+            profile_settings = next((item[3] for item in images if item[3]), None)
+            extract_stages, embed_stages = {}, []
+            with profiling.session(profile_settings, f"{len(images)}_images.embed", stages=embed_stages):
+                embed_image_batch(images, extract_stages)
+            _keep_slow_profiles(images, extract_stages, embed_stages)
+            _finish_files(*[file_path for file_path, *_ in images])
+        for item in pdfs:
+            file_path, user_caption, future, profile_settings = item
+            extract_stages, embed_stages = {}, []
+            with profiling.session(profile_settings, f"{os.path.basename(file_path)}.embed", stages=embed_stages):
+                embed_pdf_file(file_path, user_caption, future, extract_stages)
+            _keep_slow_profiles([item], extract_stages, embed_stages)
+            _finish_files(file_path)
+
+def start_ingest_workers():
+    """Starts the stability stage, the extraction process pool and the embedding workers (once per process)."""
+    global EXTRACTION_POOL
+    with PROCESSING_LOCK:
+        if INGEST_THREADS:
+            return
+        # Workers are spawned, not forked: a fork copies locks that this process's threads (watchdog, the
+        # ingest stages, the API, BLAS/OpenMP pools) may hold at that moment, which can deadlock the child.
+        EXTRACTION_POOL = ProcessPoolExecutor(
+            max_workers=EXTRACTION_WORKERS or os.cpu_count(),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_extraction_worker
+        )
+        INGEST_THREADS.append(threading.Thread(target=stability_stage, name="stability-stage", daemon=True))
+        INGEST_THREADS.append(threading.Thread(target=extraction_dispatcher, name="extraction-dispatcher", daemon=True))
+        for i in range(INGEST_WORKERS):
+            INGEST_THREADS.append(threading.Thread(target=embedding_worker, name=f"embedding-worker-{i}", daemon=True))
+    for thread in INGEST_THREADS:
+        thread.start()
+
+def stop_ingest_workers():
+    """Waits for the ingest threads to exit (after SHUTDOWN_EVENT is set) and stops the extraction pool."""
+    for thread in INGEST_THREADS:
+        thread.join()
+    if EXTRACTION_POOL:
+        EXTRACTION_POOL.shutdown(wait=True, cancel_futures=True)
 
 def process_file_if_new(file_path: str, user_caption: str = None, interactive: bool = False):
-    """Schedules a file for processing if it's new and valid."""
+    """
+    Queues a file for processing if it's new and valid. Blocks while the intake queue is full.
+    If interactive, the optional note is asked for here, in the caller's thread, so an unanswered
+    prompt never holds up the stability stage shared by every other file.
+    """
     global PROCESSED_FILES
     if not is_valid_file(file_path):
         return
@@ -117,18 +550,63 @@ def process_file_if_new(file_path: str, user_caption: str = None, interactive: b
         if file_path in PROCESSED_FILES:
             return
         PROCESSED_FILES.add(file_path)
+        QUEUED_FILES.add(file_path)
 
-    # Process each file in a separate thread to avoid blocking the main loop
-    thread = threading.Thread(target=wait_for_file_stability_and_process, args=(file_path, user_caption, interactive))
-    thread.start()
+    # --- Get optional user caption if running interactively ---
+    if interactive:
+        print("-" * 30)
+        user_caption = input(f" > Add an optional note for '{os.path.basename(file_path)}' (or press Enter to skip): ")
+        print("-" * 30)
+
+    start_ingest_workers()
+    if not _put_until_shutdown(INTAKE_QUEUE, (file_path, user_caption)):
+        _finish_files(file_path)
+
+def handle_modified_file(file_path: str):
+    """
+    Re-queues a previously processed file after it changes on disk. PDFs are re-indexed
+    incrementally (see plan_pdf_reindex); images are replaced once their new analysis is ready.
+    """
+    global PROCESSED_FILES
+    if not is_valid_file(file_path):
+        return
+
+    with PROCESSING_LOCK:
+        # Files still queued will read the new bytes anyway; unknown files arrive via on_created.
+        if file_path in QUEUED_FILES or file_path not in PROCESSED_FILES:
+            return
+        PROCESSED_FILES.remove(file_path)
+        if not file_path.lower().endswith('.pdf'):
+            REPLACED_IMAGES.add(file_path)
+
+    process_file_if_new(file_path)
+
+def _forget_in_manifest(file_paths: list[str] = (), directory: str = None):
+    try:
+        file_manifest.remove(file_paths)
+        if directory:
+            file_manifest.remove_under(directory)
+    except Exception as e:
+        logging.warning(f"Could not update the file manifest: {e}")
 
 def handle_deleted_file(file_path: str):
-    """Removes a file from the processed set and the database."""
+    """Removes a file from the processed set, the database and the file manifest."""
     global PROCESSED_FILES
     with PROCESSING_LOCK:
         if file_path in PROCESSED_FILES:
             PROCESSED_FILES.remove(file_path)
     delete_item(file_path)
+    _forget_in_manifest([file_path])
+
+def handle_deleted_directory(directory: str):
+    """Removes every file below a deleted (or moved-away) directory from the processed set and the database."""
+    global PROCESSED_FILES
+    prefix = os.path.join(directory, "")
+    with PROCESSING_LOCK:
+        PROCESSED_FILES = {file_path for file_path in PROCESSED_FILES if not file_path.startswith(prefix)}
+    removed = delete_directory(directory)
+    _forget_in_manifest(directory=directory)
+    logging.info(f"Directory '{directory}' removed; dropped {removed} file(s) from the index.")
 
 class FileEventHandler(FileSystemEventHandler):
     def on_created(self, event):
@@ -136,34 +614,140 @@ class FileEventHandler(FileSystemEventHandler):
             process_file_if_new(event.src_path)
 
     def on_moved(self, event):
-        if not event.is_directory:
+        if event.is_directory:
+            handle_deleted_directory(event.src_path)
+            for root, _, files in os.walk(event.dest_path):
+                for filename in files:
+                    process_file_if_new(os.path.join(root, filename))
+        else:
             handle_deleted_file(event.src_path)
             process_file_if_new(event.dest_path)
 
-    def on_deleted(self, event):
+    def on_modified(self, event):
         if not event.is_directory:
+            handle_modified_file(event.src_path)
+
+    def on_deleted(self, event):
+        if event.is_directory:
+            handle_deleted_directory(event.src_path)
+        else:
             handle_deleted_file(event.src_path)
 
+def reconcile_manifest(paths: list[str], scanner: DirectoryScanner = None):
+    """
+    Diffs the watched trees against the file manifest, so a restart only processes what changed while the
+    monitor was stopped. Unchanged files are marked as processed without being read, new and changed files are
+    queued, and files that disappeared are removed from the index. A file whose mtime or inode changed but whose
+    size and bytes didn't (a touch, a copy back into place) is just re-recorded.
+    The file list comes from a full pass of `scanner`, which leaves it primed for the safety-net poller.
+    """
+    global PROCESSED_FILES
+    started = time.monotonic()
+    scanner = scanner or DirectoryScanner(paths, is_supported_filename)
+    collection = get_collection()
+    index_is_empty = collection is not None and collection.count() == 0
+
+    recorded = {}
+    for path in paths:
+        if not os.path.isdir(path):
+            continue  # Keep the entries of a missing root (e.g. an unmounted drive) rather than deleting its files
+        entries = file_manifest.entries_under(path)
+        if entries and index_is_empty:
+            logging.warning(f"The index is empty but the file manifest lists files under {path}; re-indexing them.")
+            file_manifest.remove_under(path)
+            entries = {}
+        recorded.update(entries)
+
+    unchanged, touched, new_files, changed = [], [], [], []
+    for file_path in scanner.scan()["added"]:
+        if SHUTDOWN_EVENT.is_set():
+            return
+        entry = recorded.pop(file_path, None)
+        try:
+            file_signature = file_manifest.signature(os.stat(file_path))
+        except OSError:
+            continue  # Vanished or unreadable; the watcher or the next poll will catch up
+        if entry is None:
+            new_files.append(file_path)
+        elif file_signature == tuple(entry[:3]):
+            unchanged.append(file_path)
+        elif file_signature[1] == entry[1] and entry[3] and _content_hash(file_path) == entry[3]:
+            touched.append((file_path, file_signature, entry[3]))
+        else:
+            changed.append(file_path)
+
+    # Whatever is left in the manifest is gone from disk
+    deleted = list(recorded)
+    if deleted:
+        delete_items(deleted)
+        _forget_in_manifest(deleted)
+    file_manifest.record_many(touched)
+    with PROCESSING_LOCK:
+        PROCESSED_FILES.update(unchanged)
+        PROCESSED_FILES.update(file_path for file_path, _, _ in touched)
+
+    # Changed images are replaced once re-analyzed; changed PDFs are re-indexed page by page (see plan_pdf_reindex)
+    with PROCESSING_LOCK:
+        REPLACED_IMAGES.update(file_path for file_path in changed if not file_path.lower().endswith('.pdf'))
+    for file_path in new_files + changed:
+        if SHUTDOWN_EVENT.is_set():
+            return
+        process_file_if_new(file_path)
+
+    logging.info(
+        f"Reconciled watched paths with the file manifest in {time.monotonic() - started:.1f}s: "
+        f"{len(unchanged) + len(touched)} unchanged, {len(new_files)} new, "
+        f"{len(changed)} changed, {len(deleted)} deleted."
+    )
+
+def _apply_scan(result: dict):
+    """Handles the files and directories a safety-net scan found added or removed."""
+    for directory in result["removed_directories"]:
+        handle_deleted_directory(directory)
+    with PROCESSING_LOCK:
+        removed_files = [file_path for file_path in result["removed_files"] if file_path in PROCESSED_FILES]
+    for file_path in removed_files:
+        handle_deleted_file(file_path)
+    for file_path in result["added"]:
+        if SHUTDOWN_EVENT.is_set():
+            return
+        process_file_if_new(file_path)
+
 def polling_safety_net(paths: list[str]):
-    """Periodically scans watched paths to catch any missed file events."""
+    """
+    Reconciles the watched paths with the file manifest, then periodically scans them to catch any missed file
+    events. Scans are incremental (see DirectoryScanner) and limited to POLLING_TIME_BUDGET_SECONDS each.
+    """
+    scanner = DirectoryScanner(paths, is_supported_filename)
+    try:
+        reconcile_manifest(paths, scanner)
+    except Exception as e:
+        logging.error(f"Error reconciling the file manifest: {e}")
+        scanner = DirectoryScanner(paths, is_supported_filename)  # So the first poll lists everything again
+
     logging.info(f"Safety net poller started. Will scan every {POLLING_INTERVAL_SECONDS} seconds.")
-    while not SHUTDOWN_EVENT.is_set():
+    while not SHUTDOWN_EVENT.wait(POLLING_INTERVAL_SECONDS):
         try:
-            for path in paths:
-                if os.path.exists(path):
-                    for root, _, files in os.walk(path):
-                        for filename in files:
-                            file_path = os.path.join(root, filename)
-                            process_file_if_new(file_path)
+            result = scanner.scan(POLLING_TIME_BUDGET_SECONDS)
+            _apply_scan(result)
+            stats = result["stats"]
+            found = stats["added"] + stats["removed"]
+            logging.log(
+                logging.INFO if found or not result["complete"] else logging.DEBUG,
+                f"Safety net scan: {stats['directories_listed']} directories listed, "
+                f"{stats['directories_unchanged']} unchanged, {stats['added']} files added, "
+                f"{stats['removed']} removed in {stats['seconds']:.2f}s"
+                + ("" if result["complete"] else " (pass continues on the next poll)")
+            )
         except Exception as e:
             logging.error(f"Error during polling safety net: {e}")
-        SHUTDOWN_EVENT.wait(POLLING_INTERVAL_SECONDS)
 
 def main(interactive: bool = False):
     logging.info("Starting Context Background Monitor...")
     logging.info(f"Watching for new files in: {PATHS_TO_WATCH}")
 
-    # 1. Start Polling Safety Net
+    # 1. Start the ingestion pipeline and the Polling Safety Net
+    start_ingest_workers()
     poller_thread = threading.Thread(target=polling_safety_net, args=(PATHS_TO_WATCH,))
     poller_thread.start()
 
@@ -189,11 +773,13 @@ def main(interactive: bool = False):
 
     observer.join()
     poller_thread.join()
+    stop_ingest_workers()
     logging.info("--- Monitor stopped successfully. ---")
 
 if __name__ == "__main__":
     main(interactive=True)
 
 def get_active_thread_count() -> int:
-    """Returns the number of active file processing threads."""
-    return getattr(ACTIVE_PROCESSING_THREADS, 'count', 0)
\ No newline at end of file
+    """Returns the number of files currently queued or being processed."""
+    with PROCESSING_LOCK:
+        return len(QUEUED_FILES)
\ No newline at end of file
@@ -0,0 +1,199 @@
+# src/analysis_cache.py
+
+import os
+import json
+import time
+import hashlib
+import threading
+import numpy as np
+
+from src.config import ANALYSIS_CACHE_ENABLED, ANALYSIS_CACHE_MAX_BYTES
+from src.sqlite_pool import get_connection
+
+DB_FILE = "analysis_cache.db"
+DB_PATH = os.path.join(os.path.dirname(__file__), '..', DB_FILE)  # DB in project root
+
+HASH_CHUNK_SIZE = 1024 * 1024  # Files are hashed in 1 MB reads so large PDFs never sit in memory
+
+_LOCK = threading.Lock()
+_TOTAL_BYTES = None  # Lazily loaded sum of entries.size_bytes, kept in step with inserts and evictions
+_STATS = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+
+
+def init_db():
+    """Creates the cache table if it doesn't exist."""
+    with get_connection(DB_PATH) as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS entries (
+                content_hash TEXT NOT NULL,
+                user_caption TEXT NOT NULL,
+                records TEXT NOT NULL,
+                vectors BLOB NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (content_hash, user_caption)
+            )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_last_access ON entries (last_access)")
+        conn.commit()
+
+
+def file_content_hash(file_path: str) -> str:
+    """Returns the BLAKE2b digest of a file's bytes, read in streaming chunks."""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _total_bytes(conn) -> int:
+    global _TOTAL_BYTES
+    if _TOTAL_BYTES is None:
+        _TOTAL_BYTES = conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM entries").fetchone()[0]
+    return _TOTAL_BYTES
+
+
+def _restore_records(records: list[dict], vectors: np.ndarray, file_path: str, user_caption: str) -> list[dict]:
+    """Rebuilds analysis results for `file_path` from cached records (which are stored path-free)."""
+    results = []
+    for record, vector in zip(records, vectors):
+        result = {
+            "file_path": file_path,
+            "ocr_text": record["ocr_text"],
+            "tags": record["tags"],
+            "user_caption": user_caption,
+            "vector": vector.tolist()
+        }
+        if "page_num" in record:
+            result["file_path"] = f"{file_path}_page_{record['page_num']}"
+            result["original_pdf_path"] = file_path
+            result["page_num"] = record["page_num"]
+            result["page_fingerprint"] = record.get("page_fingerprint", "")
+        results.append(result)
+    return results
+
+
+def lookup(content_hash: str, file_path: str, user_caption: str = None) -> list[dict] | None:
+    """
+    Returns cached analysis results for a file with this content hash, re-keyed to `file_path`.
+    Images yield a single-item list and PDFs one item per page. Returns None on a miss.
+    """
+    if not ANALYSIS_CACHE_ENABLED:
+        return None
+
+    user_caption = user_caption or ""
+    with _LOCK, get_connection(DB_PATH) as conn:
+        row = conn.execute(
+            "SELECT records, vectors FROM entries WHERE content_hash = ? AND user_caption = ?",
+            (content_hash, user_caption)
+        ).fetchone()
+        if row is None:
+            _STATS["misses"] += 1
+            return None
+
+        conn.execute(
+            "UPDATE entries SET last_access = ? WHERE content_hash = ? AND user_caption = ?",
+            (time.time(), content_hash, user_caption)
+        )
+        conn.commit()
+        _STATS["hits"] += 1
+
+    records = json.loads(row[0])
+    vectors = np.frombuffer(row[1], dtype=np.float32).reshape(len(records), -1)
+    return _restore_records(records, vectors, file_path, user_caption)
+
+
+def contains(content_hash: str, user_caption: str = None) -> bool:
+    """
+    Checks for an entry without reading or touching it, e.g. from an extraction worker process, which then leaves
+    the lookup to the parent. Not counted in the hit/miss stats; see count_miss.
+    """
+    if not ANALYSIS_CACHE_ENABLED:
+        return False
+    with get_connection(DB_PATH) as conn:
+        return conn.execute(
+            "SELECT 1 FROM entries WHERE content_hash = ? AND user_caption = ?", (content_hash, user_caption or "")
+        ).fetchone() is not None
+
+
+def count_miss():
+    """Counts a miss found with contains() (hits are counted by the lookup that follows)."""
+    if not ANALYSIS_CACHE_ENABLED:
+        return
+    with _LOCK:
+        _STATS["misses"] += 1
+
+
+def store(content_hash: str, user_caption: str, results: list[dict]):
+    """Caches the analysis results of one file, evicting least recently used entries beyond the size limit."""
+    global _TOTAL_BYTES
+    if not ANALYSIS_CACHE_ENABLED or not results:
+        return
+
+    user_caption = user_caption or ""
+    records = []
+    for result in results:
+        record = {"ocr_text": result["ocr_text"], "tags": result["tags"]}
+        if "page_num" in result:
+            record["page_num"] = result["page_num"]
+            record["page_fingerprint"] = result.get("page_fingerprint", "")
+        records.append(record)
+    records_json = json.dumps(records)
+    # CLIP vectors are float32, so storing them as float32 bytes round-trips exactly.
+    vectors = np.asarray([result["vector"] for result in results], dtype=np.float32).tobytes()
+    size_bytes = len(records_json) + len(vectors)
+
+    with _LOCK, get_connection(DB_PATH) as conn:
+        total_bytes = _total_bytes(conn)
+        previous = conn.execute(
+            "SELECT size_bytes FROM entries WHERE content_hash = ? AND user_caption = ?",
+            (content_hash, user_caption)
+        ).fetchone()
+        conn.execute(
+            "INSERT OR REPLACE INTO entries (content_hash, user_caption, records, vectors, size_bytes, last_access) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (content_hash, user_caption, records_json, vectors, size_bytes, time.time())
+        )
+        total_bytes += size_bytes - (previous[0] if previous else 0)
+        _STATS["stores"] += 1
+
+        # --- LRU eviction ---
+        while total_bytes > ANALYSIS_CACHE_MAX_BYTES:
+            oldest = conn.execute(
+                "SELECT content_hash, user_caption, size_bytes FROM entries ORDER BY last_access LIMIT 100"
+            ).fetchall()
+            if not oldest:
+                break
+            for old_hash, old_caption, old_size in oldest:
+                if total_bytes <= ANALYSIS_CACHE_MAX_BYTES:
+                    break
+                conn.execute("DELETE FROM entries WHERE content_hash = ? AND user_caption = ?", (old_hash, old_caption))
+                total_bytes -= old_size
+                _STATS["evictions"] += 1
+
+        conn.commit()
+        _TOTAL_BYTES = total_bytes
+
+
+def get_cache_stats() -> dict:
+    """Returns hit/miss/eviction counters and the current cache size."""
+    with _LOCK, get_connection(DB_PATH) as conn:
+        entries = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        total_bytes = _total_bytes(conn)
+        stats = dict(_STATS)
+
+    lookups = stats["hits"] + stats["misses"]
+    stats.update({
+        "enabled": ANALYSIS_CACHE_ENABLED,
+        "entries": entries,
+        "size_bytes": total_bytes,
+        "max_bytes": ANALYSIS_CACHE_MAX_BYTES,
+        "hit_rate": round(stats["hits"] / lookups, 3) if lookups else 0.0,
+    })
+    return stats
+
+
+# --- Initialize DB if not present ---
+if not os.path.exists(DB_PATH):
+    init_db()
@@ -17,5 +17,88 @@ SUPPORTED_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.pdf')
 # File patterns to ignore during scanning (e.g., temporary download files).
 IGNORED_PATTERNS = ('.tmp', '.crdownload', '.part')
 
+# --- OCR ---
+# "pytesseract" runs the tesseract CLI per image; "tesserocr" keeps an engine resident per worker thread
+# (requires the optional `tesserocr` package).
+OCR_BACKEND = "pytesseract"
+TESSERACT_LANGUAGE = "eng"
+TESSDATA_PATH = None  # Directory containing *.traineddata for tesserocr; None uses tesseract's default.
+
 # --- Performance Tuning ---
-POLLING_INTERVAL_SECONDS = 150 # How often the safety-net poller runs.
\ No newline at end of file
+POLLING_INTERVAL_SECONDS = 150 # How often the safety-net poller runs.
+# Max time one poll spends scanning. An unfinished scan resumes on the next poll; None scans to the end.
+POLLING_TIME_BUDGET_SECONDS = 5
+# Pages rendered and held in memory at once while analyzing a PDF.
+PDF_PAGE_CHUNK_SIZE = 32
+# Batch size passed to the embedding model when encoding images or texts.
+EMBEDDING_BATCH_SIZE = 16
+
+# Max items written to ChromaDB per add call.
+DB_WRITE_BATCH_SIZE = 256
+
+# --- Models ---
+# CLIP and spaCy load on first use. With this on, the API starts loading them in the background at startup.
+WARM_UP_MODELS_ON_STARTUP = True
+
+# How CLIP runs. "sentence_transformers" is fp32 PyTorch (uses CUDA when available); "onnx_int8" runs both
+# towers in ONNX Runtime with int8 weights, which is much faster on CPU-only machines.
+# The ONNX models are exported into ONNX_MODEL_DIR on first use (needs torch once), then reused.
+EMBEDDING_BACKEND = "sentence_transformers"
+ONNX_MODEL_DIR = os.path.join(os.path.dirname(__file__), '..', 'onnx_models')
+ONNX_NUM_THREADS = None  # Threads per ONNX Runtime session; None lets it use every core.
+
+# --- Entity Extraction (spaCy NER) ---
+# en_core_web_sm components not loaded for tagging. ner reads none of their outputs, so tags are unchanged.
+# Adding "parser" and "tok2vec" (ner has its own tok2vec) is several times faster again, but without the
+# parser's sentence boundaries an entity may occasionally span two sentences, changing some tags.
+NER_EXCLUDED_COMPONENTS = ["tagger", "attribute_ruler", "lemmatizer", "senter"]
+NER_BATCH_SIZE = 64        # Texts per nlp.pipe batch.
+NER_N_PROCESS = 1          # nlp.pipe processes. Keep at 1 when extraction already runs in a process pool.
+NER_MAX_CHARS = 100000     # Longer texts are split at whitespace into chunks of at most this size.
+
+# --- Ingestion Queue ---
+INGEST_QUEUE_SIZE = 1000        # Max files waiting at each ingestion stage before new detections block.
+INGEST_WORKERS = 2              # Embedding worker threads; they share one embedding model.
+EXTRACTION_WORKERS = None       # Processes for decode/OCR/NER. None uses one per CPU core.
+EXTRACTION_QUEUE_SIZE = 64      # Max files extracted (or being extracted) ahead of the embedding stage.
+IMAGE_BATCH_SIZE = 16           # Max images from different files analyzed together in one batch.
+IMAGE_BATCH_WAIT_SECONDS = 0.5  # How long a worker waits for more ready images to fill a batch.
+
+# --- Analysis Cache ---
+# Results (OCR text, tags, vectors) keyed by file content hash, so identical bytes are analyzed once.
+ANALYSIS_CACHE_ENABLED = True
+ANALYSIS_CACHE_MAX_BYTES = 512 * 1024 * 1024  # Least recently used entries are evicted beyond this size.
+
+# --- Query Embedding Cache ---
+# Text -> vector encodings shared by /search and /graph/entity, so repeated queries skip the model.
+QUERY_CACHE_SIZE = 1024
+QUERY_CACHE_TTL_SECONDS = 3600
+
+# --- Metadata Cache ---
+# ChromaDB id -> metadata for map views; entries are dropped whenever the id is added or deleted.
+METADATA_CACHE_SIZE = 4096
+METADATA_CACHE_TTL_SECONDS = 600
+
+# --- Search ---
+SEARCH_WORKERS = 2                   # Threads running query encoding + ChromaDB queries off the event loop.
+SEARCH_BATCH_WINDOW_SECONDS = 0.01   # Concurrent queries arriving within this window share one encode call.
+SEARCH_MAX_BATCH_SIZE = 32           # A batch is dispatched immediately once it reaches this many queries.
+HYBRID_CANDIDATES = 50               # Results taken from each retriever (vector, full-text) before hybrid fusion.
+RRF_K = 60                           # Reciprocal rank fusion constant: a result scores 1 / (RRF_K + rank) per retriever.
+
+# --- Entity Graph ---
+GRAPH_PAGE_SIZE = 500       # Files per /graph/all page (and per chunk when streaming).
+GRAPH_TOP_ENTITIES = 200    # /graph/all only includes the entities tagged on the most files.
+
+# --- Profiling ---
+# Profiles the next PROFILE_NEXT_FILES ingested files and PROFILE_NEXT_REQUESTS API requests, writing a
+# .pstats (cprofile mode) and a .collapsed flamegraph file per profile to PROFILING_DIR. 0 is off and -1 profiles
+# everything until switched off. Can also be changed at runtime with POST /admin/profiling.
+# A file gets one profile per stage (extraction, embedding); the threshold applies to the stages' total.
+PROFILING_MODE = "cprofile"              # "cprofile" (every call, exact counts) or "sampling" (stack samples, low overhead)
+PROFILE_NEXT_FILES = 0
+PROFILE_NEXT_REQUESTS = 0
+PROFILING_THRESHOLD_SECONDS = 0          # Only keep profiles of files/requests that took at least this long.
+PROFILING_SAMPLE_INTERVAL_SECONDS = 0.005
+PROFILING_ENDPOINTS = ("/search", "/graph", "/maps", "/index-file")  # Path prefixes of the requests that can be profiled.
+PROFILING_DIR = os.path.join(os.path.dirname(__file__), '..', 'profiles')
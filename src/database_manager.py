@@ -1,41 +1,86 @@
 
-import chromadb
 import os
-from src.pipeline import EMBEDDING_MODEL
+import threading
+from src.pipeline import get_embedding_model
+from src.config import (
+    DB_WRITE_BATCH_SIZE, QUERY_CACHE_SIZE, QUERY_CACHE_TTL_SECONDS,
+    METADATA_CACHE_SIZE, METADATA_CACHE_TTL_SECONDS, GRAPH_PAGE_SIZE, GRAPH_TOP_ENTITIES, RRF_K
+)
+from src import index_store, metrics
+from src.query_cache import TTLCache
 
 
 DB_PATH = "chroma_db" 
 COLLECTION_NAME = "context_collection"
 
-print("Initializing ChromaDB...")
-try:
-    CLIENT = chromadb.PersistentClient(path=DB_PATH)    
-    COLLECTION = CLIENT.get_or_create_collection(
-        name=COLLECTION_NAME,
-        metadata={"hnsw:space": "cosine"}  # Use cosine similarity instead of L2
-    )
-    print("ChromaDB initialized successfully with cosine similarity.")
-    
-except Exception as e:
-    print(f"Error initializing ChromaDB: {e}")
-    CLIENT = None
-    COLLECTION = None
+# The ChromaDB client is opened on first use (see get_collection), not at import time.
+CLIENT = None
+COLLECTION = None
+_COLLECTION_LOCK = threading.Lock()
+
+INDEX_REBUILD_PAGE_SIZE = 1000
+
+QUERY_EMBEDDING_CACHE = TTLCache(max_entries=QUERY_CACHE_SIZE, ttl_seconds=QUERY_CACHE_TTL_SECONDS)
+METADATA_CACHE = TTLCache(max_entries=METADATA_CACHE_SIZE, ttl_seconds=METADATA_CACHE_TTL_SECONDS)
+
+_DB_WRITE_SECONDS = metrics.STAGE_SECONDS.labels("db_write")
+_DB_DELETE_SECONDS = metrics.STAGE_SECONDS.labels("db_delete")
+_QUERY_ENCODE_SECONDS = metrics.STAGE_SECONDS.labels("query_encode")
+_VECTOR_QUERY_SECONDS = metrics.STAGE_SECONDS.labels("vector_query")
+_LEXICAL_QUERY_SECONDS = metrics.STAGE_SECONDS.labels("lexical_query")
+
+def _iter_collection_metadatas(collection):
+    """Yields the metadata of every entry in the collection, one page of results at a time."""
+    offset = 0
+    while True:
+        batch = collection.get(include=["metadatas"], limit=INDEX_REBUILD_PAGE_SIZE, offset=offset)
+        if not batch["ids"]:
+            return
+        yield [
+            {**(metadata or {}), "page_id": page_id, "file_path": (metadata or {}).get("file_path", page_id)}
+            for page_id, metadata in zip(batch["ids"], batch["metadatas"])
+        ]
+        offset += len(batch["ids"])
+
+def sync_index(collection):
+    """Rebuilds the SQLite side index from ChromaDB if it is missing, out of step or from an older schema."""
+    try:
+        if index_store.needs_rebuild(collection.count()):
+            print("Rebuilding the page index from ChromaDB...")
+            index_store.rebuild(_iter_collection_metadatas(collection))
+            print("Page index rebuilt.")
+    except Exception as e:
+        print(f"Error rebuilding the page index: {e}")
+
+def get_collection():
+    """
+    Returns the ChromaDB collection, opening the client and syncing the side index on first call.
+    Returns None if ChromaDB could not be initialized (the next call tries again).
+    """
+    global CLIENT, COLLECTION
+    if COLLECTION is None:
+        with _COLLECTION_LOCK:
+            if COLLECTION is None:
+                print("Initializing ChromaDB...")
+                try:
+                    import chromadb
+                    client = chromadb.PersistentClient(path=DB_PATH)
+                    collection = client.get_or_create_collection(
+                        name=COLLECTION_NAME,
+                        metadata={"hnsw:space": "cosine"}  # Use cosine similarity instead of L2
+                    )
+                    print("ChromaDB initialized successfully with cosine similarity.")
+                except Exception as e:
+                    print(f"Error initializing ChromaDB: {e}")
+                    return None
+
+                sync_index(collection)
+                CLIENT, COLLECTION = client, collection
+    return COLLECTION
 
 # CORE DATABASE FUNCTIONS
-def add_item(analysis_result: dict):
-    if not COLLECTION:
-        print("Database not initialized. Cannot add item.")
-        return
-
-    file_path = analysis_result['file_path']
-
-    # Prevent duplicates
-    if COLLECTION.get(ids=[file_path])['ids']:
-        print(f"Item '{os.path.basename(file_path)}' already exists in the database. Skipping.")
-        return
-
-    # --- Normalize tags ---
-    raw_tags = analysis_result.get("tags", [])
+def _tags_to_string(raw_tags) -> str:
+    """Normalizes tags (a list or a comma-separated string) to one lowercase comma-joined string."""
     if isinstance(raw_tags, str):
         # Split by comma and strip whitespace, lowercase for consistency
         tag_list = [t.strip().lower() for t in raw_tags.split(",") if t.strip()]
@@ -45,88 +90,328 @@ def add_item(analysis_result: dict):
         tag_list = [] # Default to empty list if format is unexpected
 
     # ChromaDB metadata values must be primitive types. Convert the list of tags to a single string.
-    tags_as_string = ", ".join(tag_list)
+    return ", ".join(tag_list)
+
+def _build_metadata(analysis_result: dict) -> dict:
+    file_path = analysis_result['file_path']
+    metadata = {
+        "file_path": analysis_result.get("original_pdf_path", file_path), # Use original path for PDFs
+        "page_id": file_path, # This is the unique ID for the item (image path or page path)
+        "ocr_text": analysis_result.get("ocr_text", ""),
+        "tags": _tags_to_string(analysis_result.get("tags", [])),
+        "user_caption": analysis_result.get("user_caption", "")
+    }
+    if analysis_result.get("page_fingerprint"):
+        metadata["page_fingerprint"] = analysis_result["page_fingerprint"] # Lets edited PDFs re-index only changed pages
+    return metadata
+
+def add_items(analysis_results: list[dict]) -> int:
+    """
+    Adds many analysis results at once: one existence check for the whole batch, then writes
+    in chunks of DB_WRITE_BATCH_SIZE. Items already in the database are skipped.
+    Returns the number of items added.
+    """
+    collection = get_collection()
+    if not collection:
+        print("Database not initialized. Cannot add item.")
+        return 0
+    if not analysis_results:
+        return 0
 
+    # Prevent duplicates, both against the database and within the batch itself
+    unique_ids = list(dict.fromkeys(result['file_path'] for result in analysis_results))
     try:
-        COLLECTION.add(
-            ids=[file_path],
-            embeddings=[analysis_result['vector']],
-            metadatas=[{
-                "file_path": analysis_result.get("original_pdf_path", file_path), # Use original path for PDFs
-                "page_id": file_path, # This is the unique ID for the item (image path or page path)
-                "ocr_text": analysis_result.get("ocr_text", ""),
-                "tags": tags_as_string,
-                "user_caption": analysis_result.get("user_caption", "")
-            }]
-        )
-        print(f"✅ Successfully added '{os.path.basename(file_path)}' to the database.")
+        existing_ids = set(collection.get(ids=unique_ids, include=[])['ids'])
     except Exception as e:
-        print(f"Error adding item {file_path} to DB: {e}")
+        print(f"Error checking for existing items in DB: {e}")
+        return 0
+
+    new_results, seen_ids = [], set(existing_ids)
+    for result in analysis_results:
+        if result['file_path'] not in seen_ids:
+            seen_ids.add(result['file_path'])
+            new_results.append(result)
+
+    for existing_id in existing_ids:
+        print(f"Item '{os.path.basename(existing_id)}' already exists in the database. Skipping.")
+
+    added = 0
+    for chunk_start in range(0, len(new_results), DB_WRITE_BATCH_SIZE):
+        chunk = new_results[chunk_start:chunk_start + DB_WRITE_BATCH_SIZE]
+        try:
+            metadatas = [_build_metadata(result) for result in chunk]
+            with _DB_WRITE_SECONDS.time():
+                collection.add(
+                    ids=[result['file_path'] for result in chunk],
+                    embeddings=[result['vector'] for result in chunk],
+                    metadatas=metadatas
+                )
+                index_store.index_pages(metadatas)
+            METADATA_CACHE.discard(result['file_path'] for result in chunk)
+            metrics.ITEMS_WRITTEN.inc(len(chunk))
+            added += len(chunk)
+        except Exception as e:
+            metrics.ERRORS.labels("db_write").inc()
+            print(f"Error adding {len(chunk)} item(s) to DB: {e}")
+
+    if added == 1:
+        print(f"✅ Successfully added '{os.path.basename(new_results[0]['file_path'])}' to the database.")
+    elif added:
+        print(f"✅ Successfully added {added} items to the database.")
+    return added
+
+def add_item(analysis_result: dict):
+    """Adds a single analysis result. See add_items for the bulk version."""
+    add_items([analysis_result])
    
    
+def encode_query(query_text: str) -> list[float]:
+    """Returns the embedding for a text query, reusing a cached encoding when available."""
+    query_vector = QUERY_EMBEDDING_CACHE.get(query_text)
+    if query_vector is None:
+        with _QUERY_ENCODE_SECONDS.time():
+            query_vector = get_embedding_model().encode_texts([query_text])[0].tolist()
+        QUERY_EMBEDDING_CACHE.put(query_text, query_vector)
+    return query_vector
+
+def encode_queries(query_texts: list[str]) -> list[list[float]]:
+    """Encodes many text queries, reusing cached encodings and batching the rest into one model call."""
+    query_vectors = [QUERY_EMBEDDING_CACHE.get(query_text) for query_text in query_texts]
+    missing_texts = list(dict.fromkeys(
+        query_text for query_text, query_vector in zip(query_texts, query_vectors) if query_vector is None
+    ))
+    if missing_texts:
+        with _QUERY_ENCODE_SECONDS.time():
+            encoded = dict(zip(missing_texts, get_embedding_model().encode_texts(missing_texts).tolist()))
+        for query_text, query_vector in encoded.items():
+            QUERY_EMBEDDING_CACHE.put(query_text, query_vector)
+        query_vectors = [query_vector or encoded[query_text] for query_text, query_vector in zip(query_texts, query_vectors)]
+    return query_vectors
+
+def search_many(query_texts: list[str], n_results: int = 3) -> list[dict]:
+    """
+    Runs several searches with one batched encode and one ChromaDB query.
+    Returns one result dict per query, shaped like the result of search().
+    """
+    collection = get_collection()
+    if not collection or not get_embedding_model():
+        print("Database or embedding model not initialized.")
+        return [{} for _ in query_texts]
+
+    unique_texts = list(dict.fromkeys(query_texts))
+    print(f"\n Searching for {len(unique_texts)} queries: {unique_texts}")
+
+    query_embeddings = encode_queries(unique_texts)
+    with _VECTOR_QUERY_SECONDS.time():
+        results = collection.query(
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            include=["metadatas", "distances"]
+        )
+
+    per_text = {
+        query_text: {key: [results[key][index]] for key in ("ids", "metadatas", "distances")}
+        for index, query_text in enumerate(unique_texts)
+    }
+    print("Search complete.")
+    return [per_text[query_text] for query_text in query_texts]
+
 def search(query_text: str, n_results: int = 3) -> dict:
-    if not COLLECTION or not EMBEDDING_MODEL:
+    collection = get_collection()
+    if not collection or not get_embedding_model():
         print("Database or embedding model not initialized.")
         return {}
 
     print(f"\n Searching for: '{query_text}'")
     
-    query_vector = EMBEDDING_MODEL.encode(query_text).tolist()
+    query_vector = encode_query(query_text)
     
-    results = COLLECTION.query(
-        query_embeddings=[query_vector],
-        n_results=n_results,
-        include=["metadatas", "distances"] 
-    )
+    with _VECTOR_QUERY_SECONDS.time():
+        results = collection.query(
+            query_embeddings=[query_vector],
+            n_results=n_results,
+            include=["metadatas", "distances"] 
+        )
     
     print("Search complete.")
     return results
 
-def delete_item(file_path: str):
-    if not COLLECTION:
+def lexical_search(query_text: str, n_results: int = 3) -> dict:
+    """
+    Keyword search (BM25) over OCR text and user captions in the SQLite full-text index. Doesn't use the
+    embedding model, so exact identifiers, names and text past CLIP's 77-token limit are found too.
+    Returns a result dict like search(), but with relevance `scores` (0-1, the best hit is 1) instead of distances.
+    """
+    try:
+        with _LEXICAL_QUERY_SECONDS.time():
+            hits = index_store.search_text(query_text, n_results)
+    except Exception as e:
+        metrics.ERRORS.labels("lexical_query").inc()
+        print(f"Error in full-text search for '{query_text}': {e}")
+        return {}
+
+    metadata_by_id = get_metadata_for_ids([page_id for page_id, _ in hits])
+    hits = [(page_id, score) for page_id, score in hits if metadata_by_id[page_id]]  # Skip entries gone from ChromaDB
+    top_score = hits[0][1] if hits and hits[0][1] > 0 else 1.0
+    return {
+        "ids": [[page_id for page_id, _ in hits]],
+        "metadatas": [[metadata_by_id[page_id] for page_id, _ in hits]],
+        "scores": [[max(0.0, score / top_score) for _, score in hits]],
+    }
+
+def fuse_results(result_dicts: list[dict], n_results: int, k: int = RRF_K) -> dict:
+    """
+    Merges ranked result lists (search() or lexical_search() dicts for one query) with reciprocal rank fusion:
+    each entry scores the sum of 1 / (k + rank) over the lists it appears in. Scores are scaled so that
+    ranking first in every list gives 1. Returns a result dict with `scores`, like lexical_search().
+    """
+    fused, metadata_by_id = {}, {}
+    for result in result_dicts:
+        if not result or not result.get("ids"):
+            continue
+        for rank, (entry_id, metadata) in enumerate(zip(result["ids"][0], result["metadatas"][0]), start=1):
+            fused[entry_id] = fused.get(entry_id, 0.0) + 1.0 / (k + rank)
+            metadata_by_id.setdefault(entry_id, metadata)
+
+    best_possible = len(result_dicts) / (k + 1)
+    ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:n_results]
+    return {
+        "ids": [[entry_id for entry_id, _ in ranked]],
+        "metadatas": [[metadata_by_id[entry_id] for entry_id, _ in ranked]],
+        "scores": [[score / best_possible for _, score in ranked]],
+    }
+
+def delete_items(file_paths: list[str]) -> int:
+    """
+    Removes every entry (the image, or all pages of a PDF) for the given files, using the
+    `file_path` metadata so no page ids have to be guessed. Returns the number of files requested.
+    """
+    collection = get_collection()
+    if not collection:
         print(" Database not initialized. Cannot delete item.")
+        return 0
+
+    file_paths = list(dict.fromkeys(file_paths))
+    try:
+        for chunk_start in range(0, len(file_paths), DB_WRITE_BATCH_SIZE):
+            chunk = file_paths[chunk_start:chunk_start + DB_WRITE_BATCH_SIZE]
+            where = {"file_path": chunk[0]} if len(chunk) == 1 else {"file_path": {"$in": chunk}}
+            with _DB_DELETE_SECONDS.time():
+                collection.delete(where=where)
+                removed_ids = index_store.remove_files(chunk)
+            METADATA_CACHE.discard(removed_ids)
+    except Exception as e:
+        metrics.ERRORS.labels("db_delete").inc()
+        print(f" Error deleting {len(file_paths)} file(s) from DB: {e}")
+        return 0
+
+    if len(file_paths) == 1:
+        print(f" Successfully removed entries for '{os.path.basename(file_paths[0])}' from the database.")
+    elif file_paths:
+        print(f" Successfully removed entries for {len(file_paths)} files from the database.")
+    return len(file_paths)
+
+def delete_item(file_path: str):
+    """Removes a single file (image or every page of a PDF) from the database."""
+    delete_items([file_path])
+
+def delete_directory(directory: str) -> int:
+    """Removes every indexed file located anywhere below `directory`. Returns the number of files removed."""
+    try:
+        file_paths = index_store.files_under(directory)
+    except Exception as e:
+        print(f" Error looking up files under {directory}: {e}")
+        return 0
+    return delete_items(file_paths) if file_paths else 0
+
+def get_pdf_page_fingerprints(pdf_path: str) -> dict:
+    """
+    Returns {page_id: page_fingerprint} for every page stored for a PDF.
+    Pages indexed before fingerprints existed map to None.
+    """
+    collection = get_collection()
+    if not collection:
+        return {}
+
+    try:
+        results = collection.get(where={"file_path": pdf_path}, include=["metadatas"])
+    except Exception as e:
+        print(f"Error reading stored pages for {pdf_path}: {e}")
+        return {}
+
+    return {
+        page_id: (metadata or {}).get("page_fingerprint")
+        for page_id, metadata in zip(results["ids"], results["metadatas"])
+    }
+
+def delete_pages(page_ids: list[str]):
+    """Deletes specific entries (PDF pages, or images) by id."""
+    collection = get_collection()
+    if not collection or not page_ids:
         return
-    
+
     try:
-        if file_path.lower().endswith('.pdf'):
-            possible_page_ids = [f"{file_path}_page_{i+1}" for i in range(500)] 
-            COLLECTION.delete(ids=possible_page_ids)        
-        COLLECTION.delete(ids=[file_path])
-        print(f" Successfully removed entries for '{os.path.basename(file_path)}' from the database.")
+        collection.delete(ids=page_ids)
+        index_store.remove_pages(page_ids)
+        METADATA_CACHE.discard(page_ids)
     except Exception as e:
-        print(f" Error deleting item {file_path} from DB: {e}")
-    
-def get_graph_for_entity(entity_name: str, limit: int = 25) -> dict:
-    if not COLLECTION:
+        print(f" Error deleting {len(page_ids)} page(s) from DB: {e}")
+
+def get_metadata_for_ids(ids: list[str]) -> dict:
+    """
+    Returns {id: metadata} for the given ChromaDB ids, fetching every uncached id in one call.
+    Ids that aren't in the database map to an empty dict. Callers get their own copies.
+    """
+    metadata_by_id, missing_ids = {}, []
+    for entry_id in dict.fromkeys(ids):
+        metadata = METADATA_CACHE.get(entry_id)
+        if metadata is None:
+            missing_ids.append(entry_id)
+        else:
+            metadata_by_id[entry_id] = metadata
+
+    collection = get_collection() if missing_ids else None
+    if collection:
+        try:
+            results = collection.get(ids=missing_ids, include=["metadatas"])
+            fetched = dict(zip(results["ids"], results["metadatas"]))
+        except Exception as e:
+            print(f"Error fetching metadata for {len(missing_ids)} item(s): {e}")
+            fetched = None
+        if fetched is not None:
+            for entry_id, metadata in fetched.items():
+                # Only ids that were found are cached: a cached miss could outlive an add_items that
+                # discarded it while this get was in flight, hiding the new item until the TTL ran out.
+                METADATA_CACHE.put(entry_id, metadata or {})
+                metadata_by_id[entry_id] = metadata or {}
+
+    return {entry_id: dict(metadata_by_id.get(entry_id, {})) for entry_id in ids}
+
+def get_graph_for_entity(entity_name: str, limit: int = 25, cursor: str = None) -> dict:
+    """
+    Builds the graph of pages tagged with an entity, using exact lookups in the inverted tag index.
+    Results are paginated: pass the returned `next_cursor` back as `cursor` to get the next page.
+    """
+    collection = get_collection()
+    if not collection:
         print("Database not initialized.")
         return {"nodes": [], "edges": []}
 
     print(f"\nGenerating graph for entity: '{entity_name}'")
-    query_tag = entity_name.lower()
+    query_tag = entity_name.lower().strip()
 
     try:
-        # The strategy is to fetch more results based on semantic similarity and then filter in Python.
-        # We must manually create the embedding to ensure it matches the model used for indexing (clip-ViT-B-32).
-        query_vector = EMBEDDING_MODEL.encode(entity_name).tolist()
-
-        results = COLLECTION.query(
-            query_embeddings=[query_vector],
-            include=["metadatas"],
-            n_results=limit * 5 # Fetch more to have a good pool for filtering
-        )
+        page_ids = index_store.pages_for_tag(query_tag, limit, after=cursor)
+        total_pages = index_store.count_pages_for_tag(query_tag)
+        results = collection.get(ids=page_ids, include=["metadatas"]) if page_ids else {"ids": [], "metadatas": []}
     except Exception as e:
         print(f"Error during query: {e}")
         return {"nodes": [], "edges": []}
 
-    if not results or not results.get("metadatas") or not results["metadatas"][0]:
-        return {"nodes": [], "edges": []}
-
-    # Filter the results in Python since the DB doesn't support substring matching in `where`.
-    # We check if the query_tag is a whole word in the comma-separated 'tags' string.
-    filtered_metadatas = [
-        md for md in results["metadatas"][0]
-        if query_tag in [tag.strip() for tag in md.get("tags", "").split(",")]
-    ][:limit]
+    # ChromaDB doesn't guarantee the order of get() results, so restore the index order.
+    metadata_by_id = dict(zip(results["ids"], results["metadatas"]))
+    filtered_metadatas = [metadata_by_id[page_id] for page_id in page_ids if metadata_by_id.get(page_id)]
+    next_cursor = page_ids[-1] if len(page_ids) == limit else None
 
     # --- Build Graph ---
     nodes = [{"id": entity_name, "label": entity_name, "type": "entity"}]
@@ -152,68 +437,66 @@ def get_graph_for_entity(entity_name: str, limit: int = 25) -> dict:
         edges.append({"from": entity_name, "to": file_id, "label": "mentions"})
 
     print(f"✅ Graph generated with {len(nodes)} nodes and {len(edges)} edges.")
-    return {"nodes": nodes, "edges": edges}
-
-def get_all_graph_data(limit: int = 50) -> dict:
-    """Get all entities and their relationships from the database."""
-    if not COLLECTION:
+    return {"nodes": nodes, "edges": edges, "total_pages": total_pages, "next_cursor": next_cursor}
+
+def get_all_graph_data(limit: int = GRAPH_PAGE_SIZE, cursor: str = None, top_entities: int = GRAPH_TOP_ENTITIES) -> dict:
+    """
+    Returns one page of the global entity graph, read from the materialized tag index.
+    Only the `top_entities` entities tagged on the most files are included; the first page carries
+    their nodes, and every page carries up to `limit` file nodes and their edges to those entities.
+    Pass the returned `next_cursor` back as `cursor` to get the next page.
+    """
+    collection = get_collection()
+    if not collection:
         print("Database not initialized.")
         return {"nodes": [], "edges": []}
 
-    print("\nGenerating graph for all entities...")
-
     try:
-        # Get all items from the database
-        all_results = COLLECTION.get(
-            include=["metadatas"],
-            limit=limit
-        )
+        entities = index_store.top_entities(top_entities)
+        if not entities:
+            return {"nodes": [], "edges": [], "total_entities": 0, "next_cursor": None}
+        min_degree = entities[-1][1]
+        page_ids, tag_edges = index_store.graph_page(min_degree, limit, after=cursor)
+        results = collection.get(ids=page_ids, include=["metadatas"]) if page_ids else {"ids": [], "metadatas": []}
     except Exception as e:
         print(f"Error during query: {e}")
         return {"nodes": [], "edges": []}
 
-    if not all_results or not all_results.get("metadatas"):
-        return {"nodes": [], "edges": []}
-
-    # Collect all unique entities and files
-    entities = set()
-    files = []
-    edges = []
+    nodes = []
+    if cursor is None:
+        nodes = [{"id": tag, "label": tag, "type": "entity", "degree": degree} for tag, degree in entities]
 
-    for metadata in all_results["metadatas"]:
-        file_id = metadata["page_id"]
-        file_label = os.path.basename(file_id)
-        
-        # Ensure tags are returned as a list
+    metadata_by_id = dict(zip(results["ids"], results["metadatas"]))
+    file_ids = set()
+    for page_id in page_ids:
+        metadata = metadata_by_id.get(page_id)
+        if not metadata:
+            continue
         tags_str = metadata.get('tags', '')
         if isinstance(tags_str, str) and tags_str:
             metadata['tags'] = [tag.strip() for tag in tags_str.split(',') if tag.strip()]
         else:
             metadata['tags'] = []
-
-        # Add file node
-        files.append({
-            "id": file_id,
-            "label": file_label,
+        nodes.append({
+            "id": page_id,
+            "label": os.path.basename(page_id),
             "type": "file",
             "metadata": metadata
         })
-
-        # Collect all entities from tags
-        for tag in metadata['tags']:
-            if tag.strip():
-                entities.add(tag.strip())
-
-    # Create entity nodes
-    entity_nodes = [{"id": entity, "label": entity, "type": "entity"} for entity in entities]
-
-    # Create edges between entities and files
-    for metadata in all_results["metadatas"]:
-        file_id = metadata["page_id"]
-        for tag in metadata.get('tags', []):
-            if tag.strip():
-                edges.append({"from": tag.strip(), "to": file_id, "label": "mentions"})
-
-    all_nodes = entity_nodes + files
-    print(f"✅ All entities graph generated with {len(all_nodes)} nodes and {len(edges)} edges.")
-    return {"nodes": all_nodes, "edges": edges}
\ No newline at end of file
+        file_ids.add(page_id)
+
+    # Pages ChromaDB returned no metadata for have no node, so their edges are left out too
+    edges = [{"from": tag, "to": page_id, "label": "mentions"} for tag, page_id in tag_edges if page_id in file_ids]
+    next_cursor = page_ids[-1] if len(page_ids) == limit else None
+    return {"nodes": nodes, "edges": edges, "total_entities": len(entities), "next_cursor": next_cursor}
+
+
+def iter_all_graph_data(page_size: int = GRAPH_PAGE_SIZE, top_entities: int = GRAPH_TOP_ENTITIES):
+    """Yields every page of the global entity graph in order, following the cursors."""
+    cursor = None
+    while True:
+        page = get_all_graph_data(limit=page_size, cursor=cursor, top_entities=top_entities)
+        yield page
+        cursor = page.get("next_cursor")
+        if not cursor:
+            break
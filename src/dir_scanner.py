@@ -0,0 +1,126 @@
+# src/dir_scanner.py
+
+import os
+import time
+
+from src import metrics
+
+# A directory modified this recently may change again within the same mtime tick after we list it,
+# so its mtime isn't trusted and it is listed again on the next pass.
+RACY_MTIME_SECONDS = 2.0
+
+
+class DirectoryScanner:
+    """
+    Finds files added to or removed from watched trees without listing every directory on every pass.
+    A directory's mtime changes whenever an entry is added, removed or renamed in it, so a directory whose
+    mtime is unchanged since the last pass is not listed again; only its known subdirectories are stat'ed,
+    since changes deeper down don't touch it. On a large, mostly static tree a pass is one stat per directory.
+
+    Passes can be spread over several scan() calls with a time budget; an unfinished pass resumes where it stopped.
+    Not thread-safe: use one scanner per thread.
+    """
+
+    def __init__(self, roots: list[str], accept_filename=None):
+        self.roots = list(roots)
+        self._accept = accept_filename or (lambda filename: True)
+        self._directories = {}  # path -> (mtime_ns or None, accepted file names, subdirectory names)
+        self._pending = []      # Directories left to visit in the current pass (a stack)
+        self.last_pass = {}     # Stats of the last completed pass
+        self._pass = self._new_pass_stats()
+
+    @staticmethod
+    def _new_pass_stats() -> dict:
+        return {"directories_listed": 0, "directories_unchanged": 0, "files_listed": 0, "added": 0, "removed": 0,
+                "seconds": 0.0, "calls": 0}
+
+    def scan(self, time_budget: float = None) -> dict:
+        """
+        Continues the current pass (or starts a new one) for at most `time_budget` seconds; None runs it to the end.
+        Returns {"added": [file paths], "removed_files": [file paths], "removed_directories": [directory paths],
+        "complete": whether the pass finished, "stats": this call's counts}. The first pass reports every file
+        as added. Watched roots that are missing are skipped, never reported as removed (e.g. an unmounted drive).
+        """
+        started = time.monotonic()
+        if not self._pending:
+            self._pending = [root for root in reversed(self.roots) if os.path.isdir(root)]
+        added, removed_files, removed_directories = [], [], []
+        stats = {"directories_listed": 0, "directories_unchanged": 0, "files_listed": 0}
+
+        while self._pending:
+            if time_budget is not None and time.monotonic() - started >= time_budget:
+                break
+            self._visit(self._pending.pop(), added, removed_files, removed_directories, stats)
+
+        complete = not self._pending
+        seconds = time.monotonic() - started
+        stats.update(added=len(added), removed=len(removed_files) + len(removed_directories), seconds=round(seconds, 4))
+        for key, value in stats.items():
+            self._pass[key] += value
+        self._pass["calls"] += 1
+        if complete:
+            self.last_pass = {**self._pass, "seconds": round(self._pass["seconds"], 4), "directories": len(self._directories)}
+            self._pass = self._new_pass_stats()
+
+        metrics.SCAN_SECONDS.observe(seconds)
+        metrics.SCAN_DIRECTORIES.labels("listed").inc(stats["directories_listed"])
+        metrics.SCAN_DIRECTORIES.labels("unchanged").inc(stats["directories_unchanged"])
+        return {
+            "added": added,
+            "removed_files": removed_files,
+            "removed_directories": removed_directories,
+            "complete": complete,
+            "stats": stats,
+        }
+
+    def _visit(self, directory: str, added: list, removed_files: list, removed_directories: list, stats: dict):
+        known = self._directories.get(directory)
+        try:
+            stat_result = os.stat(directory)
+        except FileNotFoundError:
+            if known is not None and directory not in self.roots:
+                removed_directories.append(directory)
+                self._forget(directory)
+            return
+        except OSError:
+            return  # Unreadable for now; keep what we knew
+
+        if known is not None and known[0] == stat_result.st_mtime_ns:
+            stats["directories_unchanged"] += 1
+            self._pending.extend(os.path.join(directory, name) for name in known[2])
+            return
+
+        files, subdirectories = set(), set()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirectories.add(entry.name)
+                        elif self._accept(entry.name):
+                            files.add(entry.name)
+                    except OSError:
+                        continue
+        except FileNotFoundError:
+            return  # Removed between the stat and the listing; the next pass reports it
+        except OSError:
+            return
+        stats["directories_listed"] += 1
+        stats["files_listed"] += len(files)
+
+        previous_files, previous_subdirectories = (known[1], known[2]) if known else (set(), set())
+        added.extend(os.path.join(directory, name) for name in sorted(files - previous_files))
+        removed_files.extend(os.path.join(directory, name) for name in sorted(previous_files - files))
+        for name in previous_subdirectories - subdirectories:
+            removed_directories.append(os.path.join(directory, name))
+            self._forget(os.path.join(directory, name))
+
+        recent = time.time() - stat_result.st_mtime < RACY_MTIME_SECONDS
+        self._directories[directory] = (None if recent else stat_result.st_mtime_ns, files, subdirectories)
+        self._pending.extend(os.path.join(directory, name) for name in sorted(subdirectories, reverse=True))
+
+    def _forget(self, directory: str):
+        """Drops a removed directory and everything cached below it."""
+        prefix = os.path.join(directory, "")
+        for path in [path for path in self._directories if path == directory or path.startswith(prefix)]:
+            del self._directories[path]
@@ -0,0 +1,93 @@
+# src/file_manifest.py
+
+# Persistent record of every file the monitor has finished with: path -> (mtime, size, inode, content hash).
+# On startup the watched trees are diffed against it (see run_background_monitor.reconcile_manifest), so only
+# new, changed and deleted files are processed again instead of re-checking every file after each restart.
+
+import os
+import time
+
+from src.sqlite_pool import chunks, get_connection, prefix_range
+
+DB_FILE = "file_manifest.db"
+DB_PATH = os.path.join(os.path.dirname(__file__), '..', DB_FILE)  # DB in project root
+
+
+def init_db():
+    """Creates the manifest table if it doesn't exist."""
+    with get_connection(DB_PATH) as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                inode INTEGER NOT NULL,
+                content_hash TEXT,
+                recorded_at REAL NOT NULL
+            ) WITHOUT ROWID
+        ''')
+        conn.commit()
+
+
+def signature(stat_result: os.stat_result) -> tuple[int, int, int]:
+    """(mtime_ns, size, inode): what a file looked like on disk. Any change means it may have new content."""
+    return stat_result.st_mtime_ns, stat_result.st_size, stat_result.st_ino
+
+
+def entries_under(directory: str) -> dict[str, tuple]:
+    """Returns {path: (mtime_ns, size, inode, content_hash)} for every recorded file anywhere below `directory`."""
+    prefix, upper_bound = prefix_range(directory)
+    with get_connection(DB_PATH) as conn:
+        rows = conn.execute(
+            "SELECT path, mtime_ns, size, inode, content_hash FROM files WHERE path >= ? AND path < ?",
+            (prefix, upper_bound)
+        ).fetchall()
+    return {row[0]: row[1:] for row in rows}
+
+
+def record(file_path: str, file_signature: tuple[int, int, int], content_hash: str | None):
+    """Records a file as done with the signature it had when its analysis started."""
+    record_many([(file_path, file_signature, content_hash)])
+
+
+def record_many(entries: list[tuple[str, tuple[int, int, int], str | None]]):
+    """Records many (file_path, signature, content_hash) entries in one transaction."""
+    if not entries:
+        return
+    now = time.time()
+    with get_connection(DB_PATH) as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO files (path, mtime_ns, size, inode, content_hash, recorded_at) VALUES (?, ?, ?, ?, ?, ?)",
+            [(file_path, *file_signature, content_hash, now) for file_path, file_signature, content_hash in entries]
+        )
+        conn.commit()
+
+
+def remove(file_paths: list[str]):
+    """Forgets the given files."""
+    file_paths = list(file_paths)
+    with get_connection(DB_PATH) as conn:
+        for chunk in chunks(file_paths):
+            conn.execute(f"DELETE FROM files WHERE path IN ({','.join('?' * len(chunk))})", chunk)
+        conn.commit()
+
+
+def remove_under(directory: str) -> int:
+    """Forgets every file below `directory`. Returns the number of entries removed."""
+    prefix, upper_bound = prefix_range(directory)
+    with get_connection(DB_PATH) as conn:
+        removed = conn.execute("DELETE FROM files WHERE path >= ? AND path < ?", (prefix, upper_bound)).rowcount
+        conn.commit()
+    return removed
+
+
+def clear():
+    """Forgets every file, e.g. after the index was deleted, so the next startup re-indexes everything."""
+    with get_connection(DB_PATH) as conn:
+        conn.execute("DELETE FROM files")
+        conn.commit()
+
+
+# --- Initialize DB if not present ---
+if not os.path.exists(DB_PATH):
+    init_db()
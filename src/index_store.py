@@ -0,0 +1,274 @@
+# src/index_store.py
+
+# A small SQLite index kept in sync with the ChromaDB collection by database_manager.
+# ChromaDB only filters metadata by exact value, so lookups it can't do efficiently
+# (every file under a directory, every page tagged with an entity, keyword search over OCR text)
+# are answered here instead.
+
+import os
+import re
+
+from src.sqlite_pool import chunks, get_connection, prefix_range
+
+DB_FILE = "context_index.db"
+DB_PATH = os.path.join(os.path.dirname(__file__), '..', DB_FILE)  # DB in project root
+
+# Bump when the schema changes; database_manager then rebuilds the index from ChromaDB.
+SCHEMA_VERSION = 4
+
+FTS_COLUMN_WEIGHTS = (1.0, 2.0)  # BM25 weights for (ocr_text, user_caption): the user's own words count double
+
+
+def _create_tables(cursor):
+    # One row per ChromaDB entry (an image, or one page of a PDF). `id` is the page's rowid in pages_fts.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS pages (
+            id INTEGER PRIMARY KEY,
+            page_id TEXT NOT NULL UNIQUE,
+            file_path TEXT NOT NULL
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_pages_file_path ON pages (file_path)")
+
+    # Full-text index over each page's OCR text and user caption, ranked with BM25
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5(
+            ocr_text, user_caption, tokenize = 'unicode61 remove_diacritics 2'
+        )
+    ''')
+
+    # Inverted index: NER tag -> pages mentioning it (postings are ordered by page_id)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tags (
+            tag TEXT NOT NULL,
+            page_id TEXT NOT NULL,
+            PRIMARY KEY (tag, page_id)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_tags_page_id ON tags (page_id)")
+
+    # Materialized entity degrees (pages per tag), kept current by triggers on `tags`
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS entities (
+            tag TEXT PRIMARY KEY,
+            degree INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_entities_degree ON entities (degree DESC, tag)")
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS tags_after_insert AFTER INSERT ON tags BEGIN
+            INSERT INTO entities (tag, degree) VALUES (new.tag, 1)
+            ON CONFLICT (tag) DO UPDATE SET degree = degree + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS tags_after_delete AFTER DELETE ON tags BEGIN
+            UPDATE entities SET degree = degree - 1 WHERE tag = old.tag;
+            DELETE FROM entities WHERE tag = old.tag AND degree <= 0;
+        END
+    ''')
+
+
+def init_db():
+    """Creates the index tables if they don't exist."""
+    with get_connection(DB_PATH) as conn:
+        _create_tables(conn.cursor())
+        conn.commit()
+
+
+def _split_tags(tags_string: str) -> set[str]:
+    """Splits the comma-joined tags string stored in ChromaDB metadata. Tags are indexed lowercased."""
+    return {tag.strip().lower() for tag in (tags_string or "").split(",") if tag.strip()}
+
+
+def _index_pages(cursor, metadatas: list[dict]):
+    _remove_pages(cursor, [md["page_id"] for md in metadatas])
+    for md in metadatas:
+        cursor.execute("INSERT INTO pages (page_id, file_path) VALUES (?, ?)", (md["page_id"], md["file_path"]))
+        cursor.execute(
+            "INSERT INTO pages_fts (rowid, ocr_text, user_caption) VALUES (?, ?, ?)",
+            (cursor.lastrowid, md.get("ocr_text") or "", md.get("user_caption") or "")
+        )
+    cursor.executemany(
+        "INSERT OR IGNORE INTO tags (tag, page_id) VALUES (?, ?)",
+        [(tag, md["page_id"]) for md in metadatas for tag in _split_tags(md.get("tags"))]
+    )
+
+
+def _remove_pages(cursor, page_ids: list[str]):
+    for chunk in chunks(page_ids):
+        placeholders = ",".join("?" * len(chunk))
+        cursor.execute(f"DELETE FROM pages_fts WHERE rowid IN (SELECT id FROM pages WHERE page_id IN ({placeholders}))", chunk)
+        cursor.execute(f"DELETE FROM pages WHERE page_id IN ({placeholders})", chunk)
+        cursor.execute(f"DELETE FROM tags WHERE page_id IN ({placeholders})", chunk)
+
+
+# --- Sync Functions (called by database_manager) ---
+
+def index_pages(metadatas: list[dict]):
+    """Records newly added entries. Takes the same metadata dicts that are stored in ChromaDB."""
+    if not metadatas:
+        return
+    with get_connection(DB_PATH) as conn:
+        _index_pages(conn.cursor(), metadatas)
+        conn.commit()
+
+
+def remove_pages(page_ids: list[str]):
+    """Forgets specific entries by id."""
+    if not page_ids:
+        return
+    with get_connection(DB_PATH) as conn:
+        _remove_pages(conn.cursor(), page_ids)
+        conn.commit()
+
+
+def remove_files(file_paths: list[str]) -> list[str]:
+    """Forgets every entry (image or PDF page) belonging to the given files. Returns the removed page ids."""
+    if not file_paths:
+        return []
+    with get_connection(DB_PATH) as conn:
+        cursor = conn.cursor()
+        page_ids = []
+        for chunk in chunks(file_paths):
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(f"SELECT page_id FROM pages WHERE file_path IN ({placeholders})", chunk)
+            page_ids.extend(row[0] for row in cursor.fetchall())
+        _remove_pages(cursor, page_ids)
+        conn.commit()
+    return page_ids
+
+
+def needs_rebuild(collection_count: int) -> bool:
+    """
+    True if the index predates the current schema or holds a different number of pages than ChromaDB:
+    empty next to a populated collection, or still full after the collection was deleted or replaced.
+    """
+    with get_connection(DB_PATH) as conn:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        page_count = conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+    return version != SCHEMA_VERSION or page_count != collection_count
+
+
+def rebuild(metadata_batches):
+    """Replaces the whole index with the given batches of ChromaDB metadata dicts, recreating the tables."""
+    with get_connection(DB_PATH) as conn:
+        cursor = conn.cursor()
+        for table in ("pages", "pages_fts", "tags", "entities"):
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")  # Dropping `tags` drops its triggers too
+        _create_tables(cursor)
+        for metadatas in metadata_batches:
+            _index_pages(cursor, metadatas)
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.commit()
+
+
+def clear():
+    """Empties the index, e.g. after the ChromaDB collection was deleted."""
+    rebuild([])
+
+
+# --- Query Functions ---
+
+def files_under(directory: str) -> list[str]:
+    """Returns the distinct indexed file paths located anywhere below `directory`."""
+    prefix, upper_bound = prefix_range(directory)
+    with get_connection(DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT DISTINCT file_path FROM pages WHERE file_path >= ? AND file_path < ?",
+            (prefix, upper_bound)
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def pages_for_tag(tag: str, limit: int, after: str = None) -> list[str]:
+    """
+    Returns up to `limit` page ids tagged with `tag` (exact, lowercase match), ordered by page id.
+    Pass the last page id of the previous call as `after` to continue; each call is an index range scan.
+    """
+    with get_connection(DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT page_id FROM tags WHERE tag = ? AND page_id > ? ORDER BY page_id LIMIT ?",
+            (tag, after or "", limit)
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def count_pages_for_tag(tag: str) -> int:
+    """Returns how many pages are tagged with `tag`."""
+    with get_connection(DB_PATH) as conn:
+        row = conn.execute("SELECT degree FROM entities WHERE tag = ?", (tag,)).fetchone()
+        return row[0] if row else 0
+
+
+def top_entities(limit: int) -> list[tuple[str, int]]:
+    """
+    Returns the `limit` entities tagged on the most pages as (tag, degree) pairs, highest degree first.
+    Entities tied with the last one are included too, so the cut-off is a plain degree threshold.
+    """
+    with get_connection(DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT tag, degree FROM entities
+            WHERE degree >= COALESCE((SELECT degree FROM entities ORDER BY degree DESC LIMIT 1 OFFSET ?), 0)
+            ORDER BY degree DESC, tag
+        ''', (max(limit - 1, 0),))
+        return cursor.fetchall()
+
+
+def graph_page(min_degree: int, limit: int, after: str = None) -> tuple[list[str], list[tuple[str, str]]]:
+    """
+    Returns up to `limit` page ids (ordered by page id, continuing after `after`) that mention an entity
+    with degree >= `min_degree`, together with their (tag, page_id) edges to such entities.
+    """
+    with get_connection(DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT t.tag, t.page_id FROM tags t JOIN entities e ON e.tag = t.tag
+            WHERE e.degree >= ? AND t.page_id IN (
+                SELECT DISTINCT t2.page_id FROM tags t2 JOIN entities e2 ON e2.tag = t2.tag
+                WHERE e2.degree >= ? AND t2.page_id > ?
+                ORDER BY t2.page_id LIMIT ?
+            )
+            ORDER BY t.page_id, t.tag
+        ''', (min_degree, min_degree, after or "", limit))
+        edges = cursor.fetchall()
+
+    page_ids = list(dict.fromkeys(page_id for _, page_id in edges))
+    return page_ids, edges
+
+
+def _fts_query(text: str) -> str:
+    """
+    Turns free text into an FTS5 query: every whitespace-separated token becomes a quoted phrase, OR-ed
+    together and left to BM25 to rank. Quoting keeps identifiers like 'INV-48213' or '0x80070005' intact
+    (the tokenizer still splits them, but the pieces must appear adjacent) and stops FTS5 syntax
+    such as '-', '*' or 'NEAR' in a query from being interpreted.
+    """
+    tokens = [token for token in re.findall(r'[^\s"]+', text) if any(char.isalnum() for char in token)]
+    return " OR ".join(f'"{token}"' for token in tokens)
+
+
+def search_text(query: str, limit: int) -> list[tuple[str, float]]:
+    """
+    Full-text search over OCR text and user captions. Returns up to `limit` (page_id, score) pairs,
+    best match first; the score is the BM25 relevance (higher is better).
+    """
+    match = _fts_query(query)
+    if not match:
+        return []
+    with get_connection(DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT p.page_id, -bm25(pages_fts, ?, ?) AS score
+            FROM pages_fts JOIN pages p ON p.id = pages_fts.rowid
+            WHERE pages_fts MATCH ?
+            ORDER BY score DESC LIMIT ?
+        ''', (*FTS_COLUMN_WEIGHTS, match, limit))
+        return cursor.fetchall()
+
+
+# --- Initialize DB ---
+init_db()
@@ -3,13 +3,78 @@
 import sqlite3
 import os
 
+from src.sqlite_pool import chunks, get_connection, migrate
+
 DB_FILE = "context_maps.db"
 DB_PATH = os.path.join(os.path.dirname(__file__), '..', DB_FILE)  # DB in project root
 
 
+
+def _add_spatial_index(conn):
+    """
+    Indexes node positions for viewport queries. Uses an R*Tree with the map id as a third dimension
+    (so maps sharing coordinates don't collide), kept in sync by triggers on `nodes`.
+    SQLite builds without the R*Tree module fall back to a (map_id, position_x, position_y) B-tree index.
+    """
+    try:
+        conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS node_positions USING rtree (id, min_map, max_map, min_x, max_x, min_y, max_y)"
+        )
+    except sqlite3.OperationalError:
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_nodes_map_position ON nodes (map_id, position_x, position_y)")
+        return
+
+    conn.execute('''
+        INSERT INTO node_positions
+        SELECT id, map_id, map_id, COALESCE(position_x, 0), COALESCE(position_x, 0), COALESCE(position_y, 0), COALESCE(position_y, 0)
+        FROM nodes
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS nodes_after_insert AFTER INSERT ON nodes BEGIN
+            INSERT INTO node_positions VALUES (
+                new.id, new.map_id, new.map_id, COALESCE(new.position_x, 0), COALESCE(new.position_x, 0),
+                COALESCE(new.position_y, 0), COALESCE(new.position_y, 0)
+            );
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS nodes_after_update AFTER UPDATE OF map_id, position_x, position_y ON nodes BEGIN
+            UPDATE node_positions SET
+                min_map = new.map_id, max_map = new.map_id,
+                min_x = COALESCE(new.position_x, 0), max_x = COALESCE(new.position_x, 0),
+                min_y = COALESCE(new.position_y, 0), max_y = COALESCE(new.position_y, 0)
+            WHERE id = new.id;
+        END
+    ''')
+    conn.execute('''
+        CREATE TRIGGER IF NOT EXISTS nodes_after_delete AFTER DELETE ON nodes BEGIN
+            DELETE FROM node_positions WHERE id = old.id;
+        END
+    ''')
+
+
+def _has_rtree() -> bool:
+    with get_connection(DB_PATH) as conn:
+        row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'node_positions'").fetchone()
+        return row is not None
+
+
+# Schema changes applied after the initial tables, in order (see sqlite_pool.migrate).
+MIGRATIONS = [
+    # 1: Index per-map lookups; the edge indexes also serve "edges touching node X" deletes
+    [
+        "CREATE INDEX IF NOT EXISTS idx_nodes_map_id ON nodes (map_id)",
+        "CREATE INDEX IF NOT EXISTS idx_edges_map_source ON edges (map_id, source_node_id)",
+        "CREATE INDEX IF NOT EXISTS idx_edges_map_target ON edges (map_id, target_node_id)",
+    ],
+    # 2: Spatial index on node positions, for viewport (bbox) queries
+    _add_spatial_index,
+]
+
+
 def init_db():
     """Initializes the database and creates tables if they don't exist."""
-    with sqlite3.connect(DB_PATH) as conn:
+    with get_connection(DB_PATH) as conn:
         cursor = conn.cursor()
 
         # Maps
@@ -55,7 +120,7 @@ def init_db():
 def create_map(name: str) -> int:
     """Creates a new map and returns its ID."""
     try:
-        with sqlite3.connect(DB_PATH) as conn:
+        with get_connection(DB_PATH) as conn:
             cursor = conn.cursor()
             cursor.execute("INSERT INTO maps (name) VALUES (?)", (name,))
             conn.commit()
@@ -67,7 +132,7 @@ def create_map(name: str) -> int:
 def delete_map(map_id: int) -> bool:
     """Deletes a map and all its associated nodes and edges."""
     try:
-        with sqlite3.connect(DB_PATH) as conn:
+        with get_connection(DB_PATH) as conn:
             cursor = conn.cursor()
             # Deleting a map will cascade and delete its nodes and edges if foreign keys are set up with ON DELETE CASCADE
             # Since they are not, we must delete them manually.
@@ -81,18 +146,29 @@ def delete_map(map_id: int) -> bool:
 
 def get_all_maps() -> list:
     """Returns a list of all available maps."""
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
+    with get_connection(DB_PATH) as conn:
         cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
         cursor.execute("SELECT id, name FROM maps")
         return [dict(row) for row in cursor.fetchall()]
 
+def map_exists(map_id: int) -> bool:
+    """Returns True if a map with this ID exists."""
+    with get_connection(DB_PATH) as conn:
+        return conn.execute("SELECT 1 FROM maps WHERE id = ?", (map_id,)).fetchone() is not None
+
+def node_exists(map_id: int, node_id: int) -> bool:
+    """Returns True if the node exists and belongs to this map."""
+    with get_connection(DB_PATH) as conn:
+        row = conn.execute("SELECT 1 FROM nodes WHERE id = ? AND map_id = ?", (node_id, map_id)).fetchone()
+        return row is not None
+
 
 # --- Node & Edge Functions ---
 
 def add_node_to_map(map_id: int, file_path: str, x: int, y: int) -> int:
     """Adds a file node to a specific map at a given position."""
-    with sqlite3.connect(DB_PATH) as conn:
+    with get_connection(DB_PATH) as conn:
         cursor = conn.cursor()
         cursor.execute(
             "INSERT INTO nodes (map_id, file_path, position_x, position_y) VALUES (?, ?, ?, ?)",
@@ -104,7 +180,7 @@ def add_node_to_map(map_id: int, file_path: str, x: int, y: int) -> int:
 
 def create_edge(map_id: int, source_id: int, target_id: int, label: str) -> int:
     """Creates an edge between two nodes on a map."""
-    with sqlite3.connect(DB_PATH) as conn:
+    with get_connection(DB_PATH) as conn:
         cursor = conn.cursor()
         cursor.execute(
             "INSERT INTO edges (map_id, source_node_id, target_node_id, label) VALUES (?, ?, ?, ?)",
@@ -114,11 +190,18 @@ def create_edge(map_id: int, source_id: int, target_id: int, label: str) -> int:
         return cursor.lastrowid
 
 
-def get_map_data(map_id: int) -> dict:
-    """Retrieves all nodes and edges for a given map to be drawn on the UI."""
-    with sqlite3.connect(DB_PATH) as conn:
-        conn.row_factory = sqlite3.Row
+def get_map_data(map_id: int, bbox: tuple = None) -> dict:
+    """
+    Retrieves all nodes and edges for a given map to be drawn on the UI.
+    With `bbox` = (min_x, min_y, max_x, max_y), only the nodes inside that viewport are returned,
+    along with every edge touching one of them.
+    """
+    if bbox is not None:
+        return _get_map_viewport(map_id, *bbox)
+
+    with get_connection(DB_PATH) as conn:
         cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
 
         # Get nodes
         cursor.execute("SELECT id, file_path, position_x, position_y FROM nodes WHERE map_id = ?", (map_id,))
@@ -130,9 +213,45 @@ def get_map_data(map_id: int) -> dict:
 
         return {"nodes": nodes, "edges": edges}
 
+def _get_map_viewport(map_id: int, min_x: float, min_y: float, max_x: float, max_y: float) -> dict:
+    use_rtree = _has_rtree()
+    with get_connection(DB_PATH) as conn:
+        cursor = conn.cursor()
+        cursor.row_factory = sqlite3.Row
+
+        if use_rtree:
+            # The R*Tree stores 32-bit floats (bounds rounded outwards), so positions are re-checked exactly.
+            cursor.execute('''
+                SELECT n.id, n.file_path, n.position_x, n.position_y
+                FROM node_positions r JOIN nodes n ON n.id = r.id
+                WHERE r.min_map >= ? AND r.max_map <= ?
+                  AND r.max_x >= ? AND r.min_x <= ? AND r.max_y >= ? AND r.min_y <= ?
+                  AND n.position_x BETWEEN ? AND ? AND n.position_y BETWEEN ? AND ?
+            ''', (map_id, map_id, min_x, max_x, min_y, max_y, min_x, max_x, min_y, max_y))
+        else:
+            cursor.execute('''
+                SELECT id, file_path, position_x, position_y FROM nodes
+                WHERE map_id = ? AND position_x BETWEEN ? AND ? AND position_y BETWEEN ? AND ?
+            ''', (map_id, min_x, max_x, min_y, max_y))
+        nodes = [dict(row) for row in cursor.fetchall()]
+
+        # Edges touching the visible nodes, one indexed lookup per side and chunk
+        edges = {}
+        node_ids = [node["id"] for node in nodes]
+        for chunk in chunks(node_ids):
+            placeholders = ",".join("?" * len(chunk))
+            for column in ("source_node_id", "target_node_id"):
+                cursor.execute(
+                    f"SELECT id, source_node_id, target_node_id, label FROM edges WHERE map_id = ? AND {column} IN ({placeholders})",
+                    [map_id, *chunk]
+                )
+                edges.update((row["id"], dict(row)) for row in cursor.fetchall())
+
+        return {"nodes": nodes, "edges": list(edges.values())}
+
 def update_node_position(map_id: int, node_id: int, x: int, y: int) -> bool:
     """Updates the position of a node in a map."""
-    with sqlite3.connect(DB_PATH) as conn:
+    with get_connection(DB_PATH) as conn:
         cursor = conn.cursor()
         cursor.execute(
             "UPDATE nodes SET position_x = ?, position_y = ? WHERE id = ? AND map_id = ?",
@@ -143,14 +262,12 @@ def update_node_position(map_id: int, node_id: int, x: int, y: int) -> bool:
 
 def delete_node_from_map(map_id: int, node_id: int) -> bool:
     """Deletes a node from a map and all its associated edges."""
-    with sqlite3.connect(DB_PATH) as conn:
+    with get_connection(DB_PATH) as conn:
         cursor = conn.cursor()
         
-        # First delete all edges connected to this node
-        cursor.execute(
-            "DELETE FROM edges WHERE map_id = ? AND (source_node_id = ? OR target_node_id = ?)",
-            (map_id, node_id, node_id)
-        )
+        # First delete all edges connected to this node (one statement per side, so each uses its index)
+        cursor.execute("DELETE FROM edges WHERE map_id = ? AND source_node_id = ?", (map_id, node_id))
+        cursor.execute("DELETE FROM edges WHERE map_id = ? AND target_node_id = ?", (map_id, node_id))
         
         # Then delete the node
         cursor.execute(
@@ -163,7 +280,7 @@ def delete_node_from_map(map_id: int, node_id: int) -> bool:
 
 def update_edge_label(map_id: int, edge_id: int, label: str = None) -> bool:
     """Updates the label of an edge in a map."""
-    with sqlite3.connect(DB_PATH) as conn:
+    with get_connection(DB_PATH) as conn:
         cursor = conn.cursor()
         cursor.execute(
             "UPDATE edges SET label = ? WHERE id = ? AND map_id = ?",
@@ -174,7 +291,7 @@ def update_edge_label(map_id: int, edge_id: int, label: str = None) -> bool:
 
 def delete_edge_from_map(map_id: int, edge_id: int) -> bool:
     """Deletes an edge from a map."""
-    with sqlite3.connect(DB_PATH) as conn:
+    with get_connection(DB_PATH) as conn:
         cursor = conn.cursor()
         cursor.execute(
             "DELETE FROM edges WHERE id = ? AND map_id = ?",
@@ -184,6 +301,88 @@ def delete_edge_from_map(map_id: int, edge_id: int) -> bool:
         return cursor.rowcount > 0
 
 
-# --- Initialize DB if not present ---
+# --- Batch Editing ---
+
+def apply_map_batch(map_id: int, add_nodes: list = (), move_nodes: list = (), add_edges: list = (),
+                    delete_edges: list = (), delete_nodes: list = ()) -> dict:
+    """
+    Applies many edits to a map in a single transaction (one commit), in this order:
+    node adds, node moves, edge adds, edge deletes, node deletes (with their edges).
+
+    - add_nodes: [{"ref", "file_path", "x", "y"}] where `ref` is a client-chosen name for the new node
+    - move_nodes: [{"node_id", "x", "y"}]
+    - add_edges: [{"source", "target", "label"}] where source/target are node ids (int) or refs (str)
+    - delete_edges / delete_nodes: lists of ids
+
+    Raises ValueError (and changes nothing) if an edge names a node that isn't in the map or batch.
+    Returns the new ids and how many rows each kind of edit touched.
+    """
+    with get_connection(DB_PATH) as conn:
+        cursor = conn.cursor()
+
+        # New nodes one by one, since each id must be reported back (and may be used by edges below)
+        node_ids = {}
+        for node in add_nodes:
+            cursor.execute(
+                "INSERT INTO nodes (map_id, file_path, position_x, position_y) VALUES (?, ?, ?, ?)",
+                (map_id, node["file_path"], node["x"], node["y"])
+            )
+            node_ids[node["ref"]] = cursor.lastrowid
+
+        # Counts come from cursor.rowcount: conn.total_changes would also count the rows the R*Tree triggers write
+        cursor.executemany(
+            "UPDATE nodes SET position_x = ?, position_y = ? WHERE id = ? AND map_id = ?",
+            [(move["x"], move["y"], move["node_id"], map_id) for move in move_nodes]
+        )
+        moved = max(cursor.rowcount, 0)
+
+        # Resolve edge endpoints: refs from this batch, or existing node ids checked in one query per chunk
+        endpoint_ids = list({endpoint for edge in add_edges for endpoint in (edge["source"], edge["target"])
+                             if not isinstance(endpoint, str)})
+        found_ids = set()
+        for chunk in chunks(endpoint_ids):
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(f"SELECT id FROM nodes WHERE map_id = ? AND id IN ({placeholders})", [map_id, *chunk])
+            found_ids.update(row[0] for row in cursor.fetchall())
+
+        def resolve(endpoint):
+            if isinstance(endpoint, str):
+                node_id = node_ids.get(endpoint)
+            else:
+                node_id = endpoint if endpoint in found_ids else None
+            if node_id is None:
+                raise ValueError(f"Node {endpoint!r} not found in map {map_id}")
+            return node_id
+
+        edge_rows = [(map_id, resolve(edge["source"]), resolve(edge["target"]), edge.get("label")) for edge in add_edges]
+        edge_ids = []
+        for row in edge_rows:
+            cursor.execute(
+                "INSERT INTO edges (map_id, source_node_id, target_node_id, label) VALUES (?, ?, ?, ?)", row
+            )
+            edge_ids.append(cursor.lastrowid)
+
+        cursor.executemany("DELETE FROM edges WHERE id = ? AND map_id = ?", [(edge_id, map_id) for edge_id in delete_edges])
+        deleted_edges = max(cursor.rowcount, 0)
+
+        node_params = [(map_id, node_id) for node_id in delete_nodes]
+        cursor.executemany("DELETE FROM edges WHERE map_id = ? AND source_node_id = ?", node_params)
+        cursor.executemany("DELETE FROM edges WHERE map_id = ? AND target_node_id = ?", node_params)
+        cursor.executemany("DELETE FROM nodes WHERE map_id = ? AND id = ?", node_params)
+        deleted_nodes = max(cursor.rowcount, 0)
+
+        conn.commit()
+
+    return {
+        "node_ids": node_ids,
+        "edge_ids": edge_ids,
+        "moved_nodes": moved,
+        "deleted_edges": deleted_edges,
+        "deleted_nodes": deleted_nodes,
+    }
+
+
+# --- Initialize DB if not present, then bring its schema up to date ---
 if not os.path.exists(DB_PATH):
     init_db()
+migrate(DB_PATH, MIGRATIONS)
@@ -0,0 +1,281 @@
+# src/metrics.py
+
+# In-process counters and histograms for the ingest pipeline, the database and the API,
+# rendered in the Prometheus text format by api_server's /metrics endpoint.
+# Recording is a perf_counter() call plus a short locked update, cheap enough for per-file and per-batch loops.
+# Extraction runs in a process pool: jobs go through call_with_metrics(), which ships the child's observations
+# back with the result, and the parent merges them in.
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency buckets, from 1 ms up to 2 minutes.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+_REGISTRY = {}  # name -> Counter | Histogram, in registration order
+
+
+class _CounterChild:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0.0
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+
+class _HistogramChild:
+    def __init__(self, buckets: tuple):
+        self._lock = threading.Lock()
+        self._buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # Per bucket (not cumulative); the last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self._buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self):
+        """Observes the wall time of the `with` block, including when it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started)
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._children = {}
+        self._lock = threading.Lock()
+        _REGISTRY[name] = self
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        """Returns the series for these label values (in declaration order). Hot paths can keep the result."""
+        values = tuple(str(value) for value in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _label_text(self, values: tuple, extra: str = "") -> str:
+        pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter(_Metric):
+    """A monotonically increasing count (files, bytes, errors, cache hits...)."""
+    type = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        """Increments the unlabelled series."""
+        self.labels().inc(amount)
+
+    def render(self) -> list[str]:
+        return [f"{self.name}{self._label_text(values)} {_format(child.value)}" for values, child in list(self._children.items())]
+
+
+class Histogram(_Metric):
+    """Counts observations (durations, sizes) into cumulative buckets, with their sum and count."""
+    type = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, help_text, labels)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        """Observes a value on the unlabelled series."""
+        self.labels().observe(value)
+
+    def time(self):
+        return self.labels().time()
+
+    def render(self) -> list[str]:
+        lines = []
+        for values, child in list(self._children.items()):
+            with child._lock:
+                counts, total = list(child.counts), child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format(bound)
+                bucket_labels = self._label_text(values, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{self._label_text(values)} {_format(total)}")
+            lines.append(f"{self.name}_count{self._label_text(values)} {cumulative}")
+        return lines
+
+
+class CallbackCounter(_Metric):
+    """A counter kept elsewhere (e.g. a cache's own hit/miss stats), read at render time through `collect`."""
+    type = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: tuple, collect):
+        super().__init__(name, help_text, labels)
+        self._collect = collect  # () -> {label_values_tuple: value}
+
+    def render(self) -> list[str]:
+        return [f"{self.name}{self._label_text(tuple(map(str, values)))} {_format(value)}" for values, value in self._collect().items()]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render() -> str:
+    """Renders every registered metric in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for metric in list(_REGISTRY.values()):
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# --- Process pool support ---
+
+def drain() -> dict:
+    """Returns everything recorded in this process since the last drain, and resets it."""
+    observations = {}
+    for name, metric in list(_REGISTRY.items()):
+        series = {}
+        for values, child in list(metric._children.items()):
+            with child._lock:
+                if isinstance(child, _CounterChild):
+                    if child.value:
+                        series[values] = child.value
+                        child.value = 0.0
+                elif any(child.counts):
+                    series[values] = (list(child.counts), child.sum)
+                    child.counts = [0] * len(child.counts)
+                    child.sum = 0.0
+        if series:
+            observations[name] = series
+    return observations
+
+
+def merge(observations: dict):
+    """Adds observations drained in another process (see call_with_metrics) to this process's metrics."""
+    for name, series in observations.items():
+        metric = _REGISTRY.get(name)
+        if metric is None:
+            continue
+        for values, observed in series.items():
+            child = metric.labels(*values)
+            with child._lock:
+                if isinstance(child, _CounterChild):
+                    child.value += observed
+                else:
+                    counts, total = observed
+                    child.counts = [a + b for a, b in zip(child.counts, counts)]
+                    child.sum += total
+
+
+def call_with_metrics(function, *args, **kwargs):
+    """
+    Process-pool job wrapper: runs function(*args, **kwargs) and returns (result, observations).
+    Observations are returned with errors too, by attaching them to the exception.
+    """
+    drain()  # Drop anything recorded outside a job (e.g. model loading in the initializer)
+    try:
+        result = function(*args, **kwargs)
+    except Exception as e:
+        e.metrics = drain()
+        raise
+    return result, drain()
+
+
+def job_result(future):
+    """Returns the result of a call_with_metrics() job (or raises its error), merging its observations into this process."""
+    try:
+        result, observations = future.result()
+    except Exception as e:
+        merge(getattr(e, "metrics", {}))
+        raise
+    merge(observations)
+    return result
+
+
+# --- HTTP ---
+
+class HTTPMetricsMiddleware:
+    """
+    ASGI middleware recording each request's latency in HTTP_SECONDS. Requests are labelled with the route
+    template (e.g. /maps/{map_id}), not the raw path, so the number of series stays small.
+    Streaming responses are timed until the handler returns the response, not until the last chunk is sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status = [500]  # Reported if the app raises before starting a response
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_SECONDS.labels(scope["method"], route, status[0]).observe(time.perf_counter() - started)
+
+
+# --- Metrics ---
+
+STAGE_SECONDS = Histogram(
+    "context_stage_seconds",
+    "Time spent in each pipeline stage (decode, ocr, ner, clip_image, clip_text, pdf_text, db_write, ...).",
+    labels=("stage",)
+)
+ANALYSIS_SECONDS = Histogram(
+    "context_analysis_seconds", "End-to-end analysis time per call, by kind (image batch or PDF).", labels=("kind",)
+)
+FILES = Counter("context_files_total", "Files handled by the ingest pipeline, by type and outcome.", labels=("type", "outcome"))
+PAGES = Counter("context_pages_total", "PDF pages analyzed.")
+IMAGES = Counter("context_images_total", "Images analyzed.")
+BYTES = Counter("context_bytes_total", "Bytes of file content read for analysis.")
+ERRORS = Counter("context_errors_total", "Errors, by stage.", labels=("stage",))
+ITEMS_WRITTEN = Counter("context_db_items_written_total", "Entries written to ChromaDB.")
+SEARCHES = Counter("context_searches_total", "Search queries, by mode.", labels=("mode",))
+HTTP_SECONDS = Histogram(
+    "context_http_request_seconds", "HTTP request latency, by method, route and status.", labels=("method", "route", "status")
+)
+SCAN_SECONDS = Histogram("context_scan_seconds", "Time per safety-net scan of the watched directories.")
+SCAN_DIRECTORIES = Counter(
+    "context_scan_directories_total", "Directories visited by the safety-net scanner: listed, or skipped as unchanged.",
+    labels=("result",)
+)
@@ -2,128 +2,630 @@
 
 from PIL import Image
 import pytesseract
-from sentence_transformers import SentenceTransformer
 import numpy as np
 import os
+import hashlib
+import time
+import threading
 import fitz  
-import spacy
-import torch
 import cv2 
 
+from src.config import (
+    PDF_PAGE_CHUNK_SIZE, EMBEDDING_BATCH_SIZE, EMBEDDING_BACKEND, ONNX_MODEL_DIR, ONNX_NUM_THREADS,
+    OCR_BACKEND, TESSERACT_LANGUAGE, TESSDATA_PATH,
+    NER_EXCLUDED_COMPONENTS, NER_BATCH_SIZE, NER_N_PROCESS, NER_MAX_CHARS
+)
+from src import metrics
+
 # --- 1. CONFIGURATION & OPTIMIZATION ---
 pytesseract.pytesseract.tesseract_cmd = r"C:\Program Files\Tesseract-OCR\tesseract.exe"
 
-DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
-print(f"✅ Using device: {DEVICE}")
+EMBEDDING_MODEL_NAME = "clip-ViT-B-32"
+NER_MODEL_NAME = "en_core_web_sm"
 
+# CLIP only sees a 224px center crop, so images kept for the embedding stage are shrunk to this shortest side.
+# Extraction workers send those images to the embedding stage over a pipe, where full resolution would cost
+# megabytes per screenshot.
+EMBEDDING_IMAGE_SHORT_SIDE = 448
 
-print("Loading AI models into memory")
-try:
-    EMBEDDING_MODEL = SentenceTransformer('clip-ViT-B-32', device=DEVICE)
-    NER_MODEL = spacy.load("en_core_web_sm")
-    print("Models loaded successfully!")
-    
-except Exception as e:
-    print(f"Error loading models: {e}")
-    EMBEDDING_MODEL = None
-    NER_MODEL = None
+# Models are loaded on first use (or by warm_up_models), not at import time, so processes that
+# never analyze files (e.g. an API only serving maps) start quickly and stay small.
+# torch, sentence_transformers, onnxruntime and spacy are imported inside the loaders for the same reason.
+_EMBEDDING_MODEL = None
+_NER_MODEL = None
+_EMBEDDING_LOCK = threading.Lock()
+_NER_LOCK = threading.Lock()
+_MODEL_STATUS = {
+    "embedding": {"state": "not_loaded", "error": None, "load_seconds": None},
+    "ner": {"state": "not_loaded", "error": None, "load_seconds": None},
+}
 
+# Stage timers (see src/metrics.py), bound once so the hot loops skip the label lookup
+_DECODE_SECONDS = metrics.STAGE_SECONDS.labels("decode")
+_OCR_SECONDS = metrics.STAGE_SECONDS.labels("ocr")
+_NER_SECONDS = metrics.STAGE_SECONDS.labels("ner")
+_PDF_TEXT_SECONDS = metrics.STAGE_SECONDS.labels("pdf_text")
+_PDF_RENDER_SECONDS = metrics.STAGE_SECONDS.labels("pdf_render")
+_CLIP_IMAGE_SECONDS = metrics.STAGE_SECONDS.labels("clip_image")
+_CLIP_TEXT_SECONDS = metrics.STAGE_SECONDS.labels("clip_text")
 
-def analyze_image(file_path: str, user_caption: str = None) -> dict | None:
+def _load_model(kind: str, lock: threading.Lock, loader):
+    """Runs `loader` once under `lock`, recording its progress in _MODEL_STATUS. A failed load is not retried."""
+    status = _MODEL_STATUS[kind]
+    with lock:
+        if status["state"] in ("ready", "failed"):
+            return
+        status["state"] = "loading"
+        started = time.perf_counter()
+        try:
+            loader()
+            status["state"] = "ready"
+            print(f"✅ {kind} model loaded in {time.perf_counter() - started:.1f}s")
+        except Exception as e:
+            status["state"] = "failed"
+            status["error"] = str(e)
+            print(f"Error loading {kind} model: {e}")
+        status["load_seconds"] = round(time.perf_counter() - started, 2)
 
-    if not EMBEDDING_MODEL or not NER_MODEL:
-        print("Models are not loaded. Cannot perform analysis.")
-        return None
-        
+def _load_embedding_model():
+    global _EMBEDDING_MODEL
     try:
-        print(f"\nAnalyzing image: {os.path.basename(file_path)}...")
-        image_cv = cv2.imread(file_path)
-        image_rgb = cv2.cvtColor(image_cv, cv2.COLOR_BGR2RGB)
-        pil_image = Image.fromarray(image_rgb)
-
-        ocr_text = pytesseract.image_to_string(pil_image)
-        
-        doc = NER_MODEL(ocr_text)
-        tags = list(set([ent.text for ent in doc.ents])) 
-        
-        # --- Step C: Unified Multimodal Embedding ---
-        image_embedding = EMBEDDING_MODEL.encode(pil_image, normalize_embeddings=True, show_progress_bar=False)
-        
-        text_to_embed = f"{user_caption or ''} {ocr_text}"
-        text_embedding = EMBEDDING_MODEL.encode(text_to_embed, normalize_embeddings=True, show_progress_bar=False)
-        
-        # Combine the embeddings with a slight weight towards text
-        combined_embedding = np.mean([image_embedding, text_embedding * 1.2], axis=0)
-        
-        # Re-normalize the final combined vector to ensure it's a unit vector
-        norm = np.linalg.norm(combined_embedding)
-        normalized_combined_embedding = combined_embedding / norm
-        
-        return {
-            "file_path": file_path,
-            "ocr_text": ocr_text, # The full text from the image
-            "tags": tags,
-            "user_caption": user_caption or "",
-            "vector": normalized_combined_embedding.tolist()
-        }
+        _EMBEDDING_MODEL = EMBEDDING_BACKENDS[EMBEDDING_BACKEND]()
     except Exception as e:
-        print(f"An unexpected error occurred during image analysis for {file_path}: {e}")
+        if EMBEDDING_BACKEND == SentenceTransformerEmbedding.name:
+            raise
+        print(f"Could not start embedding backend '{EMBEDDING_BACKEND}' ({e}). Falling back to sentence_transformers.")
+        _EMBEDDING_MODEL = SentenceTransformerEmbedding()
+
+def _load_ner_model():
+    global _NER_MODEL
+    import spacy
+    # Only the components NER needs; see NER_EXCLUDED_COMPONENTS
+    _NER_MODEL = spacy.load(NER_MODEL_NAME, exclude=NER_EXCLUDED_COMPONENTS)
+
+def get_embedding_model():
+    """Returns the CLIP EmbeddingBackend (EMBEDDING_BACKEND), loading it on first call. Returns None if it could not be loaded."""
+    if _EMBEDDING_MODEL is None:
+        _load_model("embedding", _EMBEDDING_LOCK, _load_embedding_model)
+    return _EMBEDDING_MODEL
+
+def get_ner_model():
+    """Returns the spaCy NER pipeline, loading it on first call. Returns None if it could not be loaded."""
+    if _NER_MODEL is None:
+        _load_model("ner", _NER_LOCK, _load_ner_model)
+    return _NER_MODEL
+
+def warm_up_models(background: bool = True) -> threading.Thread | None:
+    """Loads both models now, in a daemon thread if `background` (returned so callers can join it)."""
+    def warm_up():
+        get_ner_model()
+        get_embedding_model()
+
+    if not background:
+        warm_up()
         return None
+    thread = threading.Thread(target=warm_up, name="model-warm-up", daemon=True)
+    thread.start()
+    return thread
 
-def analyze_pdf(file_path: str, user_caption: str = None) -> list[dict]:
+def use_models(embedding_model=None, ner_model=None):
+    """
+    Installs ready-made models instead of loading the configured ones, e.g. the deterministic stubs used by
+    the offline benchmarks. `embedding_model` is an EmbeddingBackend; `ner_model` needs spaCy's `pipe()`.
+    """
+    global _EMBEDDING_MODEL, _NER_MODEL
+    for kind, lock, model in (("embedding", _EMBEDDING_LOCK, embedding_model), ("ner", _NER_LOCK, ner_model)):
+        if model is None:
+            continue
+        with lock:
+            if kind == "embedding":
+                _EMBEDDING_MODEL = model
+            else:
+                _NER_MODEL = model
+            _MODEL_STATUS[kind].update(state="ready", error=None, load_seconds=0.0)
 
-    if not EMBEDDING_MODEL or not NER_MODEL:
-        print("Models are not loaded. Cannot perform analysis.")
-        return []
+def get_model_status() -> dict:
+    """Returns the load state ('not_loaded', 'loading', 'ready' or 'failed') of each model."""
+    return {kind: dict(status) for kind, status in _MODEL_STATUS.items()}
+
+def init_extraction_worker():
+    """ProcessPoolExecutor initializer: loads the NER model once per extraction worker process."""
+    get_ner_model()
+
+
+# --- 2. OCR BACKENDS ---
+
+class OCRBackend:
+    """Interface for OCR engines: turn a PIL image into its text."""
+    name = "base"
+
+    def image_to_string(self, pil_image: Image.Image) -> str:
+        raise NotImplementedError
+
+class PytesseractOCR(OCRBackend):
+    """Runs the tesseract CLI through pytesseract. Every call forks a process and reloads language data."""
+    name = "pytesseract"
+
+    def image_to_string(self, pil_image: Image.Image) -> str:
+        return pytesseract.image_to_string(pil_image, lang=TESSERACT_LANGUAGE)
+
+class TesserocrOCR(OCRBackend):
+    """Keeps one tesseract engine resident in-process (via tesserocr), so language data is loaded only once."""
+    name = "tesserocr"
+
+    def __init__(self):
+        import tesserocr  # Optional dependency, only needed for this backend
+        if TESSDATA_PATH:
+            self._api = tesserocr.PyTessBaseAPI(path=TESSDATA_PATH, lang=TESSERACT_LANGUAGE)
+        else:
+            self._api = tesserocr.PyTessBaseAPI(lang=TESSERACT_LANGUAGE)
+
+    def image_to_string(self, pil_image: Image.Image) -> str:
+        self._api.SetImage(pil_image)
+        return self._api.GetUTF8Text()
+
+    def close(self):
+        self._api.End()
+
+OCR_BACKENDS = {
+    PytesseractOCR.name: PytesseractOCR,
+    TesserocrOCR.name: TesserocrOCR,
+}
+
+# Engines are not thread-safe, so each worker thread (and therefore each process) keeps its own.
+_OCR_THREAD_STATE = threading.local()
+
+def get_ocr_backend(name: str = None) -> OCRBackend:
+    """Returns this thread's OCR backend (OCR_BACKEND by default), creating it on first use."""
+    name = name or OCR_BACKEND
+    backends = getattr(_OCR_THREAD_STATE, "backends", None)
+    if backends is None:
+        backends = _OCR_THREAD_STATE.backends = {}
+
+    if name not in backends:
+        try:
+            backends[name] = OCR_BACKENDS[name]()
+        except Exception as e:
+            print(f"Could not start OCR backend '{name}' ({e}). Falling back to pytesseract.")
+            backends[name] = PytesseractOCR()
+    return backends[name]
+
+
+# --- 3. EMBEDDING BACKENDS ---
+
+class EmbeddingBackend:
+    """Interface for CLIP encoders: images or texts in, one L2-normalized vector (row) per input out."""
+    name = "base"
+
+    def encode_images(self, images: list) -> np.ndarray:
+        raise NotImplementedError
+
+    def encode_texts(self, texts: list[str]) -> np.ndarray:
+        raise NotImplementedError
+
+class SentenceTransformerEmbedding(EmbeddingBackend):
+    """The fp32 PyTorch CLIP model through sentence-transformers, on CUDA when available."""
+    name = "sentence_transformers"
+
+    def __init__(self):
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        print(f"Loading embedding model on {self.device}...")
+        self.model = SentenceTransformer(EMBEDDING_MODEL_NAME, device=self.device)
+
+    def _encode(self, inputs: list) -> np.ndarray:
+        return np.atleast_2d(self.model.encode(inputs, batch_size=EMBEDDING_BATCH_SIZE, normalize_embeddings=True, show_progress_bar=False))
+
+    def encode_images(self, images: list) -> np.ndarray:
+        return self._encode(images)
+
+    def encode_texts(self, texts: list[str]) -> np.ndarray:
+        return self._encode(texts)
+
+class OnnxClipEmbedding(EmbeddingBackend):
+    """
+    The CLIP vision and text towers in ONNX Runtime with dynamically quantized int8 weights, for CPU-only hosts.
+    The towers are exported and quantized once into ONNX_MODEL_DIR (see export_onnx_clip); after that,
+    loading needs only onnxruntime and the CLIP processor, not PyTorch.
+    """
+    name = "onnx_int8"
+    VISION_FILE = "clip_vision_int8.onnx"
+    TEXT_FILE = "clip_text_int8.onnx"
+
+    def __init__(self, model_dir: str = None):
+        import onnxruntime as ort
+        from transformers import CLIPProcessor
+
+        model_dir = model_dir or ONNX_MODEL_DIR
+        vision_path = os.path.join(model_dir, self.VISION_FILE)
+        text_path = os.path.join(model_dir, self.TEXT_FILE)
+        if not (os.path.exists(vision_path) and os.path.exists(text_path)):
+            export_onnx_clip(model_dir)
+
+        options = ort.SessionOptions()
+        if ONNX_NUM_THREADS:
+            options.intra_op_num_threads = ONNX_NUM_THREADS
+        self.vision = ort.InferenceSession(vision_path, options, providers=["CPUExecutionProvider"])
+        self.text = ort.InferenceSession(text_path, options, providers=["CPUExecutionProvider"])
+        self.processor = CLIPProcessor.from_pretrained(model_dir)
+
+    def encode_images(self, images: list) -> np.ndarray:
+        vectors = []
+        for start in range(0, len(images), EMBEDDING_BATCH_SIZE):
+            pixel_values = self.processor.image_processor(images[start:start + EMBEDDING_BATCH_SIZE], return_tensors="np")["pixel_values"]
+            vectors.append(self.vision.run(None, {"pixel_values": pixel_values.astype(np.float32)})[0])
+        return _normalize_rows(np.concatenate(vectors))
+
+    def encode_texts(self, texts: list[str]) -> np.ndarray:
+        vectors = []
+        for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+            # Same tokenization as sentence-transformers: pad to the batch, truncate to CLIP's 77 tokens
+            tokens = self.processor.tokenizer(texts[start:start + EMBEDDING_BATCH_SIZE], padding=True, truncation=True, return_tensors="np")
+            vectors.append(self.text.run(None, {
+                "input_ids": tokens["input_ids"].astype(np.int64),
+                "attention_mask": tokens["attention_mask"].astype(np.int64),
+            })[0])
+        return _normalize_rows(np.concatenate(vectors))
+
+EMBEDDING_BACKENDS = {
+    SentenceTransformerEmbedding.name: SentenceTransformerEmbedding,
+    OnnxClipEmbedding.name: OnnxClipEmbedding,
+}
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def export_onnx_clip(model_dir: str = None, clip_model=None, processor=None):
+    """
+    Exports the CLIP vision and text towers to ONNX and quantizes their weights to int8 (dynamic quantization
+    of the MatMuls). Uses the sentence-transformers model unless a transformers CLIPModel and processor are given.
+    Needs torch, transformers and onnxruntime; writes the two models and the processor files to `model_dir`.
+    """
+    import tempfile
+    import torch
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    model_dir = model_dir or ONNX_MODEL_DIR
+    if clip_model is None:
+        from sentence_transformers import SentenceTransformer
+        clip_module = SentenceTransformer(EMBEDDING_MODEL_NAME, device="cpu")[0]
+        clip_model, processor = clip_module.model, clip_module.processor
+    clip_model = clip_model.eval()
+    print(f"Exporting CLIP to ONNX (int8) in {model_dir}...")
+
+    def _projected(features):
+        # Newer transformers return a model output with the projected embedding as pooler_output
+        return getattr(features, "pooler_output", features)
+
+    class VisionTower(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.clip = clip_model
+
+        def forward(self, pixel_values):
+            return _projected(self.clip.get_image_features(pixel_values=pixel_values))
+
+    class TextTower(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.clip = clip_model
+
+        def forward(self, input_ids, attention_mask):
+            return _projected(self.clip.get_text_features(input_ids=input_ids, attention_mask=attention_mask))
+
+    image_size = clip_model.config.vision_config.image_size
+    sample_pixels = torch.zeros(1, 3, image_size, image_size)
+    sample_tokens = processor.tokenizer(["a photo"], padding=True, return_tensors="pt")
+
+    os.makedirs(model_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory() as tmp_dir, torch.no_grad():
+        vision_fp32 = os.path.join(tmp_dir, "vision.onnx")
+        text_fp32 = os.path.join(tmp_dir, "text.onnx")
+        torch.onnx.export(
+            VisionTower(), (sample_pixels,), vision_fp32, dynamo=False, opset_version=17,
+            input_names=["pixel_values"], output_names=["embeddings"],
+            dynamic_axes={"pixel_values": {0: "batch"}, "embeddings": {0: "batch"}}
+        )
+        torch.onnx.export(
+            TextTower(), (sample_tokens["input_ids"], sample_tokens["attention_mask"]), text_fp32, dynamo=False, opset_version=17,
+            input_names=["input_ids", "attention_mask"], output_names=["embeddings"],
+            dynamic_axes={"input_ids": {0: "batch", 1: "tokens"}, "attention_mask": {0: "batch", 1: "tokens"}, "embeddings": {0: "batch"}}
+        )
+        # Only MatMul weights are quantized: ConvInteger (the patch embedding) is slower than fp32 Conv on most CPUs.
+        for fp32_path, int8_name in ((vision_fp32, OnnxClipEmbedding.VISION_FILE), (text_fp32, OnnxClipEmbedding.TEXT_FILE)):
+            quantize_dynamic(fp32_path, os.path.join(model_dir, int8_name), weight_type=QuantType.QInt8, op_types_to_quantize=["MatMul"])
+
+    processor.save_pretrained(model_dir)
+    print("CLIP exported to ONNX.")
 
+
+def load_image(file_path: str) -> Image.Image:
+    """Decodes an image file from disk into an RGB PIL image."""
+    image_cv = cv2.imread(file_path)
+    image_rgb = cv2.cvtColor(image_cv, cv2.COLOR_BGR2RGB)
+    return Image.fromarray(image_rgb)
+
+def shrink_for_embedding(pil_image: Image.Image) -> Image.Image:
+    """Downscales an image to EMBEDDING_IMAGE_SHORT_SIDE on its shortest side (smaller images are returned as is)."""
+    scale = EMBEDDING_IMAGE_SHORT_SIDE / min(pil_image.size)
+    if scale >= 1:
+        return pil_image
+    size = (max(1, round(pil_image.width * scale)), max(1, round(pil_image.height * scale)))
+    return pil_image.resize(size, Image.BICUBIC, reducing_gap=2.0)
+
+def _split_long_text(text: str, max_chars: int = NER_MAX_CHARS) -> list[str]:
+    """Splits text longer than max_chars into chunks, cutting at the last whitespace before each limit."""
+    chunks = []
+    while len(text) > max_chars:
+        cut = max(text.rfind(" ", 0, max_chars), text.rfind("\n", 0, max_chars))
+        cut = cut if cut > 0 else max_chars  # No whitespace at all: hard cut
+        chunks.append(text[:cut])
+        text = text[cut:]
+    chunks.append(text)
+    return chunks
+
+def extract_tags_batch(texts: list[str]) -> list[list[str]]:
+    """
+    Runs NER over many texts through nlp.pipe (NER_BATCH_SIZE, NER_N_PROCESS) and returns the
+    unique entity strings of each text. Texts over NER_MAX_CHARS are tagged chunk by chunk.
+    """
+    pieces, owners = [], []
+    for index, text in enumerate(texts):
+        for piece in _split_long_text(text):
+            pieces.append(piece)
+            owners.append(index)
+
+    tags = [set() for _ in texts]
+    with _NER_SECONDS.time():
+        docs = get_ner_model().pipe(pieces, batch_size=NER_BATCH_SIZE, n_process=NER_N_PROCESS)
+        for index, doc in zip(owners, docs):
+            tags[index].update(ent.text for ent in doc.ents)
+    return [list(text_tags) for text_tags in tags]
+
+def extract_tags(text: str) -> list[str]:
+    """Runs NER over the text and returns the unique entity strings."""
+    return extract_tags_batch([text])[0]
+
+def _tag_texts(texts: list[str]) -> list[list[str]]:
+    """
+    extract_tags_batch for a batch of files: if the batch fails, each text is tagged on its own,
+    so only a text NER fails on ends up with no tags instead of the whole batch losing them.
+    """
     try:
-        doc = fitz.open(file_path)
-        results = []
-        print(f"\nAnalyzing PDF: {os.path.basename(file_path)} ({doc.page_count} pages)...")
+        return extract_tags_batch(texts)
+    except Exception as e:
+        metrics.ERRORS.labels("ner").inc()
+        print(f"NER failed for a batch of {len(texts)} texts, tagging them one at a time: {e}")
+
+    tags = []
+    for text in texts:
+        try:
+            tags.append(extract_tags(text))
+        except Exception as e:
+            metrics.ERRORS.labels("ner").inc()
+            print(f"NER failed for one text, leaving it untagged: {e}")
+            tags.append([])
+    return tags
+
+def fuse_embeddings(image_embeddings: np.ndarray, text_embeddings: np.ndarray) -> np.ndarray:
+    """Combines rows of image and text embeddings (text weighted slightly higher) into unit vectors."""
+    combined_embeddings = (image_embeddings + text_embeddings * 1.2) / 2
+    norms = np.linalg.norm(combined_embeddings, axis=1, keepdims=True)
+    return combined_embeddings / norms
+
+def embed_batch(images: list, texts: list[str]) -> np.ndarray:
+    """Encodes a batch of images and their texts and returns one fused vector per pair."""
+    embedding_model = get_embedding_model()
+    with _CLIP_IMAGE_SECONDS.time():
+        image_embeddings = embedding_model.encode_images(images)
+    with _CLIP_TEXT_SECONDS.time():
+        text_embeddings = embedding_model.encode_texts(texts)
+    return fuse_embeddings(image_embeddings, text_embeddings)
+
+
+# --- 4. EXTRACTION STAGE (decode, OCR, NER) ---
+# These functions never touch the embedding model, so they can run in a process pool.
 
-        for page_num in range(doc.page_count):
-            page = doc.load_page(page_num)
-            
-            # Extract Text from Page 
+def extract_image_text(file_path: str, keep_image: bool = False, with_tags: bool = True) -> dict:
+    """
+    Decodes an image and extracts its OCR text and NER tags.
+    With keep_image=True the decoded image is included (shrunk, see shrink_for_embedding), so the embedding
+    stage never decodes the file again, whether it runs in this process or gets the result from a worker.
+    With with_tags=False NER is skipped ("tags" is empty), for callers that tag many images in one batch.
+    """
+    if with_tags and not get_ner_model():
+        raise RuntimeError("NER model is not loaded.")
+
+    print(f"\nAnalyzing image: {os.path.basename(file_path)}...")
+    with _DECODE_SECONDS.time():
+        pil_image = load_image(file_path)
+    with _OCR_SECONDS.time():
+        ocr_text = get_ocr_backend().image_to_string(pil_image)
+    metrics.IMAGES.inc()
+    metrics.BYTES.inc(os.path.getsize(file_path))
+
+    content = {"file_path": file_path, "ocr_text": ocr_text, "tags": extract_tags(ocr_text) if with_tags else []}
+    if keep_image:
+        content["image"] = shrink_for_embedding(pil_image)
+    return content
+
+def page_fingerprint(page: fitz.Page, page_text: str = None) -> str:
+    """
+    Fingerprints a PDF page from its text, its content stream and its annotations, so replacing
+    a page or annotating it changes the fingerprint while untouched pages keep theirs.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update((page_text if page_text is not None else page.get_text()).encode("utf-8", "surrogatepass"))
+    digest.update(page.read_contents())
+    for annot in page.annots():
+        digest.update(page.parent.xref_object(annot.xref).encode("utf-8", "surrogatepass"))
+    return digest.hexdigest()
+
+def pdf_page_fingerprints(file_path: str) -> list[str]:
+    """Returns the fingerprint of every page of a PDF, in page order."""
+    with fitz.open(file_path) as doc:
+        return [page_fingerprint(doc.load_page(page_num)) for page_num in range(doc.page_count)]
+
+def extract_pdf_text(file_path: str, page_nums: list[int] = None) -> list[dict]:
+    """
+    Extracts the text, NER tags and fingerprint of the pages of a PDF (all pages, or only the
+    1-based `page_nums`). Returns one dict per page.
+    """
+    if not get_ner_model():
+        raise RuntimeError("NER model is not loaded.")
+
+    pages = []
+    with _PDF_TEXT_SECONDS.time(), fitz.open(file_path) as doc:
+        print(f"\nAnalyzing PDF: {os.path.basename(file_path)} ({doc.page_count} pages)...")
+        for page_num in (range(1, doc.page_count + 1) if page_nums is None else page_nums):
+            page = doc.load_page(page_num - 1)
             ocr_text = page.get_text()
-            
-            # NER Tag Extraction from Page Text 
-            doc_ner = NER_MODEL(ocr_text)
-            tags = list(set([ent.text for ent in doc_ner.ents]))
-            
-            # Unified Multimodal Embedding for the Page
-            pix = page.get_pixmap()
-            pil_image = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-            
-            image_embedding = EMBEDDING_MODEL.encode(pil_image, normalize_embeddings=True, show_progress_bar=False)
-            
-            text_to_embed = f"{user_caption or ''} {ocr_text}"
-            text_embedding = EMBEDDING_MODEL.encode(text_to_embed, normalize_embeddings=True, show_progress_bar=False)
-            
-            # Combine the embeddings with a slight weight towards text
-            combined_embedding = np.mean([image_embedding, text_embedding * 1.2], axis=0)
-            
-            # Re-normalize the final combined vector
-            norm = np.linalg.norm(combined_embedding)
-            normalized_combined_embedding = combined_embedding / norm
-            
-            # Append Page Data
-            page_id = f"{file_path}_page_{page_num + 1}"
-            results.append({
-                "file_path": page_id, 
-                "original_pdf_path": file_path,
-                "page_num": page_num + 1,
+            pages.append({
+                "page_num": page_num,
                 "ocr_text": ocr_text,
-                "tags": tags,
-                "user_caption": user_caption or "",
-                "vector": normalized_combined_embedding.tolist()
+                "page_fingerprint": page_fingerprint(page, ocr_text)
             })
-            print(f"  - Analyzed page {page_num + 1}/{doc.page_count}")
-        
-        doc.close()
+    metrics.PAGES.inc(len(pages))
+    metrics.BYTES.inc(os.path.getsize(file_path))
+
+    # NER for every page in one batched pass
+    for page_data, tags in zip(pages, _tag_texts([page_data["ocr_text"] for page_data in pages])):
+        page_data["tags"] = tags
+    return pages
+
+
+# --- 5. EMBEDDING STAGE (CLIP) ---
+
+def embed_images(extracted: list[dict], user_captions: list[str | None] = None) -> list[dict | None]:
+    """
+    Embedding stage for images produced by extract_image_text. The CLIP image and text encodings
+    run as one batch. Returns one result per input, with None for any image that could not be embedded.
+    """
+    results = [None] * len(extracted)
+    if not get_embedding_model():
+        print("Embedding model is not loaded. Cannot perform analysis.")
+        return results
+
+    user_captions = user_captions or [None] * len(extracted)
+    loaded = []  # (index, pil_image) for every image that decoded cleanly
+
+    for index, content in enumerate(extracted):
+        try:
+            loaded.append((index, content.get("image") or load_image(content["file_path"])))
+        except Exception as e:
+            metrics.ERRORS.labels("decode").inc()
+            print(f"An unexpected error occurred during image analysis for {content['file_path']}: {e}")
+
+    if not loaded:
         return results
 
+    # --- Unified Multimodal Embedding for the whole batch ---
+    try:
+        texts_to_embed = [f"{user_captions[index] or ''} {extracted[index]['ocr_text']}" for index, _ in loaded]
+        vectors = embed_batch([pil_image for _, pil_image in loaded], texts_to_embed)
+    except Exception as e:
+        metrics.ERRORS.labels("embed").inc()
+        print(f"An unexpected error occurred while embedding a batch of {len(loaded)} images: {e}")
+        return results
+
+    for (index, _), vector in zip(loaded, vectors):
+        content = extracted[index]
+        results[index] = {
+            "file_path": content["file_path"],
+            "ocr_text": content["ocr_text"], # The full text from the image
+            "tags": content["tags"],
+            "user_caption": user_captions[index] or "",
+            "vector": vector.tolist()
+        }
+    return results
+
+def embed_pdf(file_path: str, pages: list[dict], user_caption: str = None) -> list[dict]:
+    """Embedding stage for PDF pages produced by extract_pdf_text. Pages are rendered and encoded in chunks."""
+    if not get_embedding_model():
+        print("Embedding model is not loaded. Cannot perform analysis.")
+        return []
+
+    results = []
+    with fitz.open(file_path) as doc:
+        # Pages are rendered in chunks so memory stays bounded, and each chunk is embedded in batches.
+        for chunk_start in range(0, len(pages), PDF_PAGE_CHUNK_SIZE):
+            chunk = pages[chunk_start:chunk_start + PDF_PAGE_CHUNK_SIZE]
+
+            page_images = []
+            with _PDF_RENDER_SECONDS.time():
+                for page_data in chunk:
+                    pix = doc.load_page(page_data["page_num"] - 1).get_pixmap()
+                    page_images.append(Image.frombytes("RGB", [pix.width, pix.height], pix.samples))
+
+            # Unified Multimodal Embedding for the whole chunk
+            texts_to_embed = [f"{user_caption or ''} {page_data['ocr_text']}" for page_data in chunk]
+            page_vectors = embed_batch(page_images, texts_to_embed)
+
+            # Append Page Data
+            for page_data, vector in zip(chunk, page_vectors):
+                results.append({
+                    "file_path": f"{file_path}_page_{page_data['page_num']}",
+                    "original_pdf_path": file_path,
+                    "page_num": page_data["page_num"],
+                    "ocr_text": page_data["ocr_text"],
+                    "tags": page_data["tags"],
+                    "user_caption": user_caption or "",
+                    "page_fingerprint": page_data.get("page_fingerprint", ""),
+                    "vector": vector.tolist()
+                })
+            print(f"  - Analyzed pages {chunk[0]['page_num']}-{chunk[-1]['page_num']} ({len(results)}/{len(pages)})")
+    return results
+
+
+# --- 6. IN-PROCESS ANALYSIS (both stages in the calling thread) ---
+
+def analyze_images(file_paths: list[str], user_captions: list[str | None] = None) -> list[dict | None]:
+    """
+    Analyzes several images together so the CLIP image and text encodings run as batches.
+    Returns one result per input path, with None for any image that could not be analyzed.
+    """
+    if not get_embedding_model() or not get_ner_model():
+        print("Models are not loaded. Cannot perform analysis.")
+        return [None] * len(file_paths)
+
+    user_captions = user_captions or [None] * len(file_paths)
+    extracted, extracted_indexes = [], []
+    with metrics.ANALYSIS_SECONDS.labels("image").time():
+        for index, file_path in enumerate(file_paths):
+            try:
+                extracted.append(extract_image_text(file_path, keep_image=True, with_tags=False))
+                extracted_indexes.append(index)
+            except Exception as e:
+                metrics.ERRORS.labels("extract").inc()
+                print(f"An unexpected error occurred during image analysis for {file_path}: {e}")
+
+        # NER for the whole batch in one pass
+        for content, tags in zip(extracted, _tag_texts([content["ocr_text"] for content in extracted])):
+            content["tags"] = tags
+
+        results = [None] * len(file_paths)
+        embedded = embed_images(extracted, [user_captions[index] for index in extracted_indexes])
+    for index, analysis_data in zip(extracted_indexes, embedded):
+        results[index] = analysis_data
+    return results
+
+def analyze_image(file_path: str, user_caption: str = None) -> dict | None:
+    """Analyzes a single image. See analyze_images for the batched version."""
+    return analyze_images([file_path], [user_caption])[0]
+
+def analyze_pdf(file_path: str, user_caption: str = None, page_nums: list[int] = None) -> list[dict]:
+    """Analyzes every page of a PDF, or only the 1-based `page_nums` when re-indexing changed pages."""
+    if not get_embedding_model() or not get_ner_model():
+        print("Models are not loaded. Cannot perform analysis.")
+        return []
+
+    try:
+        with metrics.ANALYSIS_SECONDS.labels("pdf").time():
+            return embed_pdf(file_path, extract_pdf_text(file_path, page_nums), user_caption)
     except Exception as e:
+        metrics.ERRORS.labels("analyze_pdf").inc()
         print(f"Error analyzing PDF {file_path}: {e}")
         return []
 
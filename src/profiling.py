@@ -0,0 +1,365 @@
+# src/profiling.py
+
+# On-demand profiling of ingested files and API requests, for the file that takes minutes once and never again.
+# Armed from config (PROFILE_NEXT_FILES / PROFILE_NEXT_REQUESTS) or at runtime through /admin/profiling, it profiles
+# the next N files or requests and writes one dump per file/request stage to PROFILING_DIR:
+#   <name>.pstats     cProfile stats (cprofile mode), for pstats / snakeviz
+#   <name>.collapsed  "frame;frame;frame weight" lines, for flamegraph.pl or speedscope
+# With a threshold, profiles of anything faster than it are thrown away. A queued file is profiled in two stages
+# (extraction in a worker process, embedding in this one), so its stage dumps are written first and the threshold
+# is then applied to the file's total (see keep_if_slow).
+# Only one profile runs at a time per process; files and requests arriving meanwhile run unprofiled.
+
+import cProfile
+import itertools
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from src.config import (
+    PROFILING_MODE, PROFILE_NEXT_FILES, PROFILE_NEXT_REQUESTS, PROFILING_THRESHOLD_SECONDS,
+    PROFILING_SAMPLE_INTERVAL_SECONDS, PROFILING_ENDPOINTS, PROFILING_DIR
+)
+
+MAX_STACK_DEPTH = 128  # Deeper stacks are cut off in the collapsed output
+MIN_COLLAPSED_SHARE = 1e-4  # cprofile mode leaves out call paths under this fraction of the total time
+RECENT_DUMPS_LISTED = 20
+
+_STATE_LOCK = threading.Lock()
+_SESSION_LOCK = threading.Lock()  # Held while a profile is running in this process
+_DUMP_NUMBERS = itertools.count(1)
+_STATE = {
+    "mode": PROFILING_MODE,
+    "files": PROFILE_NEXT_FILES,        # Remaining budget; -1 means no limit
+    "requests": PROFILE_NEXT_REQUESTS,
+    "threshold_seconds": PROFILING_THRESHOLD_SECONDS,
+    "output_dir": PROFILING_DIR,
+}
+
+
+# --- Profilers ---
+
+def _frame_label(name: str, filename: str, lineno: int) -> str:
+    if filename == "~":  # Built-in functions in pstats keys
+        return name
+    return f"{name} ({os.path.basename(filename)}:{lineno})"
+
+
+class Profiler:
+    """Interface for the profilers below: start(), stop(), then write() the dumps."""
+    name = ""
+
+    def start(self):
+        raise NotImplementedError
+
+    def stop(self):
+        raise NotImplementedError
+
+    def write(self, base_path: str) -> list[str]:
+        """Writes the dump files for `base_path` (a path without extension). Returns their paths."""
+        raise NotImplementedError
+
+
+class DeterministicProfiler(Profiler):
+    """cProfile: every call in the profiled thread, exact counts, noticeable overhead on Python-heavy code."""
+    name = "cprofile"
+
+    def __init__(self, interval: float = None, all_threads: bool = False):
+        self._profile = cProfile.Profile()
+
+    def start(self):
+        self._profile.enable()
+
+    def stop(self):
+        self._profile.disable()
+
+    def write(self, base_path: str) -> list[str]:
+        self._profile.dump_stats(base_path + ".pstats")
+        stacks = _collapse_stats(pstats.Stats(self._profile).stats)
+        _write_collapsed(base_path + ".collapsed", stacks)
+        return [base_path + ".pstats", base_path + ".collapsed"]
+
+
+def _collapse_stats(stats: dict) -> dict[str, int]:
+    """
+    Approximates collapsed stacks (weights in microseconds) from cProfile's caller/callee graph.
+    cProfile keeps no full stacks, so a function's time is split between its callers in proportion to
+    the time each caller spent in it. Paths below MIN_COLLAPSED_SHARE of the total are left out.
+    """
+    callees = defaultdict(dict)
+    for function, (_, _, _, _, callers) in stats.items():
+        for caller, (_, _, _, caller_cumulative) in callers.items():
+            callees[caller][function] = caller_cumulative
+
+    stacks = defaultdict(int)
+    # Roots are the functions called straight from the code that started the profile
+    roots = [function for function, (_, _, _, _, callers) in stats.items() if not callers]
+    min_seconds = MIN_COLLAPSED_SHARE * sum(stats[function][3] for function in roots)
+
+    def walk(function, path: tuple, on_path: frozenset, share: float):
+        _, _, own_time, cumulative, _ = stats[function]
+        path = path + (_frame_label(function[2], function[0], function[1]),)
+        own_us = int(own_time * share * 1e6)
+        if own_us:
+            stacks[";".join(path)] += own_us
+        if len(path) >= MAX_STACK_DEPTH:
+            return
+        for callee, edge_cumulative in callees[function].items():
+            callee_cumulative = stats[callee][3]
+            if callee in on_path or callee_cumulative <= 0:
+                continue  # Recursion is folded into the first call
+            callee_share = min(1.0, edge_cumulative * share / callee_cumulative)
+            if callee_cumulative * callee_share >= min_seconds:
+                walk(callee, path, on_path | {callee}, callee_share)
+
+    for function in roots:
+        walk(function, (), frozenset([function]), 1.0)
+    return stacks
+
+
+class SamplingProfiler(Profiler):
+    """
+    Samples the stack every `interval` seconds from a background thread. Low overhead, wall-clock weights, and
+    it can see every thread (each stack is rooted at its thread name), so work handed to thread pools shows up.
+    """
+    name = "sampling"
+
+    def __init__(self, interval: float = PROFILING_SAMPLE_INTERVAL_SECONDS, all_threads: bool = False):
+        self._interval = interval or PROFILING_SAMPLE_INTERVAL_SECONDS
+        self._thread_id = None if all_threads else threading.get_ident()
+        self._stop = threading.Event()
+        self._sampler = None
+        self.samples = defaultdict(int)
+
+    def start(self):
+        self._sampler = threading.Thread(target=self._run, name="profiling-sampler", daemon=True)
+        self._sampler.start()
+
+    def stop(self):
+        self._stop.set()
+        self._sampler.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self._interval):
+            thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or (self._thread_id is not None and thread_id != self._thread_id):
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    code = frame.f_code
+                    stack.append(_frame_label(code.co_name, code.co_filename, code.co_firstlineno))
+                    frame = frame.f_back
+                if self._thread_id is None:
+                    stack.append(thread_names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def write(self, base_path: str) -> list[str]:
+        _write_collapsed(base_path + ".collapsed", self.samples)
+        return [base_path + ".collapsed"]
+
+
+PROFILERS = {
+    DeterministicProfiler.name: DeterministicProfiler,
+    SamplingProfiler.name: SamplingProfiler,
+}
+
+
+def _write_collapsed(path: str, stacks: dict[str, int]):
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, weight in sorted(stacks.items()):
+            f.write(f"{stack} {weight}\n")
+
+
+# --- Sessions ---
+
+def configure(mode: str = None, files: int = None, requests: int = None, threshold_seconds: float = None,
+              output_dir: str = None) -> dict:
+    """
+    Changes the profiling settings; arguments left as None are unchanged. `files` and `requests` are how many
+    of the next files and requests to profile (0 stops, -1 profiles all until stopped). Returns the new status().
+    """
+    if mode is not None and mode not in PROFILERS:
+        raise ValueError(f"Unknown profiling mode '{mode}'. Available: {', '.join(PROFILERS)}")
+    with _STATE_LOCK:
+        for key, value in (("mode", mode), ("files", files), ("requests", requests),
+                           ("threshold_seconds", threshold_seconds), ("output_dir", output_dir)):
+            if value is not None:
+                _STATE[key] = value
+    return status()
+
+
+def status() -> dict:
+    """Current settings, remaining budgets and the most recent dumps in the output directory."""
+    with _STATE_LOCK:
+        state = dict(_STATE)
+    try:
+        dumps = [entry for entry in os.scandir(state["output_dir"]) if entry.is_file()]
+    except OSError:
+        dumps = []
+    dumps.sort(key=lambda entry: entry.stat().st_mtime, reverse=True)
+    return {
+        **state,
+        "endpoints": list(PROFILING_ENDPOINTS),
+        "active": _SESSION_LOCK.locked(),
+        "recent_dumps": [entry.name for entry in dumps[:RECENT_DUMPS_LISTED]],
+    }
+
+
+def is_armed(kind: str) -> bool:
+    """Whether the next file ("files") or request ("requests") would be profiled. Cheap enough for every call."""
+    return _STATE[kind] != 0
+
+
+def claim(kind: str) -> dict | None:
+    """
+    Takes one file ("files") or request ("requests") out of the budget. Returns the settings to profile it with
+    (picklable, so they can go to a worker process with the job), or None if profiling is off for that kind.
+    """
+    if not is_armed(kind):
+        return None
+    with _STATE_LOCK:
+        if _STATE[kind] == 0:
+            return None
+        if _STATE[kind] > 0:
+            _STATE[kind] -= 1
+        return {
+            "mode": _STATE["mode"],
+            "threshold_seconds": _STATE["threshold_seconds"],
+            "output_dir": _STATE["output_dir"],
+        }
+
+
+def _dump_name(label: str, seconds: float) -> str:
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    safe_label = re.sub(r"[^A-Za-z0-9._-]+", "_", label).strip("_")[:100]
+    return f"{stamp}_{os.getpid()}-{next(_DUMP_NUMBERS)}_{safe_label}_{seconds:.2f}s"
+
+
+@contextmanager
+def _profiled(settings: dict, label: str, all_threads: bool, stages: list = None):
+    profiler = PROFILERS[settings["mode"]](PROFILING_SAMPLE_INTERVAL_SECONDS, all_threads)
+    started = time.perf_counter()
+    profiler.start()
+    try:
+        yield
+    finally:
+        profiler.stop()
+        seconds = time.perf_counter() - started
+        if stages is not None or seconds >= (settings["threshold_seconds"] or 0):
+            try:
+                os.makedirs(settings["output_dir"], exist_ok=True)
+                paths = profiler.write(os.path.join(settings["output_dir"], _dump_name(label, seconds)))
+                print(f"Profiled {label} ({seconds:.2f}s): {', '.join(os.path.basename(path) for path in paths)}")
+            except Exception as e:
+                print(f"Could not write the profile of {label}: {e}")
+                paths = []
+            if stages is not None:
+                stages.append({"label": label, "seconds": seconds, "paths": paths})
+
+
+@contextmanager
+def session(settings: dict | None, label: str, all_threads: bool = False, stages: list = None):
+    """
+    Profiles the `with` block with settings from claim(), if any. `all_threads` (sampling mode only) also samples
+    the other threads of the process. Runs unprofiled if another profile is already running here.
+    With a `stages` list, the block is one stage of a larger unit: its dumps are written whatever the threshold
+    and noted in `stages` ({"label", "seconds", "paths"}), for keep_if_slow once the unit is done.
+    """
+    if settings is None or not _SESSION_LOCK.acquire(blocking=False):
+        yield
+        return
+    try:
+        with _profiled(settings, label, all_threads, stages):
+            yield
+    finally:
+        _SESSION_LOCK.release()
+
+
+@contextmanager
+def profile(kind: str, label: str, all_threads: bool = False):
+    """claim() and session() in one, for code that runs entirely in this process. Costs nothing when not armed."""
+    if not is_armed(kind) or not _SESSION_LOCK.acquire(blocking=False):
+        yield
+        return
+    try:
+        settings = claim(kind)
+        if settings is None:
+            yield
+        else:
+            with _profiled(settings, label, all_threads):
+                yield
+    finally:
+        _SESSION_LOCK.release()
+
+
+def call_profiled(settings: dict | None, label: str, function, *args, **kwargs):
+    """
+    Process-pool job wrapper: runs function(*args, **kwargs) as a stage session() with settings claimed by the
+    parent, and returns (result, stages) so the parent can apply the threshold with keep_if_slow. The stages
+    are returned with errors too, by attaching them to the exception.
+    """
+    stages = []
+    try:
+        with session(settings, label, stages=stages):
+            result = function(*args, **kwargs)
+    except Exception as e:
+        e.profile_stages = stages
+        raise
+    return result, stages
+
+
+def keep_if_slow(settings: dict | None, stages: list[dict], shared_seconds: float = 0.0) -> bool:
+    """
+    Applies the threshold to a unit profiled in stages: keeps the stage dumps if the stages, plus `shared_seconds`
+    of work profiled together with other units, took at least threshold_seconds in total. Otherwise the dumps
+    are deleted. Returns whether they were kept.
+    """
+    if not settings:
+        return False
+    seconds = shared_seconds + sum(stage["seconds"] for stage in stages)
+    if seconds >= (settings["threshold_seconds"] or 0):
+        return True
+    if stages:
+        print(f"Discarded the profile of {stages[0]['label']}: {seconds:.2f}s in total is under the threshold")
+    discard(stages)
+    return False
+
+
+def discard(stages: list[dict]):
+    """Deletes the dumps of profiled stages."""
+    for stage in stages:
+        for path in stage["paths"]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+# --- HTTP ---
+
+def is_profiled_path(path: str) -> bool:
+    return any(path == prefix or path.startswith(prefix.rstrip("/") + "/") for prefix in PROFILING_ENDPOINTS)
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling the next requests to PROFILING_ENDPOINTS. A request's profile covers the event loop
+    thread for as long as the request runs, so concurrent requests show up in it too; in sampling mode every
+    thread is sampled, which includes the search and database work done in thread pools.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not is_armed("requests") or not is_profiled_path(scope["path"]):
+            return await self.app(scope, receive, send)
+        with profile("requests", f"{scope['method']} {scope['path']}", all_threads=True):
+            await self.app(scope, receive, send)
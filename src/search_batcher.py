@@ -0,0 +1,80 @@
+# src/search_batcher.py
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+
+class SearchCoalescer:
+    """
+    Keeps query encoding and the ChromaDB query off the event loop.
+    Queries arriving within `window_seconds` of each other are coalesced into one call to
+    `search_many`, which encodes them in a single batch and runs on a bounded thread pool.
+    All methods except the batch itself run on the event loop thread, so no locking is needed.
+    """
+
+    def __init__(self, search_many, window_seconds: float, max_batch_size: int, max_workers: int):
+        self._search_many = search_many  # (query_texts, n_results) -> list of per-query result dicts
+        self.window_seconds = window_seconds
+        self.max_batch_size = max_batch_size
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="search")
+        self._pending = []  # (query_text, n_results, asyncio.Future)
+        self._in_flight = []  # Batches handed to the executor whose results haven't come back yet
+        self._flush_handle = None
+
+    async def search(self, query_text: str, n_results: int) -> dict:
+        """Queues a query for the next batch and waits for its results."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((query_text, n_results, future))
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.window_seconds, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        query_texts = [query_text for query_text, _, _ in batch]
+        n_results = max(n for _, n, _ in batch)
+        task = asyncio.get_running_loop().run_in_executor(self._executor, self._search_many, query_texts, n_results)
+        self._in_flight.append(batch)
+        task.add_done_callback(lambda done: self._resolve(batch, done))
+
+    def _resolve(self, batch: list, done: asyncio.Future):
+        if batch in self._in_flight:
+            self._in_flight.remove(batch)
+        # The executor cancels queued batches on shutdown; done.exception() would raise CancelledError then
+        error = None if done.cancelled() else done.exception()
+        for index, (_, n_results, future) in enumerate(batch):
+            if future.done():  # The request was cancelled while waiting, or by shutdown()
+                continue
+            if done.cancelled():
+                future.cancel()
+                continue
+            if error is not None:
+                future.set_exception(error)
+                continue
+            # Every query ran with the batch's largest n_results; trim back to what was asked for.
+            result = done.result()[index]
+            future.set_result({key: [values[0][:n_results]] for key, values in result.items()})
+
+    def shutdown(self):
+        """Stops the executor and cancels every query still waiting, queued or in flight."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batches, self._pending = self._in_flight + [self._pending], []
+        self._in_flight = []
+        for batch in batches:
+            for _, _, future in batch:
+                if not future.done():
+                    future.cancel()
+        self._executor.shutdown(wait=False, cancel_futures=True)
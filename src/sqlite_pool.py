@@ -0,0 +1,86 @@
+# src/sqlite_pool.py
+
+# Shared SQLite access for the project's small databases (maps, side index, analysis cache, file manifest).
+# Each thread keeps one open connection per database file instead of reconnecting on every call,
+# and every connection is opened in WAL mode so readers never block behind a writer.
+
+import sqlite3
+import os
+import threading
+
+_LOCAL = threading.local()
+
+SQL_VARIABLE_CHUNK = 500  # Stay well below SQLite's limit on bound parameters per statement
+
+PRAGMAS = (
+    "PRAGMA journal_mode = WAL",     # Readers and a writer can work concurrently
+    "PRAGMA synchronous = NORMAL",   # Safe with WAL; skips an fsync on every commit
+    "PRAGMA busy_timeout = 5000",    # Wait for a competing writer instead of failing with 'database is locked'
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",    # ~16 MB page cache per connection
+)
+
+
+def get_connection(db_path: str) -> sqlite3.Connection:
+    """
+    Returns this thread's connection to `db_path`, opening and configuring it on first use.
+    Use it like sqlite3.connect(): `with get_connection(path) as conn:` commits on success and
+    rolls back on error, but leaves the connection open for the next call.
+    """
+    key = os.path.abspath(db_path)
+    connections = getattr(_LOCAL, "connections", None)
+    if connections is None:
+        connections = _LOCAL.connections = {}
+
+    conn = connections.get(key)
+    if conn is None:
+        conn = sqlite3.connect(key)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        connections[key] = conn
+    return conn
+
+
+def close_connections():
+    """Closes every connection opened by the calling thread."""
+    connections = getattr(_LOCAL, "connections", {})
+    for conn in connections.values():
+        conn.close()
+    connections.clear()
+
+
+def chunks(values: list, size: int = SQL_VARIABLE_CHUNK):
+    """Splits `values` into lists of at most `size`, for `IN (...)` queries with one parameter per value."""
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def prefix_range(directory: str) -> tuple[str, str]:
+    """
+    Returns (prefix, upper_bound) for matching paths anywhere below `directory` with `path >= ? AND path < ?`.
+    Every string starting with the prefix sorts in that range, so an index on the path column is used.
+    The prefix ends with a separator, so '/a/b' doesn't match '/a/bc'.
+    """
+    prefix = os.path.join(directory, "")
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def migrate(db_path: str, migrations: list):
+    """
+    Brings a database up to date. `migrations[i]` moves the schema from version i to i + 1: either a list
+    of SQL statements, or a function taking the connection for steps that need logic.
+    The current version is kept in PRAGMA user_version. Each step is one transaction.
+    """
+    with get_connection(db_path) as conn:
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+
+    for target_version in range(version + 1, len(migrations) + 1):
+        with get_connection(db_path) as conn:
+            conn.execute("BEGIN")
+            step = migrations[target_version - 1]
+            if callable(step):
+                step(conn)
+            else:
+                for statement in step:
+                    conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {target_version}")
@@ -17,8 +17,8 @@ def main():
     
     # Import and initialize the database manager to ensure it's ready
     try:
-        from src.database_manager import COLLECTION, CLIENT
-        if CLIENT is None or COLLECTION is None:
+        from src.database_manager import get_collection
+        if get_collection() is None:
             print("❌ Database initialization failed. Please check your ChromaDB setup.")
             return
         print("✅ Database initialized successfully")